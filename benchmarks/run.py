@@ -0,0 +1,243 @@
+import datetime
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import click
+
+from benchmarks.synthetic import SWISS_BOUNDS, generate_partition, generate_timetable
+from src.choropleth.distance_choropleth import create_choropleth
+from src.choropleth.geojson import Geojson
+from src.traversal.algorithm import COMPILED, TRIP_BASED, compute_isochrone, compute_map
+from src.traversal.priority_queue import PriorityQueue
+
+SCALES = {
+    "small": {"num_stops": 1000, "num_lines": 100, "partition": (40, 20), "queue_size": 5000},
+    "large": {"num_stops": 10000, "num_lines": 1000, "partition": (120, 60), "queue_size": 50000},
+}
+
+# a monday
+DATE = datetime.date(2024, 1, 15)
+
+# The project modules imported by the app before it renders the first page
+# (streamlit and folium themselves are not part of the benchmark)
+APP_IMPORTS = [
+    "src.traversal.algorithm",
+    "src.traversal.cache",
+    "src.traversal.store",
+    "src.traversal.stop_index",
+    "src.choropleth.distance_choropleth",
+    "src.choropleth.geojson",
+    "src.helpers.instrumentation",
+    "src.helpers.profiling",
+]
+
+
+def bench_priority_queue_add_pop(params):
+    rnd = random.Random(0)
+    costs = [rnd.randint(0, 86400) for _ in range(params["queue_size"])]
+
+    def run():
+        q = PriorityQueue(lambda x: -x)
+        for elem, cost in enumerate(costs):
+            q.add(elem, cost)
+        while q.size() > 0:
+            q.pop()
+    return run
+
+
+def bench_priority_queue_update(params):
+    rnd = random.Random(0)
+    costs = [rnd.randint(0, 86400) for _ in range(params["queue_size"])]
+    updates = [(rnd.randrange(len(costs)), rnd.randint(0, 86400)) for _ in range(params["queue_size"])]
+
+    def run():
+        q = PriorityQueue(lambda x: -x)
+        for elem, cost in enumerate(costs):
+            q.add(elem, cost)
+        for elem, cost in updates:
+            q.update(elem, cost)
+    return run
+
+
+def bench_compute_map(params):
+    timetable = params["timetable"]
+
+    def run():
+        stats = {}
+        compute_map("Stop 0", DATE, 9 * 3600, 5 * 3600, stats=stats, timetable=timetable)
+        return stats
+    return run
+
+
+def bench_compute_map_trip(params):
+    timetable = params["timetable"]
+
+    def run():
+        stats = {}
+        compute_map("Stop 0", DATE, 9 * 3600, 5 * 3600, stats=stats, timetable=timetable, engine=TRIP_BASED)
+        return stats
+    return run
+
+
+def bench_compute_map_compiled(params):
+    """The same as compute_map without numba."""
+    timetable = params["timetable"]
+
+    def run():
+        stats = {}
+        compute_map("Stop 0", DATE, 9 * 3600, 5 * 3600, stats=stats, timetable=timetable, engine=COMPILED)
+        return stats
+    return run
+
+
+def bench_compute_isochrone(params):
+    timetable = params["timetable"]
+
+    def run():
+        compute_isochrone("Stop 0", DATE, 8 * 3600, 30 * 60, timetable=timetable)
+    return run
+
+
+def bench_create_choropleth(params):
+    coord_to_departure = {
+        (lon, lat): random.Random(stop_id).randint(0, 1440)
+        for stop_id, _, lat, lon in params["timetable"].get_locations()
+    }
+    partition = params["partition"]
+
+    def run():
+        create_choropleth(coord_to_departure, partition)
+    return run
+
+
+def bench_geojson_lookup(params):
+    geojson = Geojson(params["partition"])
+    rnd = random.Random(0)
+    lon_min, lat_min, lon_max, lat_max = SWISS_BOUNDS
+    points = [(rnd.uniform(lat_min, lat_max), rnd.uniform(lon_min, lon_max)) for _ in range(200)]
+
+    def run():
+        for lat, lon in points:
+            geojson.get_feature_covering_lat_lon(lat, lon)
+    return run
+
+
+def bench_app_imports(params):
+    """Only the imports of APP_IMPORTS, not the time until streamlit renders the page."""
+    command = [sys.executable, "-c", "import " + ", ".join(APP_IMPORTS)]
+
+    def run():
+        # a fresh interpreter, so nothing is imported yet
+        subprocess.run(command, check=True)
+    return run
+
+
+BENCHMARKS = {
+    "priority_queue.add_pop": bench_priority_queue_add_pop,
+    "priority_queue.update": bench_priority_queue_update,
+    "traversal.compute_map": bench_compute_map,
+    "traversal.compute_map_trip": bench_compute_map_trip,
+    "traversal.compute_map_compiled": bench_compute_map_compiled,
+    "traversal.compute_isochrone": bench_compute_isochrone,
+    "choropleth.create_choropleth": bench_create_choropleth,
+    "choropleth.geojson_lookup": bench_geojson_lookup,
+    "startup.app_imports": bench_app_imports,
+}
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.group()
+def main():
+    """Benchmarks on a synthetic timetable and partition, no database needed."""
+
+
+@main.command()
+@click.option("--scale", default="small", type=click.Choice(list(SCALES)))
+@click.option("--repeat", default=5, help="Number of timed runs per benchmark.")
+@click.option("--filter", "name_filter", default="", help="Only run benchmarks whose name contains this.")
+@click.option("--output", default=None, help="Write the results as json to this file.")
+def run(scale, repeat, name_filter, output):
+    """Runs the benchmarks and prints/writes the timings."""
+    params = dict(SCALES[scale])
+    params["timetable"] = generate_timetable(num_stops=params["num_stops"], num_lines=params["num_lines"])
+    params["partition"] = generate_partition(*params["partition"])
+
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if name_filter not in name:
+            continue
+        benchmark = setup(params)
+        timings = []
+        counters = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            counters = benchmark()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+            "mean": statistics.mean(timings),
+            "repeat": repeat,
+        }
+        if counters is not None:
+            results[name]["counters"] = counters
+        print(f"{name:40s} median {results[name]['median'] * 1000:10.2f} ms   min {results[name]['min'] * 1000:10.2f} ms")
+
+    report = {
+        "meta": {
+            "commit": get_commit(),
+            "scale": scale,
+            "python": platform.python_version(),
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+    if output is not None:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4)
+
+
+@main.command()
+@click.argument("baseline_file")
+@click.argument("current_file")
+@click.option("--threshold", default=0.1, help="Relative slowdown of the median reported as regression.")
+def compare(baseline_file, current_file, threshold):
+    """Compares two result files written by `run --output`.
+    Exits with status 1 if any benchmark regressed by more than threshold."""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(current_file, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    print(f"baseline: {baseline['meta']['commit']} ({baseline['meta']['scale']}), current: {current['meta']['commit']} ({current['meta']['scale']})")
+
+    regressions = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:40s} {'new':>10s}")
+            continue
+        ratio = result["median"] / baseline["results"][name]["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "improvement"
+        print(f"{name:40s} {ratio:10.2f}x  {flag}")
+    if len(regressions) > 0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import datetime
+import numpy as np
+
+from src.traversal.timetable import ArrayTimetable
+
+# lon_min, lat_min, lon_max, lat_max of switzerland
+SWISS_BOUNDS = (5.96, 45.82, 10.49, 47.81)
+
+CALENDAR_PATTERNS = {
+    "daily": (1, 1, 1, 1, 1, 1, 1),
+    "weekdays": (1, 1, 1, 1, 1, 0, 0),
+    "saturday": (0, 0, 0, 0, 0, 1, 0),
+    "sunday": (0, 0, 0, 0, 0, 0, 1),
+}
+
+
+def generate_timetable(
+    num_stops=1000,
+    num_lines=100,
+    stops_per_line=15,
+    trips_per_line=60,
+    num_transfers=300,
+    year=2024,
+    bounds=SWISS_BOUNDS,
+    seed=0
+):
+    """Generates a GTFS-like ArrayTimetable.
+
+    Stops are scattered uniformly within bounds. Every line visits stops_per_line
+    random stops and runs trips_per_line trips per direction between 05:00 and 24:00,
+    each trip on one of the CALENDAR_PATTERNS for the whole year.
+    num_transfers random stop pairs are connected by walking transfers in both directions.
+    """
+    rnd = np.random.default_rng(seed)
+    lon_min, lat_min, lon_max, lat_max = bounds
+    lats = rnd.uniform(lat_min, lat_max, num_stops)
+    lons = rnd.uniform(lon_min, lon_max, num_stops)
+    stops = [(f"{idx}", f"Stop {idx}", float(lat), float(lon)) for idx, (lat, lon) in enumerate(zip(lats, lons))]
+
+    services = [
+        (name, weekdays, datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+        for name, weekdays in CALENDAR_PATTERNS.items()
+    ]
+
+    froms, tos, departures, arrivals, trips = [], [], [], [], []
+    trip_ids = []
+    trip_services = []
+    for line in range(num_lines):
+        line_stops = rnd.choice(num_stops, size=stops_per_line, replace=False)
+        running_times = rnd.integers(120, 600, size=stops_per_line - 1)
+        dwell_times = rnd.integers(0, 60, size=stops_per_line - 1)
+        service = rnd.integers(len(services))
+        for direction, path in enumerate([line_stops, line_stops[::-1]]):
+            path_running_times = running_times if direction == 0 else running_times[::-1]
+            for start in np.linspace(5 * 3600, 24 * 3600, trips_per_line, endpoint=False).astype(int):
+                trip = len(trip_ids)
+                trip_ids.append(f"line{line}.dir{direction}.{start}")
+                trip_services.append(service)
+                departure = start
+                for src, dst, running_time, dwell_time in zip(path, path[1:], path_running_times, dwell_times):
+                    froms.append(src)
+                    tos.append(dst)
+                    departures.append(departure)
+                    arrivals.append(departure + running_time)
+                    trips.append(trip)
+                    departure += running_time + dwell_time
+
+    order = np.argsort(departures, kind="stable")
+    connections = {
+        "from": np.array(froms, dtype=np.int32)[order],
+        "to": np.array(tos, dtype=np.int32)[order],
+        "departure": np.array(departures, dtype=np.int32)[order],
+        "arrival": np.array(arrivals, dtype=np.int32)[order],
+        "trip": np.array(trips, dtype=np.int32)[order],
+    }
+
+    transfers = []
+    for src, dst in rnd.integers(num_stops, size=(num_transfers, 2)):
+        if src != dst:
+            transfer_time = int(rnd.integers(60, 600))
+            transfers.append((f"{src}", f"{dst}", transfer_time))
+            transfers.append((f"{dst}", f"{src}", transfer_time))
+
+    return ArrayTimetable(
+        stops, connections, trip_ids, np.array(trip_services, dtype=np.int32), services, transfers,
+        version=f"synthetic-{seed}"
+    )
+
+
+def generate_partition(nx=40, ny=20, bounds=SWISS_BOUNDS):
+    """Generates a geojson FeatureCollection of nx * ny rectangles covering bounds."""
+    lon_min, lat_min, lon_max, lat_max = bounds
+    lon_steps = np.linspace(lon_min, lon_max, nx + 1)
+    lat_steps = np.linspace(lat_min, lat_max, ny + 1)
+    features = []
+    for i in range(nx):
+        for j in range(ny):
+            x0, x1 = float(lon_steps[i]), float(lon_steps[i + 1])
+            y0, y1 = float(lat_steps[j]), float(lat_steps[j + 1])
+            features.append({
+                "type": "Feature",
+                "id": f"{i}_{j}",
+                "properties": {},
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]]
+                }
+            })
+    return {"type": "FeatureCollection", "features": features}
@@ -0,0 +1,79 @@
+import numpy as np
+
+
+def to_minutes(times):
+    """Converts datetime.time values (None if unreachable) to minutes since midnight, NaN if unreachable."""
+    return np.array(
+        [np.nan if time is None else time.hour * 60 + time.minute for time in times],
+        dtype=np.float32
+    )
+
+
+def accumulate(departures, arrivals, counts):
+    """Accumulates the commutes of several queries.
+
+    departures is a (queries x places) array of latest departures in minutes
+    (NaN if the place cannot reach the destination in time), arrivals the
+    arrival time of each query in minutes and counts how often each query
+    is made. Returns the total commute time of every place as one weighted
+    matrix product. Places that cannot satisfy all counted queries are NaN.
+    """
+    departures = np.asarray(departures, dtype=np.float32)
+    counts = np.asarray(counts, dtype=np.float32)
+    # 0 * NaN is NaN, so queries that are not counted must be dropped
+    selected = counts > 0
+    commutes = np.asarray(arrivals, dtype=np.float32)[selected, np.newaxis] - departures[selected]
+    return counts[selected] @ commutes
+
+
+def aggregate_stops(values, stop_to_feature, num_features : int, stop_weights=None):
+    """Averages per-stop values per feature, weighted by stop_weights (e.g. the
+    population around each stop, equal weights if None).
+    stop_to_feature holds the feature index of every stop, -1 for none.
+    Stops with NaN values are left out, features without any stop are NaN."""
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.ones(len(values)) if stop_weights is None else np.asarray(stop_weights, dtype=np.float64)
+    valid = (stop_to_feature >= 0) & ~np.isnan(values) & (weights > 0)
+    total_weight = np.bincount(stop_to_feature[valid], weights=weights[valid], minlength=num_features)
+    total_value = np.bincount(stop_to_feature[valid], weights=weights[valid] * values[valid], minlength=num_features)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total_weight > 0, total_value / total_weight, np.nan)
+
+
+# statistics computed by feature_statistics
+STATISTICS = ("max", "min", "median", "p90", "count")
+
+
+def feature_statistics(values, stop_to_feature, num_features : int):
+    """Computes the statistics in STATISTICS of the per-stop values of every
+    feature in one grouped pass: the values are sorted by feature and value
+    once, then every statistic is a lookup into the sorted groups.
+    stop_to_feature holds the feature index of every stop, -1 for none.
+    Stops with NaN values are left out, features without any stop are NaN
+    (count 0). Percentiles interpolate linearly, as np.percentile does.
+    Returns a dict of arrays with one entry per feature."""
+    values = np.asarray(values, dtype=np.float64)
+    stop_to_feature = np.asarray(stop_to_feature)
+    valid = (stop_to_feature >= 0) & ~np.isnan(values)
+    features, values = stop_to_feature[valid], values[valid]
+    order = np.lexsort((values, features))
+    values = values[order]
+    count = np.bincount(features, minlength=num_features)
+    start = np.cumsum(count) - count
+    reached = count > 0
+
+    def percentile(q):
+        result = np.full(num_features, np.nan)
+        position = start[reached] + q * (count[reached] - 1)
+        lo = np.floor(position).astype(np.int64)
+        hi = np.ceil(position).astype(np.int64)
+        result[reached] = values[lo] + (values[hi] - values[lo]) * (position - lo)
+        return result
+
+    return {
+        "max": percentile(1.0),
+        "min": percentile(0.0),
+        "median": percentile(0.5),
+        "p90": percentile(0.9),
+        "count": count,
+    }
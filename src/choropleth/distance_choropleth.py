@@ -1,8 +1,8 @@
 
-from shapely import *
 import json
 import click
 import time
+import numpy as np
 
 SUBPROBLEM_LIMIT = 10000
 
@@ -16,27 +16,26 @@ def aggregate(x,y):
     return max(x,y)
 
 # TODO: make use of geojson class!
-def create_choropleth(coord_to_information, geojson, aggregate=aggregate):
-    """Creates a mapping from geojson feature id to departure time.
-    The departure time of feature f is taken as the minimum departure time 
-    of coordinates that lie within f.
-    
-    Assumes that each geojson feature contains the path "id" 
-    where id is a unique id of the feature.
+def assign_to_features(coords, geojson):
+    """Returns the index of the geojson feature containing each coord (x, y),
+    -1 for coords outside of every feature, as an integer array.
 
+    Coords and features are split along the longer axis of their bounds until
+    the subproblems are small enough to test every coord against every feature.
     Uses shapely to perform the geometric operations on the geojson features.
     """
-    choropleth = {}
+    coords = list(coords)
+    assignment = np.full(len(coords), -1, dtype=np.int64)
+    if len(coords) == 0:
+        return assignment
 
-    def create_choropleth_rec(
+    def assign_rec(
         geometries_list, 
         geometries_idxs, 
         coords_list, 
         coords_idxs, 
         bounds
     ):
-        nonlocal choropleth
-        
         def partition_geometries_on_x_axis(feature_list, feature_idxs, x):
             left = []
             right = []
@@ -61,19 +60,17 @@ def create_choropleth(coord_to_information, geojson, aggregate=aggregate):
                     top.append(idx)
             return bottom, top
 
-        print("called with coords", len(coords_idxs), "and features", len(geometries_idxs))  
         if len(coords_idxs) * len(geometries_idxs) < SUBPROBLEM_LIMIT:
             # Base case: check inclusion of each coord in each feature
             for p_idx in coords_idxs:
+                # coords on a split line are in both halves
+                if assignment[p_idx] >= 0:
+                    continue
                 p = coords_list[p_idx]
-                x, y = p.x, p.y
                 for geometry_idx in geometries_idxs:
                     geometry = geometries_list[geometry_idx]
                     if geometry.contains(p):
-                        choropleth[geometry_idx] = aggregate(
-                            choropleth.get(geometry_idx),
-                            coord_to_information[(x,y)]
-                        )
+                        assignment[p_idx] = feature_idxs[geometry_idx]
                         break
         else:
             # Recursive case: split both coords and features along one axis and recurse
@@ -91,18 +88,22 @@ def create_choropleth(coord_to_information, geojson, aggregate=aggregate):
                 coords_idxs1, coords_idxs2 = partition_geometries_on_y_axis(coords_list, coords_idxs, half)
                 geometries_idxs1, geometries_idxs2 = partition_geometries_on_y_axis(geometries_list, geometries_idxs, half)
 
-            create_choropleth_rec(geometries_list, geometries_idxs1, coords_list, coords_idxs1, bounds1)
-            create_choropleth_rec(geometries_list, geometries_idxs2, coords_list, coords_idxs2, bounds2)
+            assign_rec(geometries_list, geometries_idxs1, coords_list, coords_idxs1, bounds1)
+            assign_rec(geometries_list, geometries_idxs2, coords_list, coords_idxs2, bounds2)
 
+    # shapely is imported here to keep it out of the app's startup
+    from shapely import from_geojson, GeometryCollection, MultiPoint
     geometry_collection = from_geojson(json.dumps(geojson))
 
     assert geometry_collection.geom_type == "GeometryCollection"
-    valid_geometries = GeometryCollection([
-        geometry for geometry in geometry_collection.geoms
+    # index into geojson["features"] of every valid geometry
+    feature_idxs = [
+        idx for idx, geometry in enumerate(geometry_collection.geoms)
         if geometry.geom_type in ["Polygon", "MultiPolygon"]
-    ])
+    ]
+    valid_geometries = GeometryCollection([geometry_collection.geoms[idx] for idx in feature_idxs])
 
-    valid_coords = MultiPoint([[x,y] for x,y in coord_to_information])
+    valid_coords = MultiPoint([[x,y] for x,y in coords])
 
     geoms_bounds = valid_geometries.bounds
     coord_bounds = valid_coords.bounds
@@ -117,10 +118,29 @@ def create_choropleth(coord_to_information, geojson, aggregate=aggregate):
     coords_list = list(valid_coords.geoms)
     geometries_idxs = list(range(len(geometries_list)))
     coords_idxs = list(range(len(coords_list)))
-    create_choropleth_rec(geometries_list, geometries_idxs, coords_list, coords_idxs, bounds)
+    assign_rec(geometries_list, geometries_idxs, coords_list, coords_idxs, bounds)
+    return assignment
+
+
+def create_choropleth(coord_to_information, geojson, aggregate=aggregate):
+    """Creates a mapping from geojson feature id to departure time.
+    The departure time of feature f is taken as the aggregate of the
+    departure times of coordinates that lie within f.
+    
+    Assumes that each geojson feature contains the path "id" 
+    where id is a unique id of the feature.
+
+    To compute statistics of the values of every feature, use
+    assign_to_features and a grouped reduction such as
+    src.choropleth.accumulation.feature_statistics instead.
+    """
+    choropleth = {}
+    for coord, feature_idx in zip(coord_to_information, assign_to_features(coord_to_information, geojson).tolist()):
+        if feature_idx >= 0:
+            choropleth[feature_idx] = aggregate(choropleth.get(feature_idx), coord_to_information[coord])
     return {
         feature["id"]: choropleth.get(idx)
-        for idx, feature in zip(geometries_idxs, geojson["features"])
+        for idx, feature in enumerate(geojson["features"])
     }
 
 
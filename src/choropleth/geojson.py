@@ -1,10 +1,25 @@
 import json
 from typing import Dict
-from shapely import *
+
+
+def with_properties(geojson, properties):
+    """A copy of the FeatureCollection geojson in which the idx-th feature carries
+    properties[idx] on top of its own. Only the geometries are shared, so the
+    features of a Geojson or Grid shared by all queries stay unchanged."""
+    return {
+        **geojson,
+        "features": [
+            {**feature, "properties": {**feature.get("properties", {}), **feature_properties}}
+            for feature, feature_properties in zip(geojson["features"], properties)
+        ],
+    }
+
 
 class Geojson:
 
     def __init__(self, json_data):
+        # shapely is imported here to keep it out of the app's startup
+        from shapely import from_geojson
         self._json_data = json_data
         self._geometry_collection = from_geojson(json.dumps(json_data))
 
@@ -19,6 +34,7 @@ class Geojson:
         return self._geometry_collection
 
     def get_feature_covering_lat_lon(self, lat : float, lon : float):
+        from shapely import Point
         p = Point(lon, lat)
         geometry_collection = self.get_geometry_collection()
         for idx, geometry in enumerate(geometry_collection.geoms):
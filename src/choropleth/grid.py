@@ -0,0 +1,119 @@
+import numpy as np
+
+# cell sizes offered in the app, metres
+CELL_SIZES = (500, 1000, 2000, 5000)
+# latitude of the equirectangular projection, the centre of switzerland
+REFERENCE_LATITUDE = 46.8
+EARTH_RADIUS = 6_371_000
+# keys pack row and column into one integer, columns are shifted to be non-negative
+COLUMNS = 2 ** 32
+
+
+def project(lats, lons):
+    """Projects lat/lon to metres on a fixed plane, so that the cells of the
+    grid do not depend on the points that are assigned to them."""
+    x = EARTH_RADIUS * np.radians(np.asarray(lons, dtype=np.float64)) * np.cos(np.radians(REFERENCE_LATITUDE))
+    y = EARTH_RADIUS * np.radians(np.asarray(lats, dtype=np.float64))
+    return x, y
+
+
+def unproject(x, y):
+    """Inverse of project, returns (lats, lons)."""
+    lons = np.degrees(np.asarray(x, dtype=np.float64) / (EARTH_RADIUS * np.cos(np.radians(REFERENCE_LATITUDE))))
+    lats = np.degrees(np.asarray(y, dtype=np.float64) / EARTH_RADIUS)
+    return lats, lons
+
+
+def cell_keys(lats, lons, cell_size : float):
+    """The key of the grid cell of every point, computed instead of tested."""
+    x, y = project(lats, lons)
+    rows = np.floor(y / cell_size).astype(np.int64)
+    columns = np.floor(x / cell_size).astype(np.int64)
+    return rows * COLUMNS + columns + COLUMNS // 2
+
+
+def load_population_raster(path):
+    """Reads a population raster saved with np.savez: "population", a 2-D array
+    with the population of every pixel, the first row being the northernmost,
+    and the bounds "west", "south", "east" and "north" in degrees.
+    Returns the lat, lon and population of every populated pixel centre."""
+    with np.load(path) as raster:
+        population = np.asarray(raster["population"], dtype=np.float64)
+        west, south, east, north = (float(raster[bound]) for bound in ("west", "south", "east", "north"))
+    num_rows, num_columns = population.shape
+    rows, columns = np.nonzero(population > 0)
+    lats = north - (rows + 0.5) * (north - south) / num_rows
+    lons = west + (columns + 0.5) * (east - west) / num_columns
+    return lats, lons, population[rows, columns]
+
+
+class Grid:
+    """Regular grid of square cells of cell_size metres, an alternative to the
+    features of a geojson file as the target of the aggregation.
+
+    The cells containing at least one of the stops at lats, lons become the
+    features, in the order of their keys. Points are assigned to cells by
+    arithmetic, so aggregating a result at another cell size is cheap.
+    """
+
+    def __init__(self, cell_size : float, lats, lons):
+        self._cell_size = cell_size
+        self._keys, self._stop_to_cell = np.unique(cell_keys(lats, lons, cell_size), return_inverse=True)
+        self._geojson = None
+
+    def get_cell_size(self):
+        return self._cell_size
+
+    def get_stop_to_feature(self):
+        """The feature of every stop the grid was built from."""
+        return self._stop_to_cell
+
+    def assign(self, lats, lons):
+        """The feature index of every point, -1 for points outside of the cells."""
+        keys = cell_keys(lats, lons, self._cell_size)
+        idxs = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return np.where(self._keys[idxs] == keys, idxs, -1)
+
+    def get_population(self, raster):
+        """Population of every cell from (lats, lons, population) as returned
+        by load_population_raster. Pixels outside of the cells are dropped."""
+        lats, lons, population = raster
+        cells = self.assign(lats, lons)
+        inside = cells >= 0
+        return np.bincount(cells[inside], weights=population[inside], minlength=len(self._keys))
+
+    def get_stop_population(self, raster):
+        """The population of every cell split evenly between the stops in it,
+        the weights of the stops the grid was built from."""
+        stops_per_cell = np.bincount(self._stop_to_cell, minlength=len(self._keys))
+        return (self.get_population(raster) / np.maximum(stops_per_cell, 1))[self._stop_to_cell]
+
+    def get_geojson(self):
+        """The cells as a geojson FeatureCollection, the id of a feature is its key."""
+        if self._geojson is None:
+            rows, columns = np.divmod(self._keys, COLUMNS)
+            columns = columns - COLUMNS // 2
+            south, west = unproject(columns * self._cell_size, rows * self._cell_size)
+            north, east = unproject((columns + 1) * self._cell_size, (rows + 1) * self._cell_size)
+            self._geojson = {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "id": str(key),
+                        "properties": {},
+                        "geometry": {
+                            "type": "Polygon",
+                            "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]],
+                        },
+                    }
+                    for key, w, s, e, n in zip(self._keys.tolist(), west.tolist(), south.tolist(), east.tolist(), north.tolist())
+                ],
+            }
+        return self._geojson
+
+    def get_feature_covering_lat_lon(self, lat : float, lon : float):
+        idx = self.assign([lat], [lon])[0]
+        if idx < 0:
+            return None
+        return self.get_geojson()["features"][idx]
@@ -0,0 +1,191 @@
+import contextlib
+import contextvars
+import threading
+import time
+import tracemalloc
+
+
+class QueryReport:
+    """Stage timings and counters recorded while answering one query.
+
+    Stage times are exclusive: time spent in a nested stage is only
+    accounted to the nested stage, so the stage times add up to the total.
+
+    While tracemalloc is tracing, memory records the peak of every stage: the
+    most bytes allocated on top of those in use when the stage started, nested
+    stages included. peak_memory is the same for the whole report. tracemalloc
+    is process-wide, so the peaks of queries running at the same time are
+    only approximate.
+    """
+
+    def __init__(self, name : str = ""):
+        self.name = name
+        self.stages = {}
+        self.counters = {}
+        self.memory = {}
+        self.peak_memory = None
+        self._stack = []
+        # [bytes in use at the start, peak so far] of the report and the open stages
+        self._memory_stack = []
+        self._start = time.perf_counter()
+        self._end = None
+        if tracemalloc.is_tracing():
+            self._push_memory()
+
+    @contextlib.contextmanager
+    def stage(self, name : str):
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        tracing = len(self._memory_stack) > 0 and tracemalloc.is_tracing()
+        if tracing:
+            self._push_memory()
+        try:
+            yield
+        finally:
+            if tracing:
+                self.memory[name] = max(self.memory.get(name, 0), self._pop_memory())
+            nested = self._stack.pop()
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+            if len(self._stack) > 0:
+                self._stack[-1] += elapsed
+
+    def _push_memory(self):
+        # the peak since the last reset belongs to the enclosing stage
+        current, peak = tracemalloc.get_traced_memory()
+        if len(self._memory_stack) > 0:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        self._memory_stack.append([current, current])
+
+    def _pop_memory(self):
+        """Returns the peak of the innermost stage above its start in bytes."""
+        _, peak = tracemalloc.get_traced_memory()
+        start, stage_peak = self._memory_stack.pop()
+        stage_peak = max(stage_peak, peak)
+        if len(self._memory_stack) > 0:
+            self._memory_stack[-1][1] = max(self._memory_stack[-1][1], stage_peak)
+        tracemalloc.reset_peak()
+        return stage_peak - start
+
+    def count(self, name : str, n : int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def close(self):
+        self._end = time.perf_counter()
+        if len(self._memory_stack) == 1 and tracemalloc.is_tracing():
+            self.peak_memory = max(self.peak_memory or 0, self._pop_memory())
+
+    def total(self):
+        return (self._end or time.perf_counter()) - self._start
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "total": self.total(),
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+            "memory": dict(self.memory),
+            "peak_memory": self.peak_memory,
+        }
+
+    def __str__(self):
+        lines = [f"{self.name}: {self.total() * 1000:.1f} ms"]
+        for name, seconds in self.stages.items():
+            lines.append(f"  {name:24s} {seconds * 1000:10.1f} ms")
+        for name, value in self.counters.items():
+            lines.append(f"  {name:24s} {value:10d}")
+        if self.peak_memory is not None:
+            lines.append(f"  {'peak_memory':24s} {self.peak_memory / 2 ** 20:10.1f} MB")
+        for name, nbytes in self.memory.items():
+            lines.append(f"  {name + ' peak':24s} {nbytes / 2 ** 20:10.1f} MB")
+        return "\n".join(lines)
+
+
+_current_report = contextvars.ContextVar("current_report", default=None)
+
+
+@contextlib.contextmanager
+def report(name : str = "", trace_memory : bool = False):
+    """Collects the stages and counters recorded within the block.
+    Nested calls record into the outermost report.
+    trace_memory records the peak memory of the stages as well, tracemalloc
+    is started for the block unless it is tracing already. Tracing slows
+    Python code down severalfold, so it is off by default."""
+    current = _current_report.get()
+    if current is not None:
+        yield current
+        return
+    with _tracing(trace_memory):
+        query_report = QueryReport(name)
+        token = _current_report.set(query_report)
+        try:
+            yield query_report
+        finally:
+            query_report.close()
+            _current_report.reset(token)
+
+
+@contextlib.contextmanager
+def resume(query_report : QueryReport, trace_memory : bool = False):
+    """Records into query_report again, e.g. in the thread that continues
+    a query computed on a worker. The total is extended to the end of the block.
+    With trace_memory, peak_memory becomes the larger of the two blocks."""
+    with _tracing(trace_memory):
+        query_report._end = None
+        if len(query_report._memory_stack) == 0 and tracemalloc.is_tracing():
+            query_report._push_memory()
+        token = _current_report.set(query_report)
+        try:
+            yield query_report
+        finally:
+            query_report.close()
+            _current_report.reset(token)
+
+
+_tracing_lock = threading.Lock()
+# reports tracing memory at the moment, tracemalloc is stopped after the last one
+_num_tracing = 0
+_started_tracing = False
+
+
+@contextlib.contextmanager
+def _tracing(trace_memory : bool):
+    """Keeps tracemalloc tracing for the block if trace_memory is set. Tracing
+    started elsewhere is left running."""
+    global _num_tracing, _started_tracing
+    if not trace_memory:
+        yield
+        return
+    with _tracing_lock:
+        if _num_tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _num_tracing += 1
+    try:
+        yield
+    finally:
+        with _tracing_lock:
+            _num_tracing -= 1
+            if _num_tracing == 0 and _started_tracing:
+                tracemalloc.stop()
+                _started_tracing = False
+
+
+def get_current_report():
+    return _current_report.get()
+
+
+def stage(name : str):
+    """Times the block as stage name of the current report, if there is one."""
+    current = _current_report.get()
+    if current is None:
+        return contextlib.nullcontext()
+    return current.stage(name)
+
+
+def count(name : str, n : int = 1):
+    """Adds n to counter name of the current report, if there is one."""
+    current = _current_report.get()
+    if current is not None:
+        current.count(name, n)
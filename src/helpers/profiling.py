@@ -0,0 +1,167 @@
+import contextlib
+import cProfile
+import datetime
+import html
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import zlib
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+SAMPLING_INTERVAL = 0.005
+
+
+class Sampler:
+    """Statistical profiler that samples the stack of one thread.
+
+    A background thread records the stack of the profiled thread every
+    interval seconds. The overhead is low enough to keep it running for
+    every query and only keep the profiles of slow ones.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLING_INTERVAL):
+        self._thread_id = thread_id or threading.get_ident()
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.stacks = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack = tuple(reversed(stack))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def collapsed(self):
+        """Stacks in the collapsed format of flamegraph.pl / speedscope."""
+        return "\n".join(
+            f"{';'.join(stack)} {num}" for stack, num in sorted(self.stacks.items())
+        )
+
+
+def render_flamegraph(stacks, title : str, width : int = 1200, row_height : int = 16):
+    """Renders {stack tuple: samples} as a self-contained svg flamegraph."""
+    tree = {}
+    for stack, num in stacks.items():
+        node = tree
+        for frame in stack:
+            child = node.setdefault(frame, {"samples": 0, "children": {}})
+            child["samples"] += num
+            node = child["children"]
+    total = sum(stacks.values()) or 1
+
+    rects = []
+    def layout(children, x, depth):
+        for name, child in sorted(children.items()):
+            w = child["samples"] / total * width
+            if w >= 0.5:
+                rects.append((x, depth, w, name, child["samples"]))
+                layout(child["children"], x, depth + 1)
+            x += w
+    layout(tree, 0.0, 0)
+
+    depth = max((d for _, d, _, _, _ in rects), default=0) + 1
+    height = (depth + 2) * row_height
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="{row_height - 4}">{html.escape(title)} ({total} samples)</text>',
+    ]
+    for x, d, w, name, num in rects:
+        y = height - (d + 1) * row_height
+        hue = 20 + zlib.crc32(name.encode("utf-8")) % 40
+        label = html.escape(name[:int(w / 7)]) if w > 21 else ""
+        lines.append(
+            f'<g><title>{html.escape(name)}: {num} samples ({num / total:.1%})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+            f'<text x="{x + 2:.1f}" y="{y + row_height - 4}">{label}</text></g>'
+        )
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+
+class QueryProfile:
+    """Profile of one query, see profile_query."""
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self.duration = None
+        self.paths = []
+
+    def file_prefix(self, output_dir):
+        tag = "_".join(str(value) for value in self.params.values())
+        tag = re.sub(r"[^A-Za-z0-9.-]+", "-", tag).strip("-")
+        timestamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        return os.path.join(output_dir, f"{timestamp}_{self.name}_{tag}")
+
+    def write_metadata(self, prefix):
+        path = prefix + ".json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"name": self.name, "params": self.params, "duration": self.duration}, f, default=str, indent=4)
+        self.paths.append(path)
+
+
+@contextlib.contextmanager
+def profile_query(name : str, params : dict, enabled : bool = False, threshold : float = None, method : str = "sampling", output_dir : str = PROFILE_DIR):
+    """Profiles the block if enabled, or keeps the profile if the block takes longer than threshold seconds.
+
+    The files are named after name and params (e.g. location, date, time):
+    - method "sampling": <prefix>.collapsed (collapsed stacks) and <prefix>.svg (flamegraph)
+    - method "cprofile": <prefix>.prof (pstats, e.g. for snakeviz) and <prefix>.txt (top functions)
+    plus <prefix>.json with the query parameters and the duration.
+    cProfile slows the query down noticeably, so threshold profiling should use sampling.
+    The yielded QueryProfile lists the written files in paths.
+    """
+    query_profile = QueryProfile(name, params)
+    if not enabled and threshold is None:
+        yield query_profile
+        return
+
+    if method == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = Sampler()
+        profiler.start()
+    start = time.perf_counter()
+    try:
+        yield query_profile
+    finally:
+        query_profile.duration = time.perf_counter() - start
+        if method == "cprofile":
+            profiler.disable()
+        else:
+            profiler.stop()
+
+        if enabled or query_profile.duration > threshold:
+            os.makedirs(output_dir, exist_ok=True)
+            prefix = query_profile.file_prefix(output_dir)
+            if method == "cprofile":
+                profiler.dump_stats(prefix + ".prof")
+                with open(prefix + ".txt", "w", encoding="utf-8") as f:
+                    pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(50)
+                query_profile.paths += [prefix + ".prof", prefix + ".txt"]
+            else:
+                with open(prefix + ".collapsed", "w", encoding="utf-8") as f:
+                    f.write(profiler.collapsed())
+                with open(prefix + ".svg", "w", encoding="utf-8") as f:
+                    f.write(render_flamegraph(profiler.stacks, f"{name} {params} {query_profile.duration:.2f}s"))
+                query_profile.paths += [prefix + ".collapsed", prefix + ".svg"]
+            query_profile.write_metadata(prefix)
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+# Bytes of query arrays kept in memory per session
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class QueryStore:
+    """Insertion-ordered store of the value arrays of past queries.
+
+    Every entry is a dict of numpy arrays (e.g. latest departures per feature
+    and per stop); geometry and ids are shared and stored elsewhere. Once the
+    arrays in memory exceed max_bytes, the least recently used entries are
+    offloaded to .npz files in a temporary directory and loaded again on access,
+    so keys() still lists every query. The directory is removed together with
+    the store.
+    """
+
+    def __init__(self, max_bytes : int = MAX_BYTES, directory : str = None):
+        self._max_bytes = max_bytes
+        self._directory = directory
+        self._keys = []
+        # key -> arrays of the entries in memory, least recently used first
+        self._in_memory = OrderedDict()
+        # key -> path of the offloaded entries
+        self._on_disk = {}
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, key, arrays : dict):
+        with self._lock:
+            if key in self._in_memory or key in self._on_disk:
+                self._remove(key)
+            else:
+                self._keys.append(key)
+            self._in_memory[key] = arrays
+            self._nbytes += entry_nbytes(arrays)
+            self._offload()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._in_memory:
+                self._in_memory.move_to_end(key)
+                return self._in_memory[key]
+            path = self._on_disk.pop(key)
+            with np.load(path) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            os.remove(path)
+            self._in_memory[key] = arrays
+            self._nbytes += entry_nbytes(arrays)
+            self._offload(keep=key)
+            return arrays
+
+    def keys(self):
+        with self._lock:
+            return list(self._keys)
+
+    def __contains__(self, key):
+        return key in self._in_memory or key in self._on_disk
+
+    def __len__(self):
+        return len(self._keys)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queries": len(self._keys),
+                "in_memory": len(self._in_memory),
+                "on_disk": len(self._on_disk),
+                "bytes_in_memory": self._nbytes,
+                "max_bytes": self._max_bytes,
+            }
+
+    def _remove(self, key):
+        if key in self._in_memory:
+            self._nbytes -= entry_nbytes(self._in_memory.pop(key))
+        else:
+            os.remove(self._on_disk.pop(key))
+
+    def _offload(self, keep=None):
+        while self._nbytes > self._max_bytes and len(self._in_memory) > 1:
+            key, arrays = next(iter(self._in_memory.items()))
+            if key == keep:
+                self._in_memory.move_to_end(key)
+                continue
+            del self._in_memory[key]
+            self._nbytes -= entry_nbytes(arrays)
+            path = os.path.join(self._get_directory(), f"{self._keys.index(key)}.npz")
+            np.savez(path, **arrays)
+            self._on_disk[key] = path
+
+    def _get_directory(self):
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="query-store-")
+            weakref.finalize(self, shutil.rmtree, self._directory, ignore_errors=True)
+        return self._directory
+
+
+def entry_nbytes(arrays : dict):
+    return sum(array.nbytes for array in arrays.values())
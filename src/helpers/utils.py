@@ -3,4 +3,11 @@ import datetime
 def parse_time(time : datetime.time):
     if time is None:
         return None
-    return time.minute + time.hour * 60
\ No newline at end of file
+    return time.minute + time.hour * 60
+
+def minutes_to_time(minutes):
+    """Inverse of parse_time, None for None and NaN. Fractions of a minute are dropped."""
+    if minutes is None or minutes != minutes:
+        return None
+    minutes = int(minutes)
+    return datetime.time(minutes // 60, minutes % 60)
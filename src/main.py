@@ -1,20 +1,50 @@
 import datetime
 import streamlit as st
-import pandas as pd
+import streamlit.components.v1 as components
 from streamlit_folium import st_folium
 import folium
 import json
-from itertools import groupby
-
-from src.traversal.algorithm import compute_map, get_all_stop_names
-from src.choropleth.distance_choropleth import create_choropleth
-from src.choropleth.geojson import Geojson
-from src.helpers.utils import parse_time
+import os
+import uuid
+import numpy as np
+
+from src.traversal.algorithm import TRANSFER, UnknownLocation, compute_map, compute_isochrone, get_all_stop_names, get_locations, get_service_pattern, get_timetable_version, seconds_to_time
+from src.traversal.cache import ResultCache
+from src.traversal.executor import QueryExecutor
+from src.traversal.journeys import JourneyIndex
+from src.traversal.store import ResultStore
+from src.traversal.stop_index import STOP_INDEX, load_stop_names, refresh_stop_index
+from src.choropleth.accumulation import feature_statistics, to_minutes
+from src.choropleth.distance_choropleth import assign_to_features
+from src.choropleth.geojson import Geojson, with_properties
+from src.choropleth.grid import CELL_SIZES, Grid, load_population_raster
+from src.helpers import instrumentation, profiling
+from src.helpers.query_store import QueryStore
+from src.helpers.utils import minutes_to_time
 
 # The year of the gtfs data in the database
 YEAR=2024
 GEOJSON = "data/geojson/ch-municipalities.geojson"
-
+# aggregation targets, the features of GEOJSON or a grid of cells of this many metres
+MUNICIPALITIES = "Municipalities"
+GRANULARITIES = {MUNICIPALITIES: None, **{f"{cell_size / 1000:g} km grid": cell_size for cell_size in CELL_SIZES}}
+# Optional population raster, see load_population_raster
+POPULATION_RASTER = "data/population.npz"
+LATEST_DEPARTURE = "Latest departure"
+REACHABILITY = "Reachability"
+# the features are coloured by the best stop (latest departure or earliest arrival) or by a statistic of their stops
+DEFAULT_STATISTIC = "best"
+COLOUR_BY = {DEFAULT_STATISTIC: "Best stop", "median": "Median stop", "p90": "90th percentile", "count": "Reachable stops"}
+# Number of compute_map results kept in memory, shared by all sessions
+RESULT_CACHE_SIZE = 32
+# Precomputed results written by `python -m src.traversal.store`
+RESULT_STORE = "data/results"
+# Number of queries computed at the same time, shared by all sessions
+QUERY_WORKERS = 4
+# Seconds between checks for partial results of a running query
+PROGRESS_INTERVAL = 0.25
+# Queries slower than this many seconds are profiled automatically, unset to disable
+PROFILE_THRESHOLD = float(os.environ["PROFILE_THRESHOLD"]) if "PROFILE_THRESHOLD" in os.environ else None
 st.set_page_config(layout="wide")
 
 def time_to_iso(time : datetime.time):
@@ -29,77 +59,265 @@ def get_geojson() -> Geojson:
         return Geojson(geojson_data)
 
 
-@st.cache_data
-def group_stops_by_feature(coord_to_stops, geojson):
-    def aggregate_stops(stops, new_stops):
-        """Aggregate the departure times of coords in the same polygon."""
-        updated_stops = stops or []
-        return updated_stops + new_stops
-    
+@st.cache_resource
+def get_features(granularity : str):
+    """The Geojson of the municipalities or the Grid of the stops."""
+    cell_size = GRANULARITIES[granularity]
+    if cell_size is None:
+        return get_geojson()
+    locations = get_locations()
+    return Grid(cell_size, [lat for _, _, lat, _ in locations], [lon for _, _, _, lon in locations])
+
+
+@st.cache_resource
+def get_population_raster():
+    if not os.path.exists(POPULATION_RASTER):
+        return None
+    return load_population_raster(POPULATION_RASTER)
+
+
+def find_stop_features(coords):
+    """Index of the geojson feature containing every (lon, lat) of coords, -1 for none."""
     geojson = get_geojson().get_geojson()
-    choropleth = create_choropleth(coord_to_stops, geojson, aggregate=aggregate_stops)
-    return choropleth
+    return assign_to_features(coords, geojson)
 
 
 @st.cache_data
-def compute_choropleth(location : str, date : datetime.date, time : datetime.time, earliest_departure : datetime.time):
-    
-    def get_latest_departure_time(stops):
-        if stops is None:
-            return None
-        departure_times = [
-            stop["departure"] for stop in stops 
-            if stop["departure"] is not None
-        ]
-        if len(departure_times) == 0:
-            return None
-        return max(departure_times)
+def assign_stops_to_features(coords, geojson):
+    return find_stop_features(coords)
+
+
+@st.cache_resource
+def get_result_store():
+    if not os.path.isdir(RESULT_STORE):
+        return None
+    return ResultStore(RESULT_STORE, get_timetable_version())
+
+
+def compute_map_or_load(location : str, date : datetime.date, time : int, earliest_departure : int, store=None, **kwargs):
+    """kwargs (progress and cancel) are passed on to compute_map.
+    Returns an ArrayResult, whose records the itineraries are read from."""
+    if store is not None:
+        mapping = store.get(location, get_service_pattern(date), time, earliest_departure)
+        if mapping is not None:
+            return mapping
+    return compute_map(location, date, time, earliest_departure, low_memory=True, **kwargs)
+
+
+@st.cache_resource
+def get_result_cache() -> ResultCache:
+    return ResultCache(compute_map_or_load, get_service_pattern, maxsize=RESULT_CACHE_SIZE)
+
+
+@st.cache_resource
+def get_query_executor() -> QueryExecutor:
+    return QueryExecutor(max_workers=QUERY_WORKERS)
+
+
+def build_choropleth_data(stop_to_journey_information, key : str, reduce : str, column : str, features, partial : bool = False):
+    """Computes the statistics of the stops' journey information[key] per geojson
+    feature of features (a Geojson or a Grid) in one grouped pass, see feature_statistics.
+    Returns a data frame with the columns id, count and max, min, median and p90
+    in minutes, plus {column}_minutes, {column}_time and {column}_string of the
+    statistic reduce. Also returns the feature index of every stop (in the order
+    of stop_to_journey_information) and a copy of the geojson where each feature
+    carries the formatted statistics in its properties: reduce as properties[key].
+    The cells of a grid also carry their population if there is a population raster.
+    Partial results are not cached."""
+    # pandas is only needed once there is a result, keep it out of the first page load
+    import pandas as pd
+
+    coords = tuple((val["lon"], val["lat"]) for val in stop_to_journey_information.values())
+    geojson = features.get_geojson()
+    with instrumentation.stage("polygon_aggregation"):
+        if isinstance(features, Grid):
+            stop_to_feature = features.assign([lat for _, lat in coords], [lon for lon, _ in coords])
+        elif partial:
+            stop_to_feature = find_stop_features(coords)
+        else:
+            stop_to_feature = assign_stops_to_features(coords, geojson)
+
+    with instrumentation.stage("feature_statistics"):
+        minutes = to_minutes(val[key] for val in stop_to_journey_information.values())
+        statistics = feature_statistics(minutes, stop_to_feature, len(geojson["features"]))
+
+    with instrumentation.stage("dataframe_build"):
+        data = pd.DataFrame({"id": [feature["id"] for feature in geojson["features"]], **statistics})
+        data[f"{column}_minutes"] = data[reduce]
+        data[f"{column}_time"] = data[f"{column}_minutes"].map(minutes_to_time)
+        data[f"{column}_string"] = data[f"{column}_time"].map(time_to_iso)
+        data.set_index("id", drop=False, inplace=True)
+        if isinstance(features, Grid) and get_population_raster() is not None:
+            data["population"] = features.get_population(get_population_raster())
+
+        strings = {
+            name: [time_to_iso(minutes_to_time(value)) for value in data[name].tolist()]
+            for name in ("median", "p90")
+        }
+        properties = []
+        for idx, feature in enumerate(geojson["features"]):
+            feature_properties = {
+                "id": feature["id"],
+                key: data[f"{column}_string"].iloc[idx],
+                "median": strings["median"][idx],
+                "p90": strings["p90"][idx],
+                "count": int(statistics["count"][idx]),
+            }
+            if "population" in data:
+                feature_properties["population"] = int(data["population"].iloc[idx])
+            properties.append(feature_properties)
+
+    # features is shared by all sessions, every result gets its own properties
+    return data, stop_to_feature, with_properties(geojson, properties)
+
+
+def run_query(title : str, name : str, params : dict, profile : bool, compute, preview):
+    """Runs compute(progress=..., cancel=...) on the query executor and waits for it.
+
+    A query still running for this session is cancelled, and so is this one if
+    the script run is stopped because the user changed the input. The query
+    report and the profile are recorded on the worker, a profiled query
+    records the peak memory of its stages as well. While waiting, preview
+    is called with every new partial result.
+    Returns the result, the QueryReport and the paths of the profile files.
+    """
+    def run(progress, cancel):
+        with instrumentation.report(title, trace_memory=profile) as query_report, \
+                profiling.profile_query(name, params, profile, PROFILE_THRESHOLD) as query_profile:
+            result = compute(progress=progress, cancel=cancel)
+        return result, query_report, query_profile.paths
+
+    session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+    query = get_query_executor().submit(session_id, run)
+    shown = None
+    try:
+        while not query.wait(PROGRESS_INTERVAL):
+            if query.progress is not shown:
+                shown = query.progress
+                preview(shown)
+    finally:
+        if not query.wait(0):
+            query.cancel()
+    return query.result()
+
+
+def compute_choropleth(location : str, date : datetime.date, time : datetime.time, earliest_departure : datetime.time, features, profile : bool = False, preview=None):
+    """Returns the choropleth data, the feature of every stop, the compute_map result, the geojson and the query report."""
+    time_in_seconds = time.hour * 3600 + time.minute * 60
+    earliest_departure_in_seconds = earliest_departure.hour * 3600 + earliest_departure.minute * 60
+    params = {"location": location, "date": date, "time": time, "earliest_departure": earliest_departure}
+    result_cache = get_result_cache()
+    store = get_result_store()
+    def compute(**kwargs):
+        return result_cache.get(location, date, time_in_seconds, earliest_departure_in_seconds, store=store, **kwargs)
+    stop_to_journey_information, query_report, profile_paths = run_query(
+        f"{location}, {date}, {time}, {earliest_departure}", "compute_choropleth", params, profile, compute, preview
+    )
+    with instrumentation.resume(query_report, trace_memory=profile):
+        data, stop_to_feature, geojson = build_choropleth_data(stop_to_journey_information, "departure", "max", "latest_departure", features)
+    return data, stop_to_feature, stop_to_journey_information, geojson, {**query_report.as_dict(), "profile": profile_paths}
 
 
+def compute_isochrone_choropleth(location : str, date : datetime.date, time : datetime.time, travel_time : int, features, profile : bool = False, preview=None):
+    """Returns the choropleth data, the feature of every stop, the compute_isochrone result, the geojson and the query report."""
     time_in_seconds = time.hour * 3600 + time.minute * 60
-    earliest_departure_in_seconds = earliest_departure.hour * 3600 + earliest_departure.minute * 60
-    stop_to_journey_information = compute_map(location, date, time_in_seconds, earliest_departure_in_seconds)
-    coord_to_stops = {}
-    for id,val in stop_to_journey_information.items():
-        key = (val["lon"], val["lat"])
-        if key not in coord_to_stops:
-            coord_to_stops[key] = []
-        coord_to_stops[key].append(id)
-    
-    geojson = get_geojson().get_geojson()
-    feature_id_to_stops = group_stops_by_feature(coord_to_stops, geojson)
-
-    data = pd.DataFrame({
-        "id": feature_id_to_stops.keys(),
-        "values": [
-            [{"id": stop_id, **stop_to_journey_information[stop_id]} for stop_id in (stop_ids or [])]
-            for stop_ids in feature_id_to_stops.values()
-        ]
+    params = {"location": location, "date": date, "time": time, "travel_time": travel_time}
+    def compute(**kwargs):
+        return compute_isochrone(location, date, time_in_seconds, travel_time * 60, **kwargs)
+    stop_to_journey_information, query_report, profile_paths = run_query(
+        f"{location}, {date}, {time}, {travel_time} min", "compute_isochrone", params, profile, compute, preview
+    )
+    with instrumentation.resume(query_report, trace_memory=profile):
+        data, stop_to_feature, geojson = build_choropleth_data(stop_to_journey_information, "arrival", "min", "earliest_arrival", features)
+    return data, stop_to_feature, stop_to_journey_information, geojson, {**query_report.as_dict(), "profile": profile_paths}
+
+
+def get_accumulation_layout(data, stop_to_feature, mapping, geojson_data):
+    """The order of the features and stops in the arrays stored per query in
+    the QueryStore session_state["queries"], the feature of every stop and the geojson to draw."""
+    return {
+        "feature_ids": data["id"].tolist(),
+        "stop_ids": list(mapping.keys()),
+        "stop_to_feature": stop_to_feature.astype(np.int32),
+        "geojson": geojson_data,
+    }
+
+
+def itinerary_table(journey_index : JourneyIndex, stop_ids, mapping):
+    """One row per leg of the journeys from stop_ids to the destination."""
+    import pandas as pd
+    legs = journey_index.legs(stop_ids)
+    mapping_names = {stop_id: mapping[stop_id]["name"] for stop_id in stop_ids}
+    return pd.DataFrame({
+        "origin": [mapping_names[stop_ids[journey]] for journey in legs["journey"]],
+        "leg": legs["leg"] + 1,
+        "type": ["walk" if trip_id == TRANSFER else "ride" for trip_id in legs["trip_id"]],
+        "departure": [seconds_to_time(seconds) for seconds in legs["departure"].tolist()],
+        "from": legs["from_name"],
+        "arrival": [seconds_to_time(seconds) for seconds in legs["arrival"].tolist()],
+        "to": legs["to_name"],
+        "stops": legs["stops"],
+        "trip": [None if trip_id == TRANSFER else trip_id for trip_id in legs["trip_id"]],
     })
-    data["latest_departure_time"] = data["values"].map(get_latest_departure_time)
-    data["latest_departure_minutes"] = data["latest_departure_time"].map(parse_time)
-    data["latest_departure_string"] = data["latest_departure_time"].map(time_to_iso)
-    data.set_index("id", drop=False, inplace=True)
 
-    for feature in geojson["features"]:
-        feature["properties"]["id"] = feature["id"]
-        feature["properties"]["departure"] = data.loc[feature["id"]]["latest_departure_string"]
 
-    return data, stop_to_journey_information, geojson
+def draw_choropleth(m, data, geojson_data, key : str, value_column : str):
+    """Colours the features by data[value_column], e.g. {column}_minutes or one of the statistics."""
+    choropleth = folium.Choropleth(
+        geo_data=geojson_data,
+        data=data,
+        columns=["id", value_column],
+        key_on="feature.id"
+    ).add_to(m)
 
+    choropleth.geojson.add_child(
+        folium.features.GeoJsonTooltip([key, "median", "p90", "count"] + (["population"] if "population" in data else []))
+    )
 
 
+def preview_partial_result(placeholder, key : str, reduce : str, column : str, features):
+    """Returns a callback drawing the stops settled so far into placeholder."""
+    def preview(partial):
+        data, _, geojson_data = build_choropleth_data(partial, key, reduce, column, features, partial=True)
+        preview_map = folium.Map(tiles="cartodb positron", location=(46.823673, 8.399077), zoom_start=8)
+        draw_choropleth(preview_map, data, geojson_data, key, f"{column}_minutes")
+        with placeholder.container():
+            st.caption(f"Computing... {len(partial)} stops settled so far.")
+            components.html(preview_map.get_root().render(), width=900, height=600)
+    return preview
+
 
 @st.cache_data
 def get_stop_names():
+    """Stop names from the index built by `python -m src.traversal.stop_index`,
+    falls back to querying the database. The index is read without connecting
+    to the database, check_stop_index rebuilds it if it is out of date."""
+    stop_names = load_stop_names(STOP_INDEX)
+    if stop_names is not None:
+        return stop_names
     all_stop_names = get_all_stop_names()
     return sorted(set(all_stop_names))
 
 
+@st.cache_resource
+def check_stop_index():
+    """Rebuilds a stop index of another timetable once per process. Called
+    before the first query, which needs the database anyway."""
+    if refresh_stop_index(STOP_INDEX):
+        get_stop_names.clear()
+
+
 trainstations = get_stop_names()
 st.header("Public Transport Map")
 if "queries" not in st.session_state:
-    st.session_state["queries"] = {}
+    st.session_state["queries"] = QueryStore()
+
+mode = st.sidebar.radio(
+    label="Mode",
+    options=[LATEST_DEPARTURE, REACHABILITY],
+    key="mode",
+    help="Latest departure: when to leave to reach the destination in time. Reachability: where to get from the origin within the travel time."
+)
 
 with st.sidebar.form("Selection", border=False):
     preset_location, preset_date, preset_time, preset_earliest_dep = st.session_state.get(
@@ -110,7 +328,11 @@ with st.sidebar.form("Selection", border=False):
         index=preset_location,
         options=trainstations,
         key="location",
-        help="Select a destination. Start typing a trainstation name to narrow down the suggestions."
+        help=(
+            "Select a destination. Start typing a trainstation name to narrow down the suggestions."
+            if mode == LATEST_DEPARTURE else
+            "Select an origin. Start typing a trainstation name to narrow down the suggestions."
+        )
     )
 
     date = st.date_input(
@@ -126,34 +348,111 @@ with st.sidebar.form("Selection", border=False):
         label="Time",
         value=preset_time,
         key="time",
-        help="Specify the time before which you want to reach your destination."
+        help=(
+            "Specify the time before which you want to reach your destination."
+            if mode == LATEST_DEPARTURE else
+            "Specify the time at which you leave the origin."
+        )
     )
 
-    earliest_departure = st.time_input(
-        label="Earliest Departure",
-        value=preset_earliest_dep,
-        key="earliest_departure",
-        help="Specify the earliest departure time."
-    )
+    if mode == LATEST_DEPARTURE:
+        earliest_departure = st.time_input(
+            label="Earliest Departure",
+            value=preset_earliest_dep,
+            key="earliest_departure",
+            help="Specify the earliest departure time."
+        )
+    else:
+        earliest_departure = preset_earliest_dep
+        travel_time = st.number_input(
+            label="Travel Time",
+            min_value=1,
+            max_value=600,
+            value=30,
+            step=5,
+            key="travel_time",
+            help="Specify the maximum travel time in minutes."
+        )
     
+    profile = st.checkbox(
+        label="Profile",
+        value=False,
+        key="profile",
+        help="Record a profile and the peak memory of this query. The flamegraph is written to the profiles directory."
+    )
+
     submitted = st.form_submit_button("Submit")
- 
 
-print(location, date, time)
+granularity = st.sidebar.selectbox(
+    label="Granularity",
+    options=list(GRANULARITIES),
+    key="granularity",
+    help="Aggregate the stops per municipality or per cell of a regular grid. Changing it re-aggregates the result without recomputing the query."
+)
+features = get_features(granularity)
+
+statistic = st.sidebar.selectbox(
+    label="Colour by",
+    options=list(COLOUR_BY),
+    format_func=COLOUR_BY.get,
+    key="statistic",
+    help="Statistic of the stops of every feature. Changing it redraws the map without recomputing the query."
+)
+
+with st.sidebar.expander("Cache"):
+    st.json(get_result_cache().stats())
+    st.json(st.session_state["queries"].stats())
+ 
 
 m = folium.Map(tiles="cartodb positron", location=(46.823673, 8.399077), zoom_start=8)
 
-data, mapping, geojson_data = compute_choropleth(location, date, time, earliest_departure)
-choropleth = folium.Choropleth(
-    geo_data=geojson_data,
-    data=data,
-    columns=["id", "latest_departure_minutes"],
-    key_on="feature.id"
-).add_to(m)
+if not submitted and "last_query" not in st.session_state:
+    # Nothing is computed before the first submit, so the first page only needs the form and the base map
+    st.info("Select a location and submit to draw the map.")
+    st_folium(m, width=900, height=600)
+    st.stop()
 
-choropleth.geojson.add_child(
-    folium.features.GeoJsonTooltip(["departure"])
-)
+import pandas as pd
+
+if mode == LATEST_DEPARTURE:
+    key, column = "departure", "latest_departure"
+    query_key = (mode, location, date, time, earliest_departure, profile)
+else:
+    key, column = "arrival", "earliest_arrival"
+    query_key = (mode, location, date, time, travel_time, profile)
+
+# Reruns of the script (e.g. clicking on the map) reuse the result of the same query
+last_query_key, result = st.session_state.get("last_result", (None, None))
+if last_query_key != query_key:
+    progress_placeholder = st.empty()
+    check_stop_index()
+    try:
+        if mode == LATEST_DEPARTURE:
+            preview = preview_partial_result(progress_placeholder, key, "max", column, features)
+            result = compute_choropleth(location, date, time, earliest_departure, features, profile, preview)
+        else:
+            preview = preview_partial_result(progress_placeholder, key, "min", column, features)
+            result = compute_isochrone_choropleth(location, date, time, travel_time, features, profile, preview)
+    except UnknownLocation as e:
+        # the stop names are out of date, the next run loads them again
+        get_stop_names.clear()
+        progress_placeholder.empty()
+        st.error(str(e))
+        st.stop()
+    progress_placeholder.empty()
+    st.session_state["last_result"] = (query_key, result)
+    st.session_state["last_granularity"] = granularity
+data, stop_to_feature, mapping, geojson_data, query_report = result
+if st.session_state["last_granularity"] != granularity:
+    # another granularity only re-aggregates the result
+    data, stop_to_feature, geojson_data = build_choropleth_data(mapping, key, "max" if mode == LATEST_DEPARTURE else "min", column, features)
+    st.session_state["last_result"] = (query_key, (data, stop_to_feature, mapping, geojson_data, query_report))
+    st.session_state["last_granularity"] = granularity
+with st.sidebar.expander("Debug"):
+    st.caption("Timings and counters of the query when it was computed. Results served from the cache show the cache hit.")
+    st.json(query_report)
+
+draw_choropleth(m, data, geojson_data, key, f"{column}_minutes" if statistic == DEFAULT_STATISTIC else statistic)
 
 
 col1, col2 = st.columns([0.7, 0.3])
@@ -162,54 +461,47 @@ with col1:
 
 edited_df = None
 with col2:
-    geojson = get_geojson()
     last_clicked = st_data["last_clicked"]
     if last_clicked is not None:
         st.subheader("Stations")
-        feature_clicked = geojson.get_feature_covering_lat_lon(last_clicked["lat"], last_clicked["lng"])
+        feature_clicked = features.get_feature_covering_lat_lon(last_clicked["lat"], last_clicked["lng"])
         if feature_clicked is not None:
             id = feature_clicked["id"]
-            d = pd.DataFrame(data.loc[id]["values"]).sort_values("departure", ascending=False)
+            mapping_stop_ids = list(mapping.keys())
+            d = pd.DataFrame([
+                {"id": mapping_stop_ids[idx], **mapping[mapping_stop_ids[idx]]}
+                for idx in np.flatnonzero(stop_to_feature == data.index.get_loc(id))
+            ], columns=["id", "name", key]).sort_values(key, ascending=(mode == REACHABILITY))
             d["select_stop"] = False
             edited_df = st.data_editor(
-                d[["name", "departure", "select_stop", "id"]], 
+                d[["name", key, "select_stop", "id"]], 
                 hide_index=True,
-                disabled=("departure", "name", "id"),
+                disabled=(key, "name", "id"),
                 column_config={
                     "id": None
                 }
             )
 
-    if edited_df is not None:
-        first_selected_row = edited_df.loc[edited_df["select_stop"]]
-        if len(first_selected_row) > 0:
-            st.subheader("Itinerary")
-            values = []
-            current_stop_id = first_selected_row.iloc[0]["id"]
-            while True:
-                value = mapping[current_stop_id]
-                values.append(value)
-                if value["name"] == location:
-                    break
-                current_stop_id = value["pred"]
-            table = []
-            groups = [(k, list(v)) for k,v in groupby(values, key=lambda v: v["trip_id"])]
-            for (trip_id1, grp1), (trip_id2, grp2) in zip(groups, groups[1:]):
-                type = "walk" if trip_id1 == "transfer" else "ride"
-                start = list(grp1)[0]
-                end = list(grp2)[0]
-                table.append({
-                    "departure": start["departure"],
-                    "from": start["name"],
-                    "type": type,
-                    "to": end["name"],
-                })
-
-            st.dataframe(pd.DataFrame(table), hide_index=True)
+    if edited_df is not None and mode == LATEST_DEPARTURE:
+        # the itineraries of the selected stops, of all stops of the feature if none is selected
+        selected = edited_df.loc[edited_df["select_stop"]]
+        stop_ids = (selected if len(selected) > 0 else edited_df)["id"].tolist()
+        st.subheader("Itineraries")
+        st.dataframe(itinerary_table(mapping.journey_index(), stop_ids, mapping), hide_index=True)
 
 
 st.session_state["last_query"] = (trainstations.index(location), date, time, earliest_departure)
-st.session_state["queries"][(location, date, time, earliest_departure)] = (data, mapping, geojson_data)
+if mode == LATEST_DEPARTURE:
+    # the cumulative page accumulates these arrays, see accumulation_layout
+    if "accumulation_layout" not in st.session_state:
+        st.session_state["accumulation_layout"] = get_accumulation_layout(data, stop_to_feature, mapping, geojson_data)
+    # the features of the layout, which keeps the granularity of the first query
+    layout = st.session_state["accumulation_layout"]
+    stops = to_minutes(value["departure"] for value in mapping.values())
+    st.session_state["queries"].put((location, date, time, earliest_departure), {
+        "features": feature_statistics(stops, layout["stop_to_feature"], len(layout["feature_ids"]))["max"].astype(np.float32),
+        "stops": stops,
+    })
 
 
 
@@ -1,15 +1,45 @@
 
 
 import folium
+import json
+import os
+import numpy as np
 import pandas as pd
 import streamlit as st
 from streamlit_folium import st_folium
 
+from src.choropleth.accumulation import accumulate, aggregate_stops
+from src.choropleth.grid import Grid, load_population_raster
+from src.helpers.query_store import QueryStore
 from src.helpers.utils import parse_time
+from src.traversal.algorithm import get_locations
+
+PER_FEATURE = "Per feature"
+PER_STOP = "Per stop"
+# Optional {stop_id: population} used to weight the stops of a feature
+STOP_POPULATION = "data/stop_population.json"
+# Otherwise the population of the cells of this many metres in the optional
+# raster is split between the stops in them, see load_population_raster
+POPULATION_RASTER = "data/population.npz"
+POPULATION_CELL_SIZE = 500
+
+
+@st.cache_data
+def get_stop_population(stop_ids):
+    """Population of every stop in stop_ids order, None if there is no population data."""
+    if os.path.exists(STOP_POPULATION):
+        with open(STOP_POPULATION, "r", encoding="utf-8") as f:
+            population = json.load(f)
+        return np.array([population.get(stop_id, 0) for stop_id in stop_ids], dtype=np.float64)
+    if os.path.exists(POPULATION_RASTER):
+        locations = {stop_id: (lat, lon) for stop_id, _, lat, lon in get_locations()}
+        grid = Grid(POPULATION_CELL_SIZE, [locations[stop_id][0] for stop_id in stop_ids], [locations[stop_id][1] for stop_id in stop_ids])
+        return grid.get_stop_population(load_population_raster(POPULATION_RASTER))
+    return None
 
 
 if "queries" not in st.session_state:
-    st.session_state["queries"] = {}
+    st.session_state["queries"] = QueryStore()
     
 
 queries = st.session_state["queries"]
@@ -33,6 +63,15 @@ with st.sidebar.form("Accumulation", border=False):
                 step=1
             )
         })
+    aggregation = st.radio(
+        label="Aggregation",
+        options=[PER_FEATURE, PER_STOP],
+        help=(
+            "Per feature: accumulate the latest departure of each feature. "
+            "Per stop: accumulate every stop, then average the stops of each feature, "
+            "weighted by population if available."
+        )
+    )
     submitted = st.form_submit_button("Submit")
 
 if accumulation_table is not None:
@@ -40,21 +79,28 @@ if accumulation_table is not None:
     if num == 0:
         st.write("No queries selected. Increase the count of queries to show an accumulation map.")
     else:
-        accumulated_data = None
-        for _, row in accumulation_table.iterrows():
-            if row["count"] > 0:
-                print(f"Computing: {row['location']}, {row['date']}, {row['time']}, {row['earliest_departure']}")
-                data, _, geojson_data = queries[(
-                    row["location"], row["date"], row["time"], row["earliest_departure"]
-                )]
-                if accumulated_data is None:
-                    accumulated_data = pd.DataFrame({"id": data["id"], "commute": 0})    
-                accumulated_data["commute"] += row["count"] * (parse_time(row["time"]) - data["latest_departure_minutes"])
-                
-        print(accumulated_data)
+        layout = st.session_state["accumulation_layout"]
+        # only the selected queries are loaded, older ones may have been offloaded to disk
+        selected = accumulation_table[accumulation_table["count"] > 0]
+        keys = list(selected[["location", "date", "time", "earliest_departure"]].itertuples(index=False, name=None))
+        counts = selected["count"].to_numpy()
+        arrivals = np.array([parse_time(time) for time in selected["time"]], dtype=np.float32)
+        if aggregation == PER_FEATURE:
+            departures = np.stack([queries.get(key)["features"] for key in keys])
+            commute = accumulate(departures, arrivals, counts)
+        else:
+            departures = np.stack([queries.get(key)["stops"] for key in keys])
+            commute = aggregate_stops(
+                accumulate(departures, arrivals, counts),
+                layout["stop_to_feature"],
+                len(layout["feature_ids"]),
+                get_stop_population(layout["stop_ids"])
+            )
+        accumulated_data = pd.DataFrame({"id": layout["feature_ids"], "commute": commute})
+
         m = folium.Map(tiles="cartodb positron", location=(46.823673, 8.399077), zoom_start=8)
         choropleth = folium.Choropleth(
-            geo_data=geojson_data,
+            geo_data=layout["geojson"],
             data=accumulated_data,
             columns=["id", "commute"],
             key_on="feature.id"
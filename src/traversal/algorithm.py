@@ -1,18 +1,29 @@
-from sqlalchemy import create_engine, text
 import datetime
 import json
+import sys
 import click
 import time
+import numpy as np
 
-from src.traversal.config import DATABASE_URI
+from src.helpers import instrumentation, profiling
 from src.traversal.priority_queue import PriorityQueue
+from src.traversal.timetable import get_default_timetable
 
 NEG_INFTY = -1
 SECONDS_TO_CHANGE = 120
 TRANSFER = "transfer"
+# engines of compute_map
+DIJKSTRA = "dijkstra"
+TRIP_BASED = "trip"
+COMPILED = "compiled"
 
-engine = create_engine(DATABASE_URI)
-conn = engine.connect()
+
+class QueryCancelled(Exception):
+    """Raised by the traversal when its cancel event is set."""
+
+
+class UnknownLocation(ValueError):
+    """Raised when the location of a query is not a stop name of the timetable."""
 
 
 def parse_date(datestr):
@@ -31,82 +42,28 @@ def parse_time(timestr):
     return 3600 * int(hh) + 60 * int(mm)
 
 
-def seconds_to_interval(seconds):
-    """Database represents times as intervals."""
-    return datetime.timedelta(seconds=seconds)
-
-def interval_to_seconds(interval : datetime.timedelta):
-    """We represent times as integers in seconds after midnight."""
-    return int(interval.total_seconds())
-    
-
-def get_edges_in_timerange(date : datetime.date, start_time : int, end_time : int):
-    '''
-    assumes start_time and end_time to be seconds since midnight
-    '''
-    print(f"Query edges: {start_time} - {end_time}")
-    day = [
-        'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'
-    ][date.weekday()]
-    start_time_interval = seconds_to_interval(start_time)
-    end_time_interval = seconds_to_interval(end_time)
-    
-    query = """
-    SELECT from_stop_id, to_stop_id, departure, arrival, trip_id
-    FROM edges
-    WHERE departure >= INTERVAL '{}'
-    AND departure <= INTERVAL '{}'
-    AND {} = 1
-    AND start_date <= '{}'::date
-    AND end_date >= '{}'::date;
-    """.format(start_time_interval, end_time_interval, day, date, date)
-
-    stmt = text(query)
-    edges = [
-        (src, dst, interval_to_seconds(dep), interval_to_seconds(arr), trip_id)
-        for src, dst, dep, arr, trip_id in conn.execute(stmt).fetchall()
-    ]
-    return edges
-
-def get_in_edges_in_timerange(date : datetime.date, start_time : int, end_time : int):
-    start = time.time()
-    in_edges = {}
-    edges = get_edges_in_timerange(date, start_time, end_time)
-    for src, dst, dep, arr, trip_id in edges:
-        if dst not in in_edges:
-            in_edges[dst] = set()
-        in_edges[dst].add((src, dep, arr, trip_id))
-    end = time.time()
-    print(f"Querying took {end - start} seconds")
-    return in_edges
-
-def get_transfers():
-    query = """
-    SELECT from_stop_id, to_stop_id, min_transfer_time
-    FROM transfer
-    WHERE transfer_type = 2;
-    """
-    stmt = text(query)
-    transfers = conn.execute(stmt).fetchall()
-    return transfers
-
-def get_in_transfers():
-    transfers = get_transfers()
-    in_transfers = {}
-    for src, dst, transfer_time in transfers:
-        if dst not in in_transfers:
-            in_transfers[dst] = []
-        in_transfers[dst].append((src, transfer_time))
-    return in_transfers
+def seconds_to_time(seconds):
+    """Converts seconds since midnight to a datetime.time, NEG_INFTY to None.
+    Times after midnight (GTFS allows e.g. 25:10) wrap around."""
+    if seconds < 0:
+        return None
+    return datetime.time(hour=(seconds // 3600) % 24, minute=(seconds % 3600) // 60)
+
+def print_time(time : datetime.time):
+    """Formats a time of the result of compute_map as hh:mm, "NA" if unreachable."""
+    if time is None:
+        return "NA"
+    return time.strftime("%H:%M")
+
 
 def get_locations():
-    query = """
-    SELECT stop_id, stop_name, stop_lat, stop_lon
-    FROM stop;
-    """
-    stmt = text(query)
-    stops = conn.execute(stmt).fetchall()
-    return stops
+    return get_default_timetable().get_locations()
+
+def get_service_pattern(date : datetime.date):
+    return get_default_timetable().get_service_pattern(date)
+
+def get_timetable_version():
+    return get_default_timetable().get_version()
 
 def get_all_stop_names():
     locations = get_locations()
@@ -115,109 +72,486 @@ def get_all_stop_names():
     ]
 
 
-def traverse(location_dict, start_id : str, date : datetime.date, earliest_departure : int):
+def traverse(location_dict, start_id : str, date : datetime.date, earliest_departure : int, targets=None, stats=None, timetable=None, progress=None, cancel=None):
+    """Latest-departure search towards start_id.
+    Only stops that are reached enter the queue.
+    Edges and transfers come from timetable (the database by default).
+
+    If targets (a set of stop_ids) is given, the traversal stops as soon as all
+    targets are settled. Stops that are not settled by then are reset to
+    NEG_INFTY, as their departure may not be final.
+    Besides pred and trip_id, every reached stop records pred_arrival, the
+    arrival at pred on that trip (or walk), so journeys can be reconstructed
+    with exact times.
+    If stats (a dict) is given, it receives the number of settled nodes,
+    relaxed edges, queue updates and loaded time windows.
+
+    Before loading the next time window, progress (if given) is called with
+    the set of settled stop_ids, whose entries in location_dict are final, and
+    QueryCancelled is raised if cancel (a threading.Event) is set.
+    """
     def update_neighbors(node):
+        nonlocal num_edges
         departure = location_dict[node]["departure"]
         from_trip_id = location_dict[node]["trip_id"]
-        for src, dep, arr, to_trip_id in in_edges.get(node, []):
+        node_in_edges = in_edges.get(node, [])
+        node_in_transfers = in_transfers.get(node, [])
+        num_edges += len(node_in_edges) + len(node_in_transfers)
+        for src, dep, arr, to_trip_id in node_in_edges:
             if src not in fixed and src in location_dict and (
                 (arr <= departure and from_trip_id in [to_trip_id, TRANSFER])
                 or (arr <= departure - SECONDS_TO_CHANGE)
             ):
-                updated = q.update(src, dep)
-                if updated:
-                    location_dict[src]["pred"] = node
-                    location_dict[src]["departure"] = dep
-                    location_dict[src]["trip_id"] = to_trip_id
-        for src, transfer_time in in_transfers.get(node, []):
+                reach(src, dep, node, to_trip_id, arr)
+        for src, transfer_time in node_in_transfers:
             if src not in fixed and src in location_dict:
-                updated = q.update(src, departure-transfer_time)
-                if updated:
-                    location_dict[src]["pred"] = node
-                    location_dict[src]["departure"] = departure-transfer_time
-                    location_dict[src]["trip_id"] = TRANSFER
+                reach(src, departure - transfer_time, node, TRANSFER, departure)
+
+    def reach(node, departure, pred, trip_id, pred_arrival):
+        nonlocal num_updates
+        if q.contains(node):
+            updated = q.update(node, departure)
+        else:
+            q.add(node, departure)
+            updated = True
+        if updated:
+            num_updates += 1
+            location_dict[node]["pred"] = pred
+            location_dict[node]["departure"] = departure
+            location_dict[node]["trip_id"] = trip_id
+            location_dict[node]["pred_arrival"] = pred_arrival
 
+    timetable = timetable or get_default_timetable()
+    num_settled = num_edges = num_updates = num_windows = 0
+    remaining_targets = None if targets is None else set(targets) - {start_id}
     q = PriorityQueue(lambda x: -x)
     fixed = set([start_id])
-    for id, location in location_dict.items():
-        q.add(id, location["departure"])
+    # fixed in the order of settling, windows are extended from it so ties resolve reproducibly
+    settled = []
+    q.add(start_id, location_dict[start_id]["departure"])
     time_increment = 3600
     time_ub = location_dict[start_id]["departure"]
     time_lb = max(time_ub - time_increment, earliest_departure)
-    in_edges = get_in_edges_in_timerange(date, time_lb, time_ub)
-    in_transfers = get_in_transfers()
-    while q.size() > 0 and time_ub > earliest_departure:
-        # TODO: the traversal is naive in that it does not consider that changing
-        # the connection takes 2 minutes while staying on the same train does not
-        # require any changing time
-        id, departure = q.peek()
-        if departure == NEG_INFTY:
+    in_edges = timetable.get_in_edges_in_timerange(date, time_lb, time_ub)
+    in_transfers = timetable.get_in_transfers()
+    num_windows += 1
+    while time_ub > earliest_departure:
+        # one label per stop: a later departure that needs a change can hide an
+        # earlier one on the same trip, see trip_based.traverse_trips
+        if remaining_targets is not None and len(remaining_targets) == 0:
+            break
+        if q.size() == 0:
+            # no stop is reachable within the current window, extend it
+            if progress is not None:
+                progress(fixed)
+            if cancel is not None and cancel.is_set():
+                raise QueryCancelled()
             time_lb = max(time_lb - time_increment, earliest_departure)
             time_ub = max(time_ub - time_increment, earliest_departure)
-            in_edges = get_in_edges_in_timerange(date, time_lb, time_ub)
-            for dst in fixed:
+            # release the previous window before loading the next one
+            in_edges = None
+            in_edges = timetable.get_in_edges_in_timerange(date, time_lb, time_ub)
+            num_windows += 1
+            for dst in settled:
                 update_neighbors(dst)
         else:
-            q.pop()
+            id, _ = q.pop()
+            fixed.add(id)
+            settled.append(id)
+            num_settled += 1
+            if remaining_targets is not None:
+                remaining_targets.discard(id)
+            update_neighbors(id)
+
+    if remaining_targets is not None:
+        for id, location in location_dict.items():
+            if id not in fixed and location["departure"] != NEG_INFTY:
+                location["departure"] = NEG_INFTY
+                location["pred"] = None
+                location["trip_id"] = None
+                location["pred_arrival"] = NEG_INFTY
+
+    instrumentation.count("nodes_settled", num_settled)
+    instrumentation.count("edges_relaxed", num_edges)
+    instrumentation.count("queue_updates", num_updates)
+    instrumentation.count("window_reloads", num_windows - 1)
+    if stats is not None:
+        stats["nodes_settled"] = num_settled
+        stats["edges_relaxed"] = num_edges
+        stats["queue_updates"] = num_updates
+        stats["windows"] = num_windows
+    return location_dict
+
+
+def traverse_forward(location_dict, start_id : str, date : datetime.date, latest_arrival : int, timetable=None, progress=None, cancel=None):
+    """Earliest-arrival search from start_id, the forward counterpart of traverse.
+    Only edges arriving by latest_arrival are loaded and relaxed, so the search
+    ends as soon as the time budget is used up.
+    progress and cancel are handled at window boundaries as in traverse."""
+    def update_neighbors(node):
+        arrival = location_dict[node]["arrival"]
+        from_trip_id = location_dict[node]["trip_id"]
+        for dst, dep, arr, to_trip_id in out_edges.get(node, []):
+            if arr <= latest_arrival and dst not in fixed and dst in location_dict and (
+                (dep >= arrival and from_trip_id in [to_trip_id, TRANSFER])
+                or (dep >= arrival + SECONDS_TO_CHANGE)
+            ):
+                reach(dst, arr, node, to_trip_id)
+        for dst, transfer_time in out_transfers.get(node, []):
+            if arrival + transfer_time <= latest_arrival and dst not in fixed and dst in location_dict:
+                reach(dst, arrival + transfer_time, node, TRANSFER)
+
+    def reach(node, arrival, pred, trip_id):
+        # only reached stops enter the queue
+        if q.contains(node):
+            updated = q.update(node, arrival)
+        else:
+            q.add(node, arrival)
+            updated = True
+        if updated:
+            location_dict[node]["pred"] = pred
+            location_dict[node]["arrival"] = arrival
+            location_dict[node]["trip_id"] = trip_id
+
+    timetable = timetable or get_default_timetable()
+    q = PriorityQueue(lambda x: x)
+    fixed = set()
+    q.add(start_id, location_dict[start_id]["arrival"])
+    time_increment = 3600
+    time_lb = location_dict[start_id]["arrival"]
+    time_ub = min(time_lb + time_increment, latest_arrival)
+    out_edges = timetable.get_out_edges_in_timerange(date, time_lb, time_ub)
+    out_transfers = timetable.get_out_transfers()
+    while True:
+        # edges departing after time_ub are not loaded yet, so only stops
+        # reached by time_ub are final
+        if q.size() > 0 and (q.peek()[1] <= time_ub or time_ub >= latest_arrival):
+            id, _ = q.pop()
             fixed.add(id)
+            instrumentation.count("nodes_settled")
             update_neighbors(id)
+        elif time_ub < latest_arrival:
+            if progress is not None:
+                progress(fixed)
+            if cancel is not None and cancel.is_set():
+                raise QueryCancelled()
+            time_lb = time_ub
+            time_ub = min(time_ub + time_increment, latest_arrival)
+            out_edges = None
+            out_edges = timetable.get_out_edges_in_timerange(date, time_lb, time_ub)
+            instrumentation.count("window_reloads")
+            for src in fixed:
+                update_neighbors(src)
+        else:
+            break
 
     return location_dict
 
 
-def compute_map(location : str, date : datetime.date, time : int, earliest_departure : int = 0):
+def get_location_dict(timetable, location : str, key : str, time : int, edge_key : str = None):
+    """Creates the initial mapping from stop_id to journey information
+    where only the stops named location are set to time.
+    edge_key (if given) is initialised to NEG_INFTY as well.
+    Raises UnknownLocation if no stop is named location."""
+    with instrumentation.stage("fetch_stops"):
+        locations = timetable.get_locations()
+    location_dict = {}
+    start_id = None
+    for id, name, lat, lon in locations:
+        location_dict[id] = {"name": name, "lat": lat, "lon": lon, key: NEG_INFTY, "pred": None, "trip_id": None}
+        if edge_key is not None:
+            location_dict[id][edge_key] = NEG_INFTY
+        if name == location:
+            start_id = id
+            location_dict[id][key] = time
+            location_dict[id]["trip_id"] = TRANSFER
+    if start_id is None:
+        raise UnknownLocation(f"Location {location} not in database.")
+    return location_dict, start_id
+
+
+def settled_callback(location_dict, key : str, progress):
+    """Wraps progress for traverse: converts the settled stops to the result format
+    of compute_map and compute_isochrone before the traversal continues."""
+    if progress is None:
+        return None
+    def callback(settled):
+        progress({
+            stop_id: {
+                **location_dict[stop_id],
+                **{
+                    time_key: seconds_to_time(location_dict[stop_id][time_key])
+                    for time_key in (key, "pred_arrival") if time_key in location_dict[stop_id]
+                }
+            }
+            for stop_id in settled
+        })
+    return callback
+
+
+def compute_map(
+    location : str, 
+    date : datetime.date, 
+    time : int, 
+    earliest_departure : int = 0, 
+    max_travel_time : int = None, 
+    bbox = None, 
+    targets = None, 
+    stats = None,
+    timetable = None,
+    progress = None,
+    cancel = None,
+    engine : str = DIJKSTRA,
+    low_memory : bool = False
+):
     """Creates a mapping from stop_id to
     {
         "name": str - Name of the stop ("Zell (Wiesental), Wilder Mann"),
         "lat": float - latitude of stop (47.710083),
         "lon": float - longitude of stop (7.8596478),
         "departure": datetime.time - latest possible departure (datetime.time(hour=12, minute=3)),
-        "pred": str - stop_id of the next stop on the shortest path to the destination ("1100417")
+        "pred": str - stop_id of the next stop on the shortest path to the destination ("1100417"),
+        "trip_id": str - trip_id of the connection to pred, "transfer" for walking,
+        "pred_arrival": datetime.time - arrival at pred on that connection
     }
     requires 
     - location to be a stop_name of a stop in the database
     - time to be given as seconds since midnight
+
+    The traversal can be bounded by
+    - max_travel_time: seconds, stops that need to leave earlier than time - max_travel_time are unreachable
+    - bbox: (min_lon, min_lat, max_lon, max_lat), only stops within the box are requested
+    - targets: iterable of stop_ids, only these stops are requested
+    Once all requested stops are settled the traversal ends and all other stops are unreachable.
+    stats is passed on to traverse.
+    timetable defaults to the database.
+
+    progress (if given) is called at every window boundary with the stops settled
+    so far, in the same format. If cancel (a threading.Event) is set the traversal
+    raises QueryCancelled at the next window boundary.
+
+    engine selects the search: DIJKSTRA (traverse, one label per stop), TRIP_BASED
+    (trip_based.traverse_trips, exact under SECONDS_TO_CHANGE) or COMPILED
+    (compiled.traverse_compiled, traverse compiled with numba, which falls back
+    to traverse if numba is not installed).
+
+    low_memory returns a read-only result.ArrayResult, one record per stop instead
+    of one dict, and leaves the search to engine. Its records keep the seconds of
+    the traversal and back ArrayResult.journey_index. Of the engines only DIJKSTRA
+    holds the edges of one hourly window at a time, the others load the
+    connections of the whole range.
     """
-    print(f"compute_map({location}, {date}, {time})")
-    locations = get_locations()
-    location_dict = {}
-    start_id = None
-    for id, name, lat, lon in locations:
-        location_dict[id] = {"name": name, "lat": lat, "lon": lon, "departure": NEG_INFTY, "pred": None, "trip_id": None}
-        if name == location:
-            start_id = id
-            location_dict[id]["departure"] = time
-            location_dict[id]["trip_id"] = TRANSFER
-    if start_id is None:
-        print(f"Location {location} not in database. Exiting.")
-        exit(1)
-        
-    traverse(location_dict, start_id, date, earliest_departure)
-    for stop_id in location_dict:
-        dep_in_seconds = location_dict[stop_id]["departure"]
-        if dep_in_seconds >= 0:
-            hours = dep_in_seconds // 3600
-            minutes = (dep_in_seconds % 3600) // 60
-            location_dict[stop_id]["departure"] = datetime.time(hour=hours, minute=minutes)
-        else:
-            location_dict[stop_id]["departure"] = None
+    timetable = timetable or get_default_timetable()
+    location_dict, start_id = get_location_dict(timetable, location, "departure", time, edge_key="pred_arrival")
+    if max_travel_time is not None:
+        earliest_departure = max(earliest_departure, time - max_travel_time)
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        targets = set(targets or []) | {
+            id for id, value in location_dict.items()
+            if min_lon <= value["lon"] <= max_lon and min_lat <= value["lat"] <= max_lat
+        }
+    search = traverse
+    if engine == TRIP_BASED:
+        from src.traversal.trip_based import traverse_trips
+        search = traverse_trips
+    elif engine == COMPILED:
+        from src.traversal.compiled import NUMBA, traverse_compiled
+        if NUMBA:
+            search = traverse_compiled
+    with instrumentation.stage("traversal"):
+        search(
+            location_dict, start_id, date, earliest_departure, targets=targets, stats=stats, timetable=timetable,
+            progress=settled_callback(location_dict, "departure", progress), cancel=cancel
+        )
+    with instrumentation.stage("result_conversion"):
+        if low_memory:
+            from src.traversal.result import ArrayResult, get_stop_table
+            return ArrayResult.from_labels(get_stop_table(timetable, list(location_dict)), location_dict)
+        for stop_id in location_dict:
+            location_dict[stop_id]["departure"] = seconds_to_time(location_dict[stop_id]["departure"])
+            location_dict[stop_id]["pred_arrival"] = seconds_to_time(location_dict[stop_id]["pred_arrival"])
+    return location_dict
+
+
+def date_range(start_date : datetime.date, end_date : datetime.date, weekdays=None):
+    """The dates from start_date to end_date (inclusive) whose weekday (0 is monday) is in weekdays, all if None."""
+    dates = [start_date + datetime.timedelta(days=days) for days in range((end_date - start_date).days + 1)]
+    return [date for date in dates if weekdays is None or date.weekday() in weekdays]
+
+
+def group_by_service_pattern(dates, timetable=None):
+    """Groups dates with the same service pattern, i.e. the same edges.
+    Returns a list of date lists in the order of their first date."""
+    timetable = timetable or get_default_timetable()
+    groups = {}
+    for date in dates:
+        groups.setdefault(timetable.get_service_pattern(date), []).append(date)
+    return list(groups.values())
+
+
+def compute_map_sweep(
+    location : str,
+    start_date : datetime.date,
+    end_date : datetime.date,
+    time : int,
+    earliest_departure : int = 0,
+    weekdays = None,
+    timetable = None,
+    **kwargs
+):
+    """compute_map for every date of date_range(start_date, end_date, weekdays).
+
+    Dates are grouped by service pattern and every pattern is computed once,
+    on its first date, so a sweep over a timetable year costs as many
+    traversals as there are distinct service days.
+    Returns {date: mapping}; dates with the same pattern share one mapping,
+    which must not be mutated. kwargs are passed on to compute_map.
+    """
+    timetable = timetable or get_default_timetable()
+    with instrumentation.stage("group_dates"):
+        groups = group_by_service_pattern(date_range(start_date, end_date, weekdays), timetable)
+    instrumentation.count("service_patterns", len(groups))
+    results = {}
+    for dates in groups:
+        mapping = compute_map(location, dates[0], time, earliest_departure, timetable=timetable, **kwargs)
+        for date in dates:
+            results[date] = mapping
+    return dict(sorted(results.items()))
+
+
+def sweep_departures(results, key : str = "departure"):
+    """Converts the result of compute_map_sweep to (dates, stop_ids, minutes), where
+    minutes is a (dates x stops) float32 array of the departures in minutes since
+    midnight, NaN if the stop is unreachable on that date."""
+    from src.choropleth.accumulation import to_minutes
+    dates = list(results.keys())
+    stop_ids = list(results[dates[0]].keys()) if len(dates) > 0 else []
+    minutes = np.empty((len(dates), len(stop_ids)), dtype=np.float32)
+    # dates sharing a mapping share its row
+    rows = {}
+    for idx, date in enumerate(dates):
+        mapping = results[date]
+        if id(mapping) not in rows:
+            rows[id(mapping)] = to_minutes(value[key] for value in mapping.values())
+        minutes[idx] = rows[id(mapping)]
+    return dates, stop_ids, minutes
+
+
+def compute_isochrone(location : str, date : datetime.date, time : int, max_duration : int, timetable=None, progress=None, cancel=None):
+    """Creates a mapping from stop_id to
+    {
+        "name": str - Name of the stop,
+        "lat": float - latitude of stop,
+        "lon": float - longitude of stop,
+        "arrival": datetime.time - earliest arrival when leaving location at time (None if not reachable within max_duration),
+        "pred": str - stop_id of the previous stop on the shortest path from location
+    }
+    requires
+    - location to be a stop_name of a stop in the database
+    - time and max_duration to be given in seconds
+    timetable defaults to the database, progress and cancel work as in compute_map.
+    """
+    timetable = timetable or get_default_timetable()
+    location_dict, start_id = get_location_dict(timetable, location, "arrival", time)
+    with instrumentation.stage("traversal"):
+        traverse_forward(
+            location_dict, start_id, date, time + max_duration, timetable=timetable,
+            progress=settled_callback(location_dict, "arrival", progress), cancel=cancel
+        )
+    with instrumentation.stage("result_conversion"):
+        for stop_id in location_dict:
+            location_dict[stop_id]["arrival"] = seconds_to_time(location_dict[stop_id]["arrival"])
     return location_dict
 
 
+def read_queries(lines):
+    """Parses one query per line: a json object with location, date (YYYY-MM-DD),
+    time and optionally earliest_departure (hh:mm). Blank lines are skipped."""
+    for line in lines:
+        if line.strip() == "":
+            continue
+        query = json.loads(line)
+        yield query["location"], query["date"], query["time"], query.get("earliest_departure", "00:00")
+
+
 @click.command()
-@click.argument("location")
-@click.argument("datestr")
-@click.argument("timestr")
-def main(location, datestr, timestr):
-    date = parse_date(datestr)
-    time = parse_time(timestr)
-    mapping = compute_map(location, date, time)
-    for id in mapping.keys():
-        time = mapping[id]["departure"]
-        if time is not None:
-            mapping[id]["departure"] = "{:02d}:{:02d}".format(time.hour, time.minute)
-    print(json.dumps(mapping, indent=4))
-    
+@click.argument("location", required=False)
+@click.argument("datestr", required=False)
+@click.argument("timestr", required=False)
+@click.option("--queries", "queries_file", default=None, type=click.File("r"), help="Answer the queries in this file (- for stdin) instead, one json object per line.")
+@click.option("--format", "output_format", default="json", type=click.Choice(["json", "ndjson", "arrow"]), help="json prints one indented mapping, ndjson and arrow stream the reachable stops query by query.")
+@click.option("--engine", default=DIJKSTRA, type=click.Choice([DIJKSTRA, TRIP_BASED, COMPILED]), help="Search used for latest departures.")
+@click.option("--isochrone", default=None, type=int, help="Travel time budget in minutes. Computes the earliest arrivals when leaving LOCATION at TIMESTR instead.")
+@click.option("--report", is_flag=True, help="Print stage timings and counters to stderr.")
+@click.option("--memory", is_flag=True, help="Record the peak memory of every stage with tracemalloc, implies --report.")
+@click.option("--low-memory", is_flag=True, help="Return results as arrays instead of one dict per stop, see compute_map.")
+@click.option("--profile", is_flag=True, help="Profile the query and write a flamegraph to PROFILE_DIR.")
+@click.option("--profile-threshold", default=None, type=float, help="Keep the profile only if the query takes longer than this many seconds.")
+@click.option("--profile-method", default="sampling", type=click.Choice(["sampling", "cprofile"]))
+def main(location, datestr, timestr, queries_file, output_format, engine, isochrone, report, memory, low_memory, profile, profile_threshold, profile_method):
+    """Computes the latest departures towards LOCATION to arrive by TIMESTR on DATESTR.
+
+    With --queries, the queries are read from a file and the results are
+    written to stdout as they are computed.
+    """
+    if queries_file is None:
+        if timestr is None:
+            raise click.UsageError("LOCATION, DATESTR and TIMESTR are required without --queries.")
+        queries = [(location, datestr, timestr, "00:00")]
+    else:
+        if output_format == "json":
+            raise click.UsageError("--queries requires --format ndjson or arrow.")
+        queries = read_queries(queries_file)
+    key = "departure" if isochrone is None else "arrival"
+
+    writer = None
+    out = sys.stdout.buffer
+    if output_format == "ndjson":
+        from src.traversal.output import NdjsonWriter
+        writer = NdjsonWriter(out)
+    elif output_format == "arrow":
+        from src.traversal.output import ArrowWriter
+        writer = ArrowWriter(out, key)
+
+    stop_names = None
+    for query_idx, (location, datestr, timestr, earliest_departure) in enumerate(queries):
+        if queries_file is not None:
+            # an unknown location must not end the whole batch
+            stop_names = stop_names or set(get_all_stop_names())
+            if location not in stop_names:
+                click.echo(f"Query {query_idx}: location {location} not in database, skipped.", err=True)
+                continue
+        date = parse_date(datestr)
+        time = parse_time(timestr)
+        params = {"location": location, "date": datestr, "time": timestr, "isochrone": isochrone}
+        with instrumentation.report(f"{location} {datestr} {timestr}", trace_memory=memory) as query_report, \
+                profiling.profile_query("compute_map", params, profile, profile_threshold, profile_method) as query_profile:
+            try:
+                if isochrone is None:
+                    mapping = compute_map(location, date, time, parse_time(earliest_departure), engine=engine, low_memory=low_memory)
+                else:
+                    mapping = compute_isochrone(location, date, time, isochrone * 60)
+            except UnknownLocation as e:
+                raise click.UsageError(str(e))
+        if report or memory:
+            click.echo(str(query_report), err=True)
+        for path in query_profile.paths:
+            click.echo(f"Wrote {path}", err=True)
+
+        if writer is not None:
+            writer.write(query_idx, mapping, key)
+            continue
+        # a low memory result is read-only
+        mapping = dict(mapping.items())
+        for id in mapping.keys():
+            time = mapping[id][key]
+            if time is not None:
+                mapping[id][key] = "{:02d}:{:02d}".format(time.hour, time.minute)
+        print(json.dumps(mapping, indent=4))
+    if writer is not None:
+        writer.close()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,131 @@
+import datetime
+import inspect
+import threading
+from collections import OrderedDict
+
+from src.helpers import instrumentation
+from src.traversal.algorithm import compute_map
+from src.traversal.result import ArrayResult
+from src.traversal.timetable import DAY
+
+# keyword arguments of compute_map that change the result, they are part of the cache key
+RESULT_OPTIONS = ("engine", "low_memory")
+# their defaults, so that passing a default and leaving it out share an entry
+RESULT_OPTION_DEFAULTS = {
+    name: parameter.default for name, parameter in inspect.signature(compute_map).parameters.items()
+    if name in RESULT_OPTIONS
+}
+
+
+class ResultCache:
+    """Size-bounded LRU cache in front of compute_map.
+
+    Entries are keyed on (location, service pattern, time, options,
+    earliest_departure), where the service pattern is whatever
+    `service_pattern(date)` returns for the query date and options are the
+    RESULT_OPTIONS passed to get, completed with the defaults of compute_map. Dates with the same pattern share all edges,
+    so their results are interchangeable.
+
+    A result computed for an earlier earliest_departure also answers queries
+    with a later one (same location, pattern and time): the latest departure
+    of a stop does not depend on the lower bound as long as it lies above it,
+    so the narrower result is obtained by dropping the stops that depart too
+    early.
+
+    The cache is thread-safe so a single instance can be shared by all
+    Streamlit sessions. Returned mappings are shared as well and must not be
+    mutated by the caller.
+    """
+
+    def __init__(self, compute, service_pattern, maxsize=32):
+        self._compute = compute
+        self._service_pattern = service_pattern
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        # (location, pattern, time, options) -> set of cached earliest departures
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "window_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, location : str, date : datetime.date, time : int, earliest_departure : int = 0, **kwargs):
+        """Same interface as compute_map. kwargs (e.g. progress and cancel)
+        are passed on to compute on a miss."""
+        options = tuple((name, kwargs.get(name, RESULT_OPTION_DEFAULTS[name])) for name in RESULT_OPTIONS)
+        window_key = (location, self._service_pattern(date), time, options)
+        with self._lock:
+            mapping = self._lookup(window_key, earliest_departure)
+        if mapping is not None:
+            return mapping
+
+        mapping = self._compute(location, date, time, earliest_departure, **kwargs)
+        with self._lock:
+            self._insert(window_key, earliest_departure, mapping)
+        return mapping
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._entries), "maxsize": self._maxsize}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._windows.clear()
+
+    def _lookup(self, window_key, earliest_departure):
+        key = (*window_key, earliest_departure)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            instrumentation.count("result_cache_hits")
+            return self._entries[key]
+
+        # the latest cached lower bound below the requested one needs the least filtering
+        candidates = [
+            cached for cached in self._windows.get(window_key, ())
+            if cached < earliest_departure
+        ]
+        if len(candidates) == 0:
+            self._stats["misses"] += 1
+            instrumentation.count("result_cache_misses")
+            return None
+        wider_key = (*window_key, max(candidates))
+        self._entries.move_to_end(wider_key)
+        self._stats["window_hits"] += 1
+        instrumentation.count("result_cache_window_hits")
+        _, _, time, _ = window_key
+        return restrict_to_window(self._entries[wider_key], earliest_departure, time)
+
+    def _insert(self, window_key, earliest_departure, mapping):
+        key = (*window_key, earliest_departure)
+        self._entries[key] = mapping
+        self._entries.move_to_end(key)
+        self._windows.setdefault(window_key, set()).add(earliest_departure)
+        while len(self._entries) > self._maxsize:
+            (*evicted_window, evicted_earliest), _ = self._entries.popitem(last=False)
+            evicted_window = tuple(evicted_window)
+            self._windows[evicted_window].discard(evicted_earliest)
+            if len(self._windows[evicted_window]) == 0:
+                del self._windows[evicted_window]
+            self._stats["evictions"] += 1
+
+
+def departure_seconds(departure : datetime.time, time : int):
+    """Seconds since midnight of a time of a compute_map result for the arrival
+    time time (seconds). Result times wrap around after midnight, departures
+    are the latest time of day at or before time."""
+    seconds = departure.hour * 3600 + departure.minute * 60
+    return seconds + (time - seconds) // DAY * DAY
+
+
+def restrict_to_window(mapping, earliest_departure : int, time : int = DAY - 1):
+    """Returns a copy of a compute_map result for the arrival time time in which
+    stops departing before earliest_departure (seconds since midnight) are unreachable."""
+    if isinstance(mapping, ArrayResult):
+        return mapping.restrict(earliest_departure)
+    restricted = {}
+    for stop_id, value in mapping.items():
+        departure = value["departure"]
+        if departure is not None and departure_seconds(departure, time) < earliest_departure:
+            value = {**value, "departure": None, "pred": None, "trip_id": None, "pred_arrival": None}
+        restricted[stop_id] = value
+    return restricted
@@ -0,0 +1,329 @@
+import datetime
+import numpy as np
+
+from src.helpers import instrumentation
+from src.traversal.algorithm import NEG_INFTY, SECONDS_TO_CHANGE, TRANSFER, QueryCancelled
+from src.traversal.timetable import get_default_timetable
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# compute_map falls back to algorithm.traverse without numba
+NUMBA = numba is not None
+# trip codes of the labels
+WALK = -2
+NO_TRIP = -1
+# counters of the kernels
+EDGES_RELAXED = 0
+QUEUE_UPDATES = 1
+NODES_SETTLED = 2
+REMAINING_TARGETS = 3
+
+
+def jit(function):
+    """Compiles function with numba if it is installed, otherwise the kernel runs as plain python."""
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def heap_less(heap, i, j):
+    return heap[i, 0] < heap[j, 0] or (heap[i, 0] == heap[j, 0] and heap[i, 1] < heap[j, 1])
+
+
+@jit
+def heap_push(heap, size, key, rank, node):
+    """Pushes (key, rank, node) onto the binary min-heap of the first size rows,
+    doubling heap when it is full. Returns the heap and its new size."""
+    if size == len(heap):
+        grown = np.empty((2 * len(heap), 3), dtype=np.int64)
+        grown[:size] = heap
+        heap = grown
+    heap[size, 0], heap[size, 1], heap[size, 2] = key, rank, node
+    child = size
+    while child > 0:
+        parent = (child - 1) // 2
+        if not heap_less(heap, child, parent):
+            break
+        for column in range(3):
+            heap[child, column], heap[parent, column] = heap[parent, column], heap[child, column]
+        child = parent
+    return heap, size + 1
+
+
+@jit
+def heap_pop(heap, size):
+    """Moves the smallest row to heap[size - 1] and restores the heap of the first size - 1 rows."""
+    last = size - 1
+    for column in range(3):
+        heap[0, column], heap[last, column] = heap[last, column], heap[0, column]
+    parent = 0
+    while True:
+        child = 2 * parent + 1
+        if child >= last:
+            break
+        if child + 1 < last and heap_less(heap, child + 1, child):
+            child += 1
+        if not heap_less(heap, child, parent):
+            break
+        for column in range(3):
+            heap[child, column], heap[parent, column] = heap[parent, column], heap[child, column]
+        parent = child
+    return last
+
+
+@jit
+def relax(
+    node, heap, size, departure, pred, trip, pred_arrival, fixed, in_queue, reached, rank, counters,
+    in_start, in_order, c_from, c_dep, c_arr, c_trip, walk_start, walk_from, walk_time,
+):
+    """update_neighbors and reach of traverse on arrays: relaxes the connections
+    and footpaths into node, in the order traverse visits them."""
+    node_departure = departure[node]
+    from_trip = trip[node]
+    counters[EDGES_RELAXED] += in_start[node + 1] - in_start[node] + walk_start[node + 1] - walk_start[node]
+    for k in range(in_start[node], in_start[node + 1]):
+        edge = in_order[k]
+        src = c_from[edge]
+        if not fixed[src] and (
+            (c_arr[edge] <= node_departure and (from_trip == c_trip[edge] or from_trip == WALK))
+            or c_arr[edge] <= node_departure - SECONDS_TO_CHANGE
+        ):
+            heap, size = reach(
+                src, c_dep[edge], node, c_trip[edge], c_arr[edge],
+                heap, size, departure, pred, trip, pred_arrival, in_queue, reached, rank, counters
+            )
+    for k in range(walk_start[node], walk_start[node + 1]):
+        src = walk_from[k]
+        if not fixed[src]:
+            heap, size = reach(
+                src, node_departure - walk_time[k], node, WALK, node_departure,
+                heap, size, departure, pred, trip, pred_arrival, in_queue, reached, rank, counters
+            )
+    return heap, size
+
+
+@jit
+def reach(node, node_departure, node_pred, node_trip, node_pred_arrival, heap, size, departure, pred, trip, pred_arrival, in_queue, reached, rank, counters):
+    if in_queue[node]:
+        updated = node_departure > departure[node]
+    else:
+        in_queue[node] = True
+        updated = True
+    if updated:
+        counters[QUEUE_UPDATES] += 1
+        departure[node] = node_departure
+        pred[node] = node_pred
+        trip[node] = node_trip
+        pred_arrival[node] = node_pred_arrival
+        reached[node] = True
+        # the latest departure first, ties by stop_id as in the PriorityQueue of traverse
+        heap, size = heap_push(heap, size, -node_departure, rank[node], node)
+    return heap, size
+
+
+@jit
+def run_queue(
+    heap, size, departure, pred, trip, pred_arrival, fixed, in_queue, reached, rank, counters,
+    settled, num_settled, is_target, in_start, in_order, c_from, c_dep, c_arr, c_trip, walk_start, walk_from, walk_time,
+):
+    """Settles stops until the queue is empty or all targets are settled.
+    Rows of the heap whose stop was settled or improved since are skipped.
+    Returns the heap, its size and the number of settled stops."""
+    while counters[REMAINING_TARGETS] != 0:
+        while size > 0 and not (in_queue[heap[0, 2]] and departure[heap[0, 2]] == -heap[0, 0]):
+            size = heap_pop(heap, size)
+        if size == 0:
+            break
+        size = heap_pop(heap, size)
+        node = heap[size, 2]
+        in_queue[node] = False
+        fixed[node] = True
+        settled[num_settled] = node
+        num_settled += 1
+        counters[NODES_SETTLED] += 1
+        if is_target[node]:
+            is_target[node] = False
+            counters[REMAINING_TARGETS] -= 1
+        heap, size = relax(
+            node, heap, size, departure, pred, trip, pred_arrival, fixed, in_queue, reached, rank, counters,
+            in_start, in_order, c_from, c_dep, c_arr, c_trip, walk_start, walk_from, walk_time,
+        )
+    return heap, size, num_settled
+
+
+@jit
+def relax_settled(
+    heap, size, departure, pred, trip, pred_arrival, fixed, in_queue, reached, rank, counters,
+    settled, num_settled, in_start, in_order, c_from, c_dep, c_arr, c_trip, walk_start, walk_from, walk_time,
+):
+    """Relaxes the connections of a new window into the settled stops, in the order they were settled."""
+    for k in range(num_settled):
+        heap, size = relax(
+            settled[k], heap, size, departure, pred, trip, pred_arrival, fixed, in_queue, reached, rank, counters,
+            in_start, in_order, c_from, c_dep, c_arr, c_trip, walk_start, walk_from, walk_time,
+        )
+    return heap, size
+
+
+def group_by(keys, num_keys : int):
+    """Indices of keys grouped by key, keeping their order, and the start of every group."""
+    order = np.argsort(keys, kind="stable")
+    return order, np.searchsorted(keys[order], np.arange(num_keys + 1))
+
+
+def first_of_identical(columns):
+    """Indices of the first of every group of identical rows of the integer
+    columns, in their original order. The columns are packed into as few int64
+    keys as their value ranges allow, which lexsort orders several times faster
+    than np.unique(axis=1) sorts the rows."""
+    if len(columns[0]) == 0:
+        return np.arange(0)
+    keys, capacity = [], 2 ** 63
+    for column in columns:
+        low = column.min()
+        span = int(column.max() - low) + 1
+        if capacity * span >= 2 ** 63:
+            keys.append(np.zeros(len(column), dtype=np.int64))
+            capacity = 1
+        keys[-1] = keys[-1] * span + (column - low)
+        capacity *= span
+    # lexsort is stable, so the first of identical rows comes first
+    order = np.lexsort(keys[::-1])
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = False
+    for key in keys:
+        ordered = key[order]
+        first[1:] |= ordered[1:] != ordered[:-1]
+    return np.sort(order[first])
+
+
+def traverse_compiled(location_dict, start_id : str, date : datetime.date, earliest_departure : int, targets=None, stats=None, timetable=None, progress=None, cancel=None):
+    """traverse with the label-setting loop compiled by numba, a drop-in with
+    identical results: the same labels, preds, trip_ids and counters.
+
+    The connections of the whole range are loaded once as arrays and split
+    into the same hourly windows as traverse, grouped by arrival stop in the
+    order traverse relaxes them. Queue ties are broken by stop_id as in its
+    PriorityQueue. Without numba the kernels run as plain python, which is
+    much slower than traverse; compute_map then uses traverse instead.
+    """
+    timetable = timetable or get_default_timetable()
+    stop_ids = list(location_dict.keys())
+    num_stops = len(stop_ids)
+    start = stop_ids.index(start_id)
+    time = location_dict[start_id]["departure"]
+
+    with instrumentation.stage("fetch_edges"):
+        connections = timetable.get_connections(date, earliest_departure, time)
+    with instrumentation.stage("fetch_transfers"):
+        walk_from, walk_to, walk_time = timetable.get_transfer_arrays()
+
+    with instrumentation.stage("build_edge_arrays"):
+        # traverse compares trip_ids, trips of the previous day have the same ones
+        used, c_trip = np.unique(connections["trip"], return_inverse=True)
+        _, first_trip, codes = np.unique(connections["trip_ids"][used].astype(str), return_index=True, return_inverse=True)
+        trip_ids = connections["trip_ids"][used][first_trip]
+        c_trip = codes[c_trip].astype(np.int64)
+        c_from, c_to = connections["from"], connections["to"]
+        c_dep, c_arr = connections["departure"], connections["arrival"]
+        # traverse keeps one of identical edges
+        unique = first_of_identical([c_from, c_to, c_dep, c_arr, c_trip])
+        c_from, c_to, c_dep, c_arr, c_trip = c_from[unique], c_to[unique], c_dep[unique], c_arr[unique], c_trip[unique]
+        by_walk_to, walk_start = group_by(walk_to, num_stops)
+        walk_from, walk_time = walk_from[by_walk_to], walk_time[by_walk_to]
+        rank = np.empty(num_stops, dtype=np.int64)
+        rank[np.argsort(np.array(stop_ids, dtype=str), kind="stable")] = np.arange(num_stops)
+    instrumentation.count("edges_loaded", len(c_dep))
+
+    departure = np.full(num_stops, NEG_INFTY, dtype=np.int64)
+    pred = np.full(num_stops, -1, dtype=np.int64)
+    trip = np.full(num_stops, NO_TRIP, dtype=np.int64)
+    pred_arrival = np.full(num_stops, NEG_INFTY, dtype=np.int64)
+    fixed = np.zeros(num_stops, dtype=bool)
+    in_queue = np.zeros(num_stops, dtype=bool)
+    reached = np.zeros(num_stops, dtype=bool)
+    settled = np.zeros(num_stops, dtype=np.int64)
+    num_settled = 0
+    is_target = np.zeros(num_stops, dtype=bool)
+    counters = np.zeros(4, dtype=np.int64)
+    if targets is None:
+        counters[REMAINING_TARGETS] = -1
+    else:
+        remaining_targets = set(targets) - {start_id}
+        stop_index = {stop_id: idx for idx, stop_id in enumerate(stop_ids)}
+        is_target[[stop_index[target] for target in remaining_targets if target in stop_index]] = True
+        counters[REMAINING_TARGETS] = len(remaining_targets)
+
+    departure[start] = time
+    trip[start] = WALK
+    fixed[start] = True
+    in_queue[start] = True
+    heap = np.empty((max(num_stops, 1), 3), dtype=np.int64)
+    heap, size = heap_push(heap, 0, -time, rank[start], start)
+
+    def window(time_lb, time_ub):
+        edges = np.flatnonzero((c_dep >= time_lb) & (c_dep <= time_ub))
+        order, in_start = group_by(c_to[edges], num_stops)
+        return in_start, edges[order]
+
+    def write_labels(stops):
+        for idx in stops.tolist():
+            value = location_dict[stop_ids[idx]]
+            value["departure"] = int(departure[idx])
+            value["pred"] = stop_ids[pred[idx]]
+            value["trip_id"] = TRANSFER if trip[idx] == WALK else trip_ids[trip[idx]]
+            value["pred_arrival"] = int(pred_arrival[idx])
+
+    time_increment = 3600
+    time_ub = time
+    time_lb = max(time_ub - time_increment, earliest_departure)
+    in_start, in_order = window(time_lb, time_ub)
+    num_windows = 1
+    arrays = (c_from, c_dep, c_arr, c_trip, walk_start, walk_from, walk_time)
+    while time_ub > earliest_departure:
+        with instrumentation.stage("traversal_window"):
+            heap, size, num_settled = run_queue(
+                heap, size, departure, pred, trip, pred_arrival, fixed, in_queue, reached, rank, counters,
+                settled, num_settled, is_target, in_start, in_order, *arrays
+            )
+        if counters[REMAINING_TARGETS] == 0:
+            break
+        # no stop is reachable within the current window, extend it
+        if progress is not None:
+            write_labels(settled[:num_settled][reached[settled[:num_settled]]])
+            progress({stop_ids[idx] for idx in settled[:num_settled].tolist()})
+        if cancel is not None and cancel.is_set():
+            raise QueryCancelled()
+        time_lb = max(time_lb - time_increment, earliest_departure)
+        time_ub = max(time_ub - time_increment, earliest_departure)
+        in_start, in_order = window(time_lb, time_ub)
+        num_windows += 1
+        heap, size = relax_settled(
+            heap, size, departure, pred, trip, pred_arrival, fixed, in_queue, reached, rank, counters,
+            settled, num_settled, in_start, in_order, *arrays
+        )
+
+    write_labels(np.flatnonzero(reached))
+    if targets is not None:
+        for idx in np.flatnonzero(reached & ~fixed).tolist():
+            location = location_dict[stop_ids[idx]]
+            if location["departure"] != NEG_INFTY:
+                location["departure"] = NEG_INFTY
+                location["pred"] = None
+                location["trip_id"] = None
+                location["pred_arrival"] = NEG_INFTY
+
+    instrumentation.count("nodes_settled", int(counters[NODES_SETTLED]))
+    instrumentation.count("edges_relaxed", int(counters[EDGES_RELAXED]))
+    instrumentation.count("queue_updates", int(counters[QUEUE_UPDATES]))
+    instrumentation.count("window_reloads", num_windows - 1)
+    if stats is not None:
+        stats["nodes_settled"] = int(counters[NODES_SETTLED])
+        stats["edges_relaxed"] = int(counters[EDGES_RELAXED])
+        stats["queue_updates"] = int(counters[QUEUE_UPDATES])
+        stats["windows"] = num_windows
+    return location_dict
@@ -1,9 +1,11 @@
 import os
 
-DATABASE_URI = 'postgresql+psycopg2://{}:{}@{}:{}/{}'.format(
-    os.environ['DBUSER'],
-    os.environ['DBPASS'],
-    os.environ['DBHOST'],
-    int(os.environ['DBPORT']),
-    os.environ['DBNAME']
-)
+
+def get_database_uri():
+    return 'postgresql+psycopg2://{}:{}@{}:{}/{}'.format(
+        os.environ['DBUSER'],
+        os.environ['DBPASS'],
+        os.environ['DBHOST'],
+        int(os.environ['DBPORT']),
+        os.environ['DBNAME']
+    )
@@ -0,0 +1,79 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from src.traversal.algorithm import QueryCancelled
+
+
+class BackgroundQuery:
+    """A query submitted to the QueryExecutor.
+
+    progress holds the latest partial result reported by the query, or None.
+    """
+
+    def __init__(self):
+        self.progress = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Stops the query at its next window boundary, or before it starts."""
+        self._cancel.set()
+        self.future.cancel()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def wait(self, timeout : float = None):
+        """Waits up to timeout seconds, returns whether the query is done."""
+        done, _ = wait([self.future], timeout=timeout)
+        return len(done) > 0
+
+    def result(self):
+        """The result of the query, raises QueryCancelled if it was cancelled."""
+        if self.future.cancelled():
+            raise QueryCancelled()
+        return self.future.result()
+
+    def _set_progress(self, partial):
+        self.progress = partial
+
+
+class QueryExecutor:
+    """Runs queries on a thread pool so the caller can show progress while waiting.
+
+    Every query belongs to an owner (e.g. a Streamlit session). Submitting a
+    new query cancels the owner's previous one, so superseded queries free
+    their worker at the next window boundary instead of running to the end.
+    """
+
+    def __init__(self, max_workers : int = 4):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query")
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner, compute, *args, **kwargs):
+        """Runs compute(*args, progress=..., cancel=..., **kwargs) in the background.
+        Returns the BackgroundQuery, the progress and cancel arguments
+        are the ones compute_map and compute_isochrone take."""
+        query = BackgroundQuery()
+        with self._lock:
+            previous = self._queries.get(owner)
+            if previous is not None:
+                previous.cancel()
+            query.future = self._pool.submit(
+                compute, *args, progress=query._set_progress, cancel=query._cancel, **kwargs
+            )
+            self._queries[owner] = query
+        query.future.add_done_callback(lambda _: self._forget(owner, query))
+        return query
+
+    def shutdown(self):
+        with self._lock:
+            for query in self._queries.values():
+                query.cancel()
+        self._pool.shutdown(wait=True)
+
+    def _forget(self, owner, query):
+        with self._lock:
+            if self._queries.get(owner) is query:
+                del self._queries[owner]
@@ -0,0 +1,142 @@
+import numpy as np
+
+# walking transfers between stops closer than RADIUS metres
+RADIUS = 400
+# metres per second
+WALKING_SPEED = 1.2
+# longest walk of the transitive closure, seconds
+MAX_WALKING_TIME = 600
+EARTH_RADIUS = 6_371_000
+
+
+def project(lats, lons):
+    """Projects lat/lon to metres on a plane tangent at the mean latitude,
+    accurate enough for distances of a few hundred metres."""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    x = EARTH_RADIUS * lons * np.cos(lats.mean())
+    y = EARTH_RADIUS * lats
+    return x, y
+
+
+def expand(starts, counts):
+    """Concatenation of the ranges [start, start + count), without a python loop."""
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - offsets
+
+
+def pairs_within(x, y, radius : float):
+    """Returns (i, j, distance) of all ordered pairs of distinct points within radius.
+    Points are hashed into a grid of radius-sized cells, so only the points in
+    the 3x3 cells around every point are compared."""
+    cx = np.floor((x - x.min()) / radius).astype(np.int64)
+    cy = np.floor((y - y.min()) / radius).astype(np.int64)
+    width = cy.max() + 3
+    keys = cx * width + cy
+    order = np.argsort(keys, kind="stable")
+    cells, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    sources, targets = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            neighbour = np.searchsorted(cells, keys + dx * width + dy)
+            neighbour = np.minimum(neighbour, len(cells) - 1)
+            occupied = cells[neighbour] == keys + dx * width + dy
+            points = np.flatnonzero(occupied)
+            cell_counts = counts[neighbour[occupied]]
+            sources.append(np.repeat(points, cell_counts))
+            targets.append(order[expand(starts[neighbour[occupied]], cell_counts)])
+    i, j = np.concatenate(sources), np.concatenate(targets)
+    distance = np.hypot(x[i] - x[j], y[i] - y[j])
+    keep = (i != j) & (distance <= radius)
+    return i[keep], j[keep], distance[keep]
+
+
+def shortest(keys, time):
+    """Keeps the shortest time of every key, returns keys sorted.
+    Sorts key and time packed into one integer, which is much faster than a lexsort."""
+    scale = int(time.max()) + 1 if len(time) > 0 else 1
+    packed = np.sort(keys * scale + time)
+    keys, time = packed // scale, packed % scale
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], time[first]
+
+
+def transitive_closure(src, dst, time, max_time : int):
+    """Closes the walking graph (src, dst, time) under concatenation of walks
+    up to max_time seconds, so that every stop reachable on foot within
+    max_time has a direct footpath, as connection scan and RAPTOR style
+    engines expect. Walks are joined with each other until nothing improves,
+    which doubles the number of hops covered in every round. Only joins with
+    a walk that changed in the previous round can improve anything."""
+    num_stops = max(src.max(), dst.max()) + 1 if len(src) > 0 else 0
+    keys, time = shortest(src * num_stops + dst, time)
+    changed = np.ones(len(keys), dtype=bool)
+    while np.any(changed):
+        src, dst = keys // num_stops, keys % num_stops
+        by_dst = np.argsort(dst, kind="stable")
+        # changed walks followed by any walk (keys are sorted by src)
+        first = np.flatnonzero(changed)
+        lo = np.searchsorted(src, dst[first], side="left")
+        hi = np.searchsorted(src, dst[first], side="right")
+        first_a, second_a = np.repeat(first, hi - lo), expand(lo, hi - lo)
+        # any walk followed by a changed walk
+        second = np.flatnonzero(changed)
+        lo = np.searchsorted(dst[by_dst], src[second], side="left")
+        hi = np.searchsorted(dst[by_dst], src[second], side="right")
+        first_b, second_b = by_dst[expand(lo, hi - lo)], np.repeat(second, hi - lo)
+
+        first, second = np.concatenate([first_a, first_b]), np.concatenate([second_a, second_b])
+        joined_time = time[first] + time[second]
+        keep = (joined_time <= max_time) & (src[first] != dst[second])
+        joined_keys = src[first][keep] * num_stops + dst[second][keep]
+        new_keys, new_time = shortest(np.concatenate([keys, joined_keys]), np.concatenate([time, joined_time[keep]]))
+        # new pairs and pairs that got faster
+        position = np.minimum(np.searchsorted(keys, new_keys), len(keys) - 1)
+        changed = (keys[position] != new_keys) | (new_time < time[position])
+        keys, time = new_keys, new_time
+    return keys // num_stops, keys % num_stops, time
+
+
+def build_footpaths(
+    stops,
+    transfers=(),
+    radius : float = RADIUS,
+    walking_speed : float = WALKING_SPEED,
+    max_walking_time : int = MAX_WALKING_TIME,
+):
+    """Returns the walking transfers as a list of (from_stop_id, to_stop_id, transfer_time).
+
+    stops is a list of (stop_id, stop_name, stop_lat, stop_lon). Stops within
+    radius metres are connected by a walk at walking_speed (metres per
+    second, rounded up to a full minute). transfers, a list of
+    (from_stop_id, to_stop_id, min_transfer_time) such as the GTFS transfers,
+    take precedence over the computed walks between the same stops.
+    The result is transitively closed up to max_walking_time, 0 disables the closure.
+    """
+    stop_ids = np.array([stop_id for stop_id, _, _, _ in stops], dtype=object)
+    stop_index = {stop_id: idx for idx, stop_id in enumerate(stop_ids)}
+    x, y = project([lat for _, _, lat, _ in stops], [lon for _, _, _, lon in stops])
+    src, dst, distance = pairs_within(x, y, radius)
+    time = (np.ceil(distance / walking_speed / 60) * 60).astype(np.int64)
+
+    given = [(src_id, dst_id, transfer_time) for src_id, dst_id, transfer_time in transfers if src_id in stop_index and dst_id in stop_index]
+    given_src = np.array([stop_index[src_id] for src_id, _, _ in given], dtype=np.int64)
+    given_dst = np.array([stop_index[dst_id] for _, dst_id, _ in given], dtype=np.int64)
+    given_time = np.array([transfer_time for _, _, transfer_time in given], dtype=np.int64)
+    # drop the computed walks between stops with a given transfer
+    num_stops = len(stop_ids)
+    computed = ~np.isin(src * num_stops + dst, given_src * num_stops + given_dst)
+    src = np.concatenate([given_src, src[computed]])
+    dst = np.concatenate([given_dst, dst[computed]])
+    time = np.concatenate([given_time, time[computed]])
+
+    if max_walking_time > 0:
+        src, dst, time = transitive_closure(src, dst, time, max_walking_time)
+        # given transfers stay as they are, even if a chain of walks is faster
+        closed = ~np.isin(src * num_stops + dst, given_src * num_stops + given_dst)
+        src = np.concatenate([given_src, src[closed]])
+        dst = np.concatenate([given_dst, dst[closed]])
+        time = np.concatenate([given_time, time[closed]])
+    return list(zip(stop_ids[src].tolist(), stop_ids[dst].tolist(), time.tolist()))
@@ -0,0 +1,440 @@
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import time as timer
+import zipfile
+import click
+import numpy as np
+
+from src.traversal import footpaths
+from src.traversal.timetable import (
+    CONNECTION_COLUMNS, SNAPSHOT, SERVICE_ADDED, SERVICE_REMOVED, WEEKDAYS, save_metadata
+)
+
+# rows of stop_times.txt read at once
+CHUNKSIZE = 1_000_000
+# transfer_type of the walking transfers the traversal uses
+MIN_TIME_TRANSFER = 2
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def open_member(gtfs : str, name : str):
+    """Opens the file name of a GTFS zip or directory, None if the feed does not contain it."""
+    if os.path.isdir(gtfs):
+        path = os.path.join(gtfs, name)
+        return open(path, "rb") if os.path.exists(path) else None
+    archive = zipfile.ZipFile(gtfs)
+    if name not in archive.namelist():
+        return None
+    return archive.open(name)
+
+
+def read_table(gtfs : str, name : str, columns, chunksize : int = None):
+    """Reads the columns of a GTFS file as strings, optional columns that are
+    missing in the file are empty. Returns None if the file does not exist and
+    an iterator of chunks if chunksize is given."""
+    import pandas as pd
+    f = open_member(gtfs, name)
+    if f is None:
+        return None
+    return pd.read_csv(
+        f, usecols=lambda column: column in columns, dtype=str, keep_default_na=False,
+        chunksize=chunksize, encoding="utf-8-sig"
+    )
+
+
+def parse_times(values):
+    """Parses GTFS times (H:MM:SS or HH:MM:SS, past 24:00:00 for trips after midnight)
+    to seconds since midnight, without a python call per value."""
+    values = values.str.strip()
+    lengths = values.str.len()
+    values = values.where(lengths != 7, "0" + values)
+    if np.any((lengths != 7) & (lengths != 8)):
+        raise ValueError(f"invalid time {values[(lengths != 7) & (lengths != 8)].iloc[0]!r}")
+    digits = np.frombuffer(values.to_numpy().astype("S8").tobytes(), dtype=np.uint8).reshape(-1, 8).astype(np.int32) - ord("0")
+    return (
+        (digits[:, 0] * 10 + digits[:, 1]) * 3600
+        + (digits[:, 3] * 10 + digits[:, 4]) * 60
+        + digits[:, 6] * 10 + digits[:, 7]
+    ).astype(np.int32)
+
+
+def parse_date(value : str):
+    return datetime.datetime.strptime(value, "%Y%m%d").date()
+
+
+def read_feed(gtfs : str):
+    """Reads everything of a feed but stop_times.txt.
+
+    Returns a dict with
+    - stops: list of (stop_id, stop_name, stop_lat, stop_lon)
+    - services: list of (service_id, weekdays, start_date, end_date), services that
+      only occur in calendar_dates.txt run on no weekday
+    - exceptions: calendar_dates.txt in the format of ArrayTimetable, None if empty
+    - trip_ids: list of trip_ids and trip_services the service index of every trip
+    - transfers: list of (from_stop_id, to_stop_id, transfer_type, min_transfer_time)
+    """
+    stops = read_table(gtfs, "stops.txt", ("stop_id", "stop_name", "stop_lat", "stop_lon"))
+    if stops is None:
+        raise ValueError(f"{gtfs} does not contain stops.txt")
+    feed = {
+        "stops": list(zip(stops["stop_id"], stops["stop_name"], stops["stop_lat"].astype(float), stops["stop_lon"].astype(float))),
+    }
+
+    services = []
+    calendar = read_table(gtfs, "calendar.txt", ["service_id", *WEEKDAYS, "start_date", "end_date"])
+    if calendar is not None:
+        for row in calendar.itertuples(index=False):
+            services.append((
+                row.service_id,
+                tuple(int(getattr(row, day)) for day in WEEKDAYS),
+                parse_date(row.start_date),
+                parse_date(row.end_date),
+            ))
+    service_index = {service_id: idx for idx, (service_id, _, _, _) in enumerate(services)}
+
+    feed["exceptions"] = None
+    calendar_dates = read_table(gtfs, "calendar_dates.txt", ("service_id", "date", "exception_type"))
+    if calendar_dates is not None and len(calendar_dates) > 0:
+        import pandas as pd
+        dates = pd.to_datetime(calendar_dates["date"], format="%Y%m%d").to_numpy().astype("datetime64[D]")
+        ordinals = dates.astype(np.int64) + EPOCH_ORDINAL
+        new_services = ~calendar_dates["service_id"].isin(service_index.keys())
+        new_dates = pd.Series(ordinals[new_services.to_numpy()]).groupby(calendar_dates["service_id"][new_services].to_numpy())
+        for service_id, first, last in zip(new_dates.min().index, new_dates.min(), new_dates.max()):
+            service_index[service_id] = len(services)
+            services.append((service_id, (0,) * 7, datetime.date.fromordinal(int(first)), datetime.date.fromordinal(int(last))))
+        feed["exceptions"] = {
+            "service": calendar_dates["service_id"].map(service_index).to_numpy(dtype=np.int32),
+            "date": ordinals.astype(np.int32),
+            "type": calendar_dates["exception_type"].astype(np.int8).to_numpy(),
+        }
+        if not np.all(np.isin(feed["exceptions"]["type"], (SERVICE_ADDED, SERVICE_REMOVED))):
+            raise ValueError("calendar_dates.txt contains an unknown exception_type")
+    feed["services"] = services
+
+    trips = read_table(gtfs, "trips.txt", ("trip_id", "service_id"))
+    if trips is None:
+        raise ValueError(f"{gtfs} does not contain trips.txt")
+    unknown = ~trips["service_id"].isin(service_index.keys())
+    if unknown.any():
+        raise ValueError(f"trips.txt references unknown service {trips['service_id'][unknown].iloc[0]}")
+    feed["trip_ids"] = trips["trip_id"].tolist()
+    feed["trip_services"] = trips["service_id"].map(service_index).to_numpy(dtype=np.int32)
+
+    feed["transfers"] = []
+    transfers = read_table(gtfs, "transfers.txt", ("from_stop_id", "to_stop_id", "transfer_type", "min_transfer_time"))
+    if transfers is not None:
+        feed["transfers"] = [
+            (src, dst, int(transfer_type or 0), int(min_transfer_time or 0))
+            for src, dst, transfer_type, min_transfer_time in zip(
+                transfers["from_stop_id"], transfers["to_stop_id"],
+                transfers.get("transfer_type", [""] * len(transfers)),
+                transfers.get("min_transfer_time", [""] * len(transfers)),
+            )
+        ]
+    return feed
+
+
+def get_version(feed):
+    """Fingerprint in the format of DatabaseTimetable.get_version."""
+    services = feed["services"]
+    return "{}_{}_{}_{}".format(
+        min(start_date for _, _, start_date, _ in services),
+        max(end_date for _, _, _, end_date in services),
+        len(services),
+        len(feed["stops"]),
+    )
+
+
+def read_edges(gtfs : str, feed, chunksize : int = CHUNKSIZE):
+    """Yields the connections between consecutive stops of every trip in stop_times.txt,
+    chunk by chunk, as dicts of the CONNECTION_COLUMNS arrays (stop and trip indices
+    into feed). Stops without times are skipped.
+
+    Only one chunk and the stop times of one trip are held in memory, which
+    requires the stop times of a trip to be contiguous in the file (in any
+    stop_sequence order), as in every feed we know of.
+    """
+    import pandas as pd
+    stop_index = pd.Index([stop_id for stop_id, _, _, _ in feed["stops"]])
+    trip_index = pd.Index(feed["trip_ids"])
+    finished = np.zeros(len(trip_index), dtype=bool)
+    columns = ("trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence")
+    chunks = read_table(gtfs, "stop_times.txt", columns, chunksize=chunksize)
+    if chunks is None:
+        raise ValueError(f"{gtfs} does not contain stop_times.txt")
+
+    # stop times of the last trip of the previous chunk, which may continue
+    carry = None
+    for chunk in chunks:
+        chunk = chunk[(chunk["arrival_time"] != "") & (chunk["departure_time"] != "")]
+        stop_times = {
+            "trip": trip_index.get_indexer(chunk["trip_id"]),
+            "stop": stop_index.get_indexer(chunk["stop_id"]),
+            "sequence": chunk["stop_sequence"].astype(np.int32).to_numpy(),
+            "arrival": parse_times(chunk["arrival_time"]),
+            "departure": parse_times(chunk["departure_time"]),
+        }
+        if np.any(stop_times["trip"] < 0):
+            raise ValueError(f"stop_times.txt references unknown trip {chunk['trip_id'][stop_times['trip'] < 0].iloc[0]}")
+        if np.any(stop_times["stop"] < 0):
+            raise ValueError(f"stop_times.txt references unknown stop {chunk['stop_id'][stop_times['stop'] < 0].iloc[0]}")
+        if np.any(finished[stop_times["trip"]]):
+            raise ValueError("the stop times of every trip must be contiguous in stop_times.txt")
+        if carry is not None:
+            stop_times = {name: np.concatenate([carry[name], stop_times[name]]) for name in stop_times}
+        if len(stop_times["trip"]) == 0:
+            continue
+
+        last_trip = stop_times["trip"][-1]
+        continues = stop_times["trip"] == last_trip
+        carry = {name: values[continues] for name, values in stop_times.items()}
+        done = {name: values[~continues] for name, values in stop_times.items()}
+        finished[done["trip"]] = True
+        yield connect(done)
+    if carry is not None:
+        yield connect(carry)
+
+
+def connect(stop_times):
+    """Connections between consecutive stop times of the same trip."""
+    order = np.lexsort((stop_times["sequence"], stop_times["trip"]))
+    trip, stop = stop_times["trip"][order], stop_times["stop"][order]
+    same_trip = trip[1:] == trip[:-1]
+    return {
+        "from": stop[:-1][same_trip],
+        "to": stop[1:][same_trip],
+        "departure": stop_times["departure"][order][:-1][same_trip],
+        "arrival": stop_times["arrival"][order][1:][same_trip],
+        "trip": trip[:-1][same_trip],
+    }
+
+
+class SnapshotWriter:
+    """Writes the feed as an ArrayTimetable snapshot, see ArrayTimetable.load.
+
+    Connections are appended to one temporary file per departure hour and
+    sorted hour by hour on close, so memory is bounded by the connections
+    of the busiest hour instead of the whole feed.
+    """
+
+    def __init__(self, directory : str):
+        self._directory = directory
+        self._buckets = tempfile.mkdtemp(prefix="ingest-")
+        self._sizes = {}
+        self._feed = None
+
+    def write_feed(self, feed):
+        self._feed = feed
+
+    def write_edges(self, edges):
+        records = np.empty(len(edges["departure"]), dtype=[(column, np.int32) for column in CONNECTION_COLUMNS])
+        for column in CONNECTION_COLUMNS:
+            records[column] = edges[column]
+        hours = records["departure"] // 3600
+        for hour in np.unique(hours):
+            bucket = records[hours == hour]
+            with open(os.path.join(self._buckets, f"{hour}.bin"), "ab") as f:
+                bucket.tofile(f)
+            self._sizes[hour] = self._sizes.get(hour, 0) + len(bucket)
+
+    def close(self):
+        os.makedirs(self._directory, exist_ok=True)
+        # an interrupted ingest leaves no timetable.json behind
+        if os.path.exists(os.path.join(self._directory, "timetable.json")):
+            os.remove(os.path.join(self._directory, "timetable.json"))
+        total = sum(self._sizes.values())
+        columns = {
+            column: np.lib.format.open_memmap(
+                os.path.join(self._directory, f"connections.{column}.npy"), mode="w+", dtype=np.int32, shape=(total,)
+            )
+            for column in CONNECTION_COLUMNS
+        }
+        offset = 0
+        for hour in sorted(self._sizes):
+            records = np.fromfile(os.path.join(self._buckets, f"{hour}.bin"), dtype=[(column, np.int32) for column in CONNECTION_COLUMNS])
+            records = records[np.argsort(records["departure"], kind="stable")]
+            for column in CONNECTION_COLUMNS:
+                columns[column][offset:offset + len(records)] = records[column]
+            offset += len(records)
+        for column in columns.values():
+            column.flush()
+        del columns
+        shutil.rmtree(self._buckets, ignore_errors=True)
+
+        feed = self._feed
+        save_metadata(
+            self._directory, feed["stops"], feed["trip_ids"], feed["trip_services"], feed["services"],
+            [
+                (src, dst, min_transfer_time)
+                for src, dst, transfer_type, min_transfer_time in feed["transfers"]
+                if transfer_type == MIN_TIME_TRANSFER
+            ],
+            get_version(feed),
+            feed["exceptions"],
+        )
+
+
+class PostgresWriter:
+    """Loads the feed into the tables DatabaseTimetable queries (stop, calendar,
+    calendar_date, trip, transfer and edges) with COPY and creates their indexes
+    once all rows are in. Existing tables are replaced. Requires psycopg2."""
+
+    SCHEMA = """
+    DROP TABLE IF EXISTS edges, transfer, trip, calendar_date, calendar, stop;
+    CREATE TABLE stop (stop_id text, stop_name text, stop_lat real, stop_lon real);
+    CREATE TABLE calendar (
+        service_id text, monday int, tuesday int, wednesday int, thursday int, friday int, saturday int, sunday int,
+        start_date date, end_date date
+    );
+    CREATE TABLE calendar_date (service_id text, date date, exception_type int);
+    CREATE TABLE trip (trip_id text, service_id text);
+    CREATE TABLE transfer (from_stop_id text, to_stop_id text, transfer_type int, min_transfer_time int);
+    CREATE TABLE edges (
+        from_stop_id text, to_stop_id text, departure interval, arrival interval, trip_id text,
+        monday int, tuesday int, wednesday int, thursday int, friday int, saturday int, sunday int,
+        start_date date, end_date date
+    );
+    """
+
+    INDEXES = """
+    ALTER TABLE stop ADD PRIMARY KEY (stop_id);
+    ALTER TABLE calendar ADD PRIMARY KEY (service_id);
+    ALTER TABLE trip ADD PRIMARY KEY (trip_id);
+    CREATE INDEX trip_service_id ON trip (service_id);
+    CREATE INDEX calendar_date_date ON calendar_date (date);
+    CREATE INDEX edges_departure ON edges (departure);
+    ANALYZE;
+    """
+
+    def __init__(self, database_uri=None):
+        from sqlalchemy import create_engine
+        from src.traversal.config import get_database_uri
+        self._conn = create_engine(database_uri or get_database_uri()).raw_connection()
+        self._cursor = self._conn.cursor()
+        self._feed = None
+
+    def _copy(self, table : str, rows):
+        """rows is a DataFrame in the column order of table."""
+        buffer = io.StringIO()
+        rows.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        self._cursor.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", buffer)
+
+    def write_feed(self, feed):
+        import pandas as pd
+        self._feed = feed
+        self._cursor.execute(self.SCHEMA)
+        self._copy("stop", pd.DataFrame(feed["stops"]))
+        services = feed["services"]
+        self._copy("calendar", pd.DataFrame([
+            (service_id, *weekdays, start_date, end_date) for service_id, weekdays, start_date, end_date in services
+        ]))
+        if feed["exceptions"] is not None:
+            exceptions = feed["exceptions"]
+            self._copy("calendar_date", pd.DataFrame({
+                "service_id": [services[service][0] for service in exceptions["service"]],
+                "date": [datetime.date.fromordinal(int(date)) for date in exceptions["date"]],
+                "exception_type": exceptions["type"],
+            }))
+        self._copy("trip", pd.DataFrame({
+            "trip_id": feed["trip_ids"],
+            "service_id": [services[service][0] for service in feed["trip_services"]],
+        }))
+        self._copy("transfer", pd.DataFrame(feed["transfers"]))
+        # columns of edges that only depend on the service
+        self._service_ids = np.array([service_id for service_id, _, _, _ in services], dtype=object)
+        self._weekdays = np.array([weekdays for _, weekdays, _, _ in services], dtype=np.int8).reshape(-1, 7)
+        self._start_dates = np.array([start_date.isoformat() for _, _, start_date, _ in services], dtype=object)
+        self._end_dates = np.array([end_date.isoformat() for _, _, _, end_date in services], dtype=object)
+        self._stop_ids = np.array([stop_id for stop_id, _, _, _ in feed["stops"]], dtype=object)
+        self._trip_ids = np.array(feed["trip_ids"], dtype=object)
+
+    def write_edges(self, edges):
+        import pandas as pd
+        services = self._feed["trip_services"][edges["trip"]]
+        rows = pd.DataFrame({
+            "from_stop_id": self._stop_ids[edges["from"]],
+            "to_stop_id": self._stop_ids[edges["to"]],
+            # postgres reads a plain number as an interval in seconds
+            "departure": edges["departure"],
+            "arrival": edges["arrival"],
+            "trip_id": self._trip_ids[edges["trip"]],
+        })
+        for day, column in enumerate(WEEKDAYS):
+            rows[column] = self._weekdays[services, day]
+        rows["start_date"] = self._start_dates[services]
+        rows["end_date"] = self._end_dates[services]
+        self._copy("edges", rows)
+
+    def close(self):
+        self._cursor.execute(self.INDEXES)
+        self._conn.commit()
+        self._conn.close()
+
+
+def add_footpaths(feed, radius : float, walking_speed : float, max_walking_time : int):
+    """Replaces the walking transfers of feed by the footpaths between nearby
+    stops, merged with and closed over the GTFS walking transfers."""
+    walks = [
+        (src, dst, min_transfer_time)
+        for src, dst, transfer_type, min_transfer_time in feed["transfers"]
+        if transfer_type == MIN_TIME_TRANSFER
+    ]
+    walks = footpaths.build_footpaths(feed["stops"], walks, radius, walking_speed, max_walking_time)
+    feed["transfers"] = [
+        transfer for transfer in feed["transfers"] if transfer[2] != MIN_TIME_TRANSFER
+    ] + [(src, dst, MIN_TIME_TRANSFER, transfer_time) for src, dst, transfer_time in walks]
+
+
+def ingest(
+    gtfs : str,
+    writer,
+    chunksize : int = CHUNKSIZE,
+    footpath_radius : float = footpaths.RADIUS,
+    walking_speed : float = footpaths.WALKING_SPEED,
+    max_walking_time : int = footpaths.MAX_WALKING_TIME,
+):
+    """Reads the GTFS zip or directory gtfs and writes it with writer. Returns the number of connections.
+    Footpaths are added unless footpath_radius is 0, see footpaths.build_footpaths."""
+    feed = read_feed(gtfs)
+    if footpath_radius > 0:
+        add_footpaths(feed, footpath_radius, walking_speed, max_walking_time)
+    writer.write_feed(feed)
+    num_edges = 0
+    for edges in read_edges(gtfs, feed, chunksize):
+        writer.write_edges(edges)
+        num_edges += len(edges["departure"])
+    writer.close()
+    return num_edges
+
+
+@click.command()
+@click.argument("gtfs")
+@click.option("--snapshot", "directory", default=SNAPSHOT, help="Directory of the timetable snapshot the app and service load.")
+@click.option("--database", is_flag=True, help="Load the feed into the database instead of writing a snapshot.")
+@click.option("--chunksize", default=CHUNKSIZE, type=int, help="Rows of stop_times.txt read at once.")
+@click.option("--footpath-radius", default=footpaths.RADIUS, type=float, help="Connect stops within this many metres by walking, 0 to only use transfers.txt.")
+@click.option("--walking-speed", default=footpaths.WALKING_SPEED, type=float, help="Metres per second.")
+@click.option("--max-walking-time", default=footpaths.MAX_WALKING_TIME, type=int, help="Seconds, longest chain of walks in the transitive closure, 0 to skip the closure.")
+def main(gtfs, directory, database, chunksize, footpath_radius, walking_speed, max_walking_time):
+    """Builds the timetable from the GTFS zip (or directory) GTFS.
+
+    Stop times are streamed in chunks and turned into the connections between
+    consecutive stops of every trip with array operations. They are written
+    as an ArrayTimetable snapshot or loaded into the database with COPY,
+    together with stops, calendar, calendar dates, trips and transfers.
+    Stops close to each other are connected by footpaths.
+    """
+    start = timer.perf_counter()
+    writer = PostgresWriter() if database else SnapshotWriter(directory)
+    num_edges = ingest(gtfs, writer, chunksize, footpath_radius, walking_speed, max_walking_time)
+    target = "the database" if database else directory
+    print(f"{num_edges} connections written to {target} in {timer.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
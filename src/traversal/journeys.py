@@ -0,0 +1,97 @@
+import numpy as np
+
+from src.traversal.algorithm import TRANSFER
+
+
+class JourneyIndex:
+    """Compact predecessor arrays of a compute_map result.
+
+    Per stop (in result order): pred (index of the next stop towards the
+    destination, -1 if none), trip (index into trip_ids, -1 if none),
+    departure and pred_arrival (seconds since midnight as computed by the
+    traversal, past 24:00 after midnight, -1 if unreachable).
+    The journeys of any set of stops are extracted together, one
+    vectorised step per hop instead of one dict lookup per stop and hop.
+    ArrayResult.journey_index passes its record columns without copying them.
+    """
+
+    def __init__(self, stop_ids, names, pred, trip, departure, pred_arrival, trip_ids, stop_index=None):
+        self.stop_ids = np.asarray(stop_ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.pred = np.asarray(pred, dtype=np.int32)
+        self.trip = np.asarray(trip, dtype=np.int32)
+        self.departure = np.asarray(departure, dtype=np.int32)
+        self.pred_arrival = np.asarray(pred_arrival, dtype=np.int32)
+        self.trip_ids = np.asarray(trip_ids, dtype=object)
+        if stop_index is None:
+            stop_index = {stop_id: idx for idx, stop_id in enumerate(stop_ids)}
+        self._stop_index = stop_index
+
+    def hops(self, stop_ids):
+        """Returns the hops of the journeys from stop_ids to the destination as
+        (journey, from, to) arrays sorted by journey and hop, where journey
+        indexes stop_ids and from/to index the stops of this index.
+        Journeys of unreachable stops have no hops, journeys whose predecessor
+        chain does not end at the destination are left out entirely."""
+        start = np.array([self._stop_index[stop_id] for stop_id in stop_ids], dtype=np.int64)
+        journey = np.arange(len(start))
+        reachable = self.departure[start] >= 0
+        current, journey = start[reachable], journey[reachable]
+
+        journeys, froms, tos, broken = [], [], [], []
+        # a chain longer than the number of stops contains a cycle
+        for _ in range(len(self.pred)):
+            if len(current) == 0:
+                break
+            pred = self.pred[current]
+            arrived = pred < 0
+            # the chain ends at the destination, which is reachable
+            broken.append(journey[arrived & (self.departure[current] < 0)])
+            current, journey, pred = current[~arrived], journey[~arrived], pred[~arrived]
+            journeys.append(journey)
+            froms.append(current)
+            tos.append(pred)
+            current = pred
+        broken.append(journey)
+        broken = np.concatenate(broken)
+
+        if len(journeys) == 0:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        journey = np.concatenate(journeys)
+        froms = np.concatenate(froms)
+        tos = np.concatenate(tos)
+        keep = ~np.isin(journey, broken)
+        # stable sort by journey keeps the hops of a journey in order
+        order = np.argsort(journey[keep], kind="stable")
+        return journey[keep][order], froms[keep][order], tos[keep][order]
+
+    def legs(self, stop_ids):
+        """Returns the legs of the journeys from stop_ids to the destination as
+        columns: journey (index into stop_ids), leg (number within the journey),
+        trip_id ("transfer" for walking), from, to (stop_ids), from_name, to_name,
+        departure, arrival (seconds since midnight) and stops (number of hops).
+        Consecutive hops on the same trip form one leg, every walk is a leg of its own."""
+        journey, froms, tos = self.hops(stop_ids)
+        trips = self.trip[froms]
+        walks = self.trip_ids[trips] == TRANSFER
+        first = np.ones(len(journey), dtype=bool)
+        first[1:] = (journey[1:] != journey[:-1]) | (trips[1:] != trips[:-1]) | walks[1:] | walks[:-1]
+        starts = np.flatnonzero(first)
+        ends = np.append(starts[1:], len(journey)) - 1
+
+        leg_journey = journey[starts]
+        _, first_leg = np.unique(leg_journey, return_index=True)
+        leg_number = np.arange(len(starts)) - np.repeat(first_leg, np.diff(np.append(first_leg, len(starts))))
+        return {
+            "journey": leg_journey,
+            "leg": leg_number,
+            "trip_id": self.trip_ids[trips[starts]].tolist(),
+            "from": self.stop_ids[froms[starts]].tolist(),
+            "to": self.stop_ids[tos[ends]].tolist(),
+            "from_name": self.names[froms[starts]].tolist(),
+            "to_name": self.names[tos[ends]].tolist(),
+            "departure": self.departure[froms[starts]],
+            "arrival": self.pred_arrival[froms[ends]],
+            "stops": ends - starts + 1,
+        }
@@ -0,0 +1,145 @@
+import json
+import multiprocessing
+import time
+import click
+import numpy as np
+from shapely import from_geojson
+
+from src.helpers import instrumentation
+from src.traversal.algorithm import compute_map, get_locations, parse_date, parse_time
+from src.choropleth.distance_choropleth import assign_to_features
+
+GEOJSON = "data/geojson/ch-municipalities.geojson"
+
+# stop_ids in array order and the timetable (None for the default), set once per worker process
+_stop_ids = None
+_timetable = None
+
+
+def _init_worker(stop_ids, timetable=None):
+    global _stop_ids, _timetable
+    _stop_ids = stop_ids
+    _timetable = timetable
+
+
+def _latest_departures(query):
+    """Latest departure (minutes since midnight, NaN if unreachable) of every stop."""
+    location, date, time, earliest_departure = query
+    mapping = compute_map(location, date, time, earliest_departure, timetable=_timetable)
+    departures = np.full(len(_stop_ids), np.nan, dtype=np.float32)
+    for idx, stop_id in enumerate(_stop_ids):
+        departure = mapping[stop_id]["departure"]
+        if departure is not None:
+            departures[idx] = departure.hour * 60 + departure.minute
+    return departures
+
+
+def assign_stops_to_features(locations, geojson):
+    """Returns the index of the feature containing each stop (-1 if none)."""
+    return assign_to_features([(lon, lat) for _, _, lat, lon in locations], geojson).astype(np.int32)
+
+
+def get_representative_stops(locations, geojson, stop_to_feature):
+    """Picks the stop closest to the centroid of each feature (None for features without stops)."""
+    representatives = []
+    for feature_idx, feature in enumerate(geojson["features"]):
+        stop_idxs = np.flatnonzero(stop_to_feature == feature_idx)
+        if len(stop_idxs) == 0:
+            representatives.append(None)
+            continue
+        centroid = from_geojson(json.dumps(feature)).centroid
+        closest = min(
+            stop_idxs,
+            key=lambda idx: (locations[idx][3] - centroid.x) ** 2 + (locations[idx][2] - centroid.y) ** 2
+        )
+        representatives.append(locations[closest][1])
+    return representatives
+
+
+def compute_matrix(destinations, date, time, earliest_departure, stop_to_row, num_rows, processes=None, timetable=None, progress=None):
+    """Computes the latest departure (in minutes) from every row to every destination.
+
+    destinations are stop names, one matrix column each (None for an empty column).
+    stop_to_row maps every stop (in get_locations order) to its matrix row, -1 for none.
+    A row's value is the latest departure of any of its stops, NaN if none reaches the destination.
+    The reverse searches are independent and run in a pool of processes, each with its
+    own database connection. The assignment of stops to rows is done once up front.
+
+    If timetable is given, the searches run on it in this process instead.
+    progress (if given) is called with the index of every computed column and the matrix so far.
+    """
+    stop_ids = [stop_id for stop_id, _, _, _ in (timetable.get_locations() if timetable is not None else get_locations())]
+    matrix = np.full((num_rows, len(destinations)), np.nan, dtype=np.float32)
+    valid = stop_to_row >= 0
+    columns = [(idx, name) for idx, name in enumerate(destinations) if name is not None]
+    queries = [(name, date, time, earliest_departure) for _, name in columns]
+
+    def fill(results):
+        for (column, _), departures in zip(columns, results):
+            with instrumentation.stage("matrix_column"):
+                np.fmax.at(matrix[:, column], stop_to_row[valid], departures[valid])
+            instrumentation.count("matrix_columns")
+            if progress is not None:
+                progress(column, matrix)
+
+    if timetable is not None:
+        _init_worker(stop_ids, timetable)
+        fill(map(_latest_departures, queries))
+        return matrix
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, initializer=_init_worker, initargs=(stop_ids,)) as pool:
+        fill(pool.imap(_latest_departures, queries))
+    return matrix
+
+
+@click.command()
+@click.argument("datestr")
+@click.argument("timestr")
+@click.argument("outfile")
+@click.option("--earliest-departure", default="00:00", help="Earliest departure hh:mm.")
+@click.option("--geojson", "geojson_file", default=GEOJSON, help="Features of the feature x feature matrix.")
+@click.option("--stops", "stops_file", default=None, help="File with one stop name per line. Computes a stop x stop matrix instead.")
+@click.option("--processes", default=None, type=int, help="Number of worker processes, defaults to the number of cpus.")
+def main(datestr, timestr, outfile, earliest_departure, geojson_file, stops_file, processes):
+    """Computes a latest-departure matrix and writes it to OUTFILE as compressed .npz.
+
+    Entry [i, j] is the latest departure (minutes since midnight) from origin i
+    to reach destination j by TIMESTR on DATESTR, NaN if it is not reachable.
+    """
+    date = parse_date(datestr)
+    arrival = parse_time(timestr)
+    earliest = parse_time(earliest_departure)
+    locations = get_locations()
+
+    if stops_file is not None:
+        with open(stops_file, "r", encoding="utf-8") as f:
+            names = [line.strip() for line in f if line.strip()]
+        name_to_row = {name: idx for idx, name in enumerate(names)}
+        stop_to_row = np.array([name_to_row.get(name, -1) for _, name, _, _ in locations], dtype=np.int32)
+        labels = names
+        destinations = names
+    else:
+        with open(geojson_file, "r", encoding="utf-8") as f:
+            geojson = json.load(f)
+        stop_to_row = assign_stops_to_features(locations, geojson)
+        labels = [feature["id"] for feature in geojson["features"]]
+        destinations = get_representative_stops(locations, geojson, stop_to_row)
+
+    def progress(column, matrix):
+        click.echo(f"Computed column {column + 1}/{len(destinations)}: {destinations[column]}", err=True)
+
+    start = time.time()
+    matrix = compute_matrix(destinations, date, arrival, earliest, stop_to_row, len(labels), processes, progress=progress)
+    click.echo(f"Computing the matrix took {time.time() - start} seconds", err=True)
+    np.savez_compressed(
+        outfile,
+        latest_departure=matrix,
+        origins=np.array(labels),
+        destinations=np.array(labels),
+        date=datestr,
+        time=timestr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+
+
+def reachable(mapping, key : str):
+    """Yields (stop_id, value) of the stops of a compute_map/compute_isochrone
+    result that are reachable, i.e. value[key] is not None."""
+    for stop_id, value in mapping.items():
+        if value[key] is not None:
+            yield stop_id, value
+
+
+class NdjsonWriter:
+    """Writes one json line per reachable stop and query:
+    {"query": 0, "stop_id": "8507000", "name": "Bern", "departure": "08:32", "pred": "8504100", "trip_id": "..."}
+    Lines are written as soon as a query is done, so downstream tools can
+    process the results incrementally.
+    """
+
+    def __init__(self, out):
+        self._out = out
+
+    def write(self, query_idx : int, mapping, key : str):
+        for stop_id, value in reachable(mapping, key):
+            record = {
+                "query": query_idx,
+                "stop_id": stop_id,
+                "name": value["name"],
+                key: value[key].strftime("%H:%M"),
+                "pred": value["pred"],
+                "trip_id": value["trip_id"],
+            }
+            self._out.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+        self._out.flush()
+
+    def close(self):
+        pass
+
+
+class ArrowWriter:
+    """Writes an Arrow IPC stream with one record batch of the reachable stops per query.
+    Columns: query (int32), stop_id, name, key (time32[s]), pred and trip_id.
+    pyarrow is optional and only imported here."""
+
+    def __init__(self, out, key : str):
+        import pyarrow
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            ("query", pyarrow.int32()),
+            ("stop_id", pyarrow.string()),
+            ("name", pyarrow.string()),
+            (key, pyarrow.time32("s")),
+            ("pred", pyarrow.string()),
+            ("trip_id", pyarrow.string()),
+        ])
+        self._writer = pyarrow.ipc.new_stream(out, self._schema)
+        self._out = out
+
+    def write(self, query_idx : int, mapping, key : str):
+        stops = list(reachable(mapping, key))
+        batch = self._pyarrow.record_batch([
+            [query_idx] * len(stops),
+            [stop_id for stop_id, _ in stops],
+            [value["name"] for _, value in stops],
+            [value[key] for _, value in stops],
+            [value["pred"] for _, value in stops],
+            [value["trip_id"] for _, value in stops],
+        ], schema=self._schema)
+        self._writer.write_batch(batch)
+        self._out.flush()
+
+    def close(self):
+        self._writer.close()
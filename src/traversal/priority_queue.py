@@ -10,6 +10,9 @@ class PriorityQueue:
     def size(self):
         return len(self._elems)
 
+    def contains(self, elem):
+        return elem in self._costs
+
     def pop(self):
         if self.size() <= 0:
             return None
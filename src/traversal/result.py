@@ -0,0 +1,156 @@
+import threading
+import weakref
+from collections.abc import ItemsView, Mapping, ValuesView
+import numpy as np
+
+from src.traversal.algorithm import seconds_to_time
+from src.traversal.journeys import JourneyIndex
+
+# seconds since midnight, -1 if unreachable, pred and trip are indices, -1 for none
+RECORD_DTYPE = np.dtype([("departure", np.int32), ("pred", np.int32), ("trip", np.int32), ("pred_arrival", np.int32)])
+
+
+class StopTable:
+    """stop_id, name, lat and lon of every array index of an ArrayResult.
+    One table is shared by all results over the same stops."""
+
+    def __init__(self, stops):
+        self.stops = [tuple(stop) for stop in stops]
+        self.index = {stop_id: idx for idx, (stop_id, _, _, _) in enumerate(self.stops)}
+        self.stop_ids = np.array([stop_id for stop_id, _, _, _ in self.stops], dtype=object)
+        self.names = np.array([name for _, name, _, _ in self.stops], dtype=object)
+
+    def __len__(self):
+        return len(self.stops)
+
+    def matches(self, stop_ids):
+        """True if stop_ids are the stops of the table in the same order."""
+        return len(stop_ids) == len(self.stops) and all(
+            stop_id == stop[0] for stop_id, stop in zip(stop_ids, self.stops)
+        )
+
+
+class ArrayResult(Mapping):
+    """Read-only compute_map result holding one RECORD_DTYPE record per stop
+    instead of one dict per stop, about 16 instead of 700 bytes.
+
+    The values are built when they are accessed and have the format of
+    compute_map, so an ArrayResult can be used wherever a result is read.
+    Changing a value does not change the result.
+    """
+
+    def __init__(self, stop_table : StopTable, records, trip_ids):
+        self._stop_table = stop_table
+        self._records = records
+        self._trip_ids = trip_ids
+
+    @classmethod
+    def from_labels(cls, stop_table : StopTable, location_dict):
+        """Converts the labels of a traversal (times in seconds) in the order of stop_table."""
+        values = [location_dict[stop_id] for stop_id, _, _, _ in stop_table.stops]
+        trip_ids = sorted({value["trip_id"] for value in values if value["trip_id"] is not None})
+        trip_idx = {trip_id: idx for idx, trip_id in enumerate(trip_ids)}
+        records = np.full(len(stop_table), -1, dtype=RECORD_DTYPE)
+        records["departure"] = [value["departure"] for value in values]
+        records["pred"] = [-1 if value["pred"] is None else stop_table.index[value["pred"]] for value in values]
+        records["trip"] = [-1 if value["trip_id"] is None else trip_idx[value["trip_id"]] for value in values]
+        records["pred_arrival"] = [value["pred_arrival"] for value in values]
+        return cls(stop_table, records, trip_ids)
+
+    @property
+    def nbytes(self):
+        return self._records.nbytes
+
+    @property
+    def records(self):
+        """The RECORD_DTYPE record of every stop in the order of the stop table,
+        times in seconds as the traversal left them. Must not be changed."""
+        return self._records
+
+    @property
+    def trip_ids(self):
+        return self._trip_ids
+
+    def journey_index(self):
+        """The JourneyIndex of the result, a view of its records."""
+        return JourneyIndex(
+            self._stop_table.stop_ids, self._stop_table.names, self._records["pred"], self._records["trip"],
+            self._records["departure"], self._records["pred_arrival"], self._trip_ids, self._stop_table.index
+        )
+
+    def restrict(self, earliest_departure : int):
+        """The result in which stops departing before earliest_departure
+        (seconds since midnight) are unreachable, see cache.restrict_to_window."""
+        records = np.array(self._records)
+        # results are reported in minutes
+        minutes = records["departure"] - records["departure"] % 60
+        early = (records["departure"] >= 0) & (minutes < earliest_departure)
+        records[early] = -1
+        return ArrayResult(self._stop_table, records, self._trip_ids)
+
+    def __getitem__(self, stop_id):
+        idx = self._stop_table.index[stop_id]
+        departure, pred, trip, pred_arrival = self._records[idx].tolist()
+        return self._value(self._stop_table.stops[idx], departure, pred, trip, pred_arrival)
+
+    def __iter__(self):
+        return iter(self._stop_table.index)
+
+    def __len__(self):
+        return len(self._stop_table)
+
+    def __contains__(self, stop_id):
+        return stop_id in self._stop_table.index
+
+    def items(self):
+        return _ArrayResultItems(self)
+
+    def values(self):
+        return _ArrayResultValues(self)
+
+    def _iter_items(self):
+        # one pass over the columns instead of a record per stop
+        for stop, departure, pred, trip, pred_arrival in zip(
+            self._stop_table.stops, self._records["departure"].tolist(), self._records["pred"].tolist(),
+            self._records["trip"].tolist(), self._records["pred_arrival"].tolist()
+        ):
+            yield stop[0], self._value(stop, departure, pred, trip, pred_arrival)
+
+    def _value(self, stop, departure, pred, trip, pred_arrival):
+        _, name, lat, lon = stop
+        return {
+            "name": name,
+            "lat": lat,
+            "lon": lon,
+            "departure": seconds_to_time(departure),
+            "pred": self._stop_table.stops[pred][0] if pred >= 0 else None,
+            "trip_id": self._trip_ids[trip] if trip >= 0 else None,
+            "pred_arrival": seconds_to_time(pred_arrival),
+        }
+
+
+class _ArrayResultItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._iter_items()
+
+
+class _ArrayResultValues(ValuesView):
+    def __iter__(self):
+        for _, value in self._mapping._iter_items():
+            yield value
+
+
+# timetable -> StopTable of its stops, shared by the results computed on it
+_stop_tables = weakref.WeakKeyDictionary()
+_stop_tables_lock = threading.Lock()
+
+
+def get_stop_table(timetable, stop_ids):
+    """The StopTable of stop_ids (in this order) shared by the results computed
+    on timetable. A new table replaces the shared one if the stops changed."""
+    with _stop_tables_lock:
+        stop_table = _stop_tables.get(timetable)
+        if stop_table is None or not stop_table.matches(stop_ids):
+            stop_table = StopTable(timetable.get_locations())
+            _stop_tables[timetable] = stop_table
+    return stop_table
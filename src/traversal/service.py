@@ -0,0 +1,206 @@
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import click
+import numpy as np
+from aiohttp import web
+
+from src.traversal.algorithm import compute_map, parse_date, parse_time
+from src.traversal.timetable import DatabaseTimetable, get_default_timetable
+
+GEOJSON = "data/geojson/ch-municipalities.geojson"
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+FORMATS = {"json": JSON, "msgpack": MSGPACK, "arrow": ARROW}
+
+STOPS = web.AppKey("stops", dict)
+STOP_NAMES = web.AppKey("stop_names", set)
+STOP_TO_FEATURE = web.AppKey("stop_to_feature", object)
+FEATURE_IDS = web.AppKey("feature_ids", list)
+POOL = web.AppKey("pool", ProcessPoolExecutor)
+
+# timetable used by compute_map, set once per worker process
+_timetable = None
+
+
+def _init_worker(timetable):
+    global _timetable
+    _timetable = timetable
+
+
+def _latest_departures(query):
+    """Latest departure (minutes since midnight, NaN if unreachable), pred and trip_id of every stop."""
+    location, date, time, earliest_departure = query
+    mapping = compute_map(location, date, time, earliest_departure, timetable=_timetable)
+    departures = np.full(len(mapping), np.nan, dtype=np.float32)
+    preds = []
+    trip_ids = []
+    for idx, value in enumerate(mapping.values()):
+        if value["departure"] is not None:
+            departures[idx] = value["departure"].hour * 60 + value["departure"].minute
+        preds.append(value["pred"])
+        trip_ids.append(value["trip_id"])
+    return departures, preds, trip_ids
+
+
+def _nan_to_none(values):
+    return [None if np.isnan(value) else float(value) for value in values]
+
+
+def encode(columns : dict, content_type : str):
+    """Encodes a dict of equally long columns as json, msgpack or an arrow ipc stream.
+    msgpack and pyarrow are optional and only imported when requested."""
+    if content_type == MSGPACK:
+        import msgpack
+        return msgpack.packb(columns)
+    if content_type == ARROW:
+        import pyarrow
+        table = pyarrow.table(columns)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    return json.dumps(columns, separators=(",", ":")).encode("utf-8")
+
+
+def negotiate(request):
+    """Picks the response format from ?format= or the Accept header, json by default."""
+    if "format" in request.query:
+        if request.query["format"] not in FORMATS:
+            raise web.HTTPBadRequest(text=f"format must be one of {', '.join(FORMATS)}")
+        return FORMATS[request.query["format"]]
+    for content_type in (MSGPACK, ARROW):
+        if content_type in request.headers.get("Accept", ""):
+            return content_type
+    return JSON
+
+
+def respond(request, columns : dict):
+    content_type = negotiate(request)
+    try:
+        body = encode(columns, content_type)
+    except ImportError as e:
+        raise web.HTTPNotAcceptable(text=f"{content_type} is not available on this server: {e}")
+    return web.Response(body=body, content_type=content_type)
+
+
+def parse_query(request):
+    """Reads location, date (YYYY-MM-DD), time and earliest_departure (hh:mm) from the query string."""
+    try:
+        location = request.query["location"]
+        date = parse_date(request.query["date"])
+        time = parse_time(request.query["time"])
+        earliest_departure = parse_time(request.query.get("earliest_departure", "00:00"))
+    except (KeyError, ValueError) as e:
+        raise web.HTTPBadRequest(text=f"invalid query: {e!r}")
+    if location not in request.app[STOP_NAMES]:
+        raise web.HTTPNotFound(text=f"unknown location {location}")
+    return location, date, time, earliest_departure
+
+
+async def run_query(request, query):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app[POOL], _latest_departures, query)
+
+
+async def stops(request):
+    return respond(request, request.app[STOPS])
+
+
+async def latest_departure(request):
+    departures, preds, trip_ids = await run_query(request, parse_query(request))
+    return respond(request, {
+        "stop_id": request.app[STOPS]["stop_id"],
+        "latest_departure": _nan_to_none(departures),
+        "pred": preds,
+        "trip_id": trip_ids,
+    })
+
+
+async def choropleth(request):
+    if request.app[STOP_TO_FEATURE] is None:
+        raise web.HTTPNotFound(text="the service was started without a geojson partition")
+    departures, _, _ = await run_query(request, parse_query(request))
+    stop_to_feature = request.app[STOP_TO_FEATURE]
+    feature_ids = request.app[FEATURE_IDS]
+    feature_departures = np.full(len(feature_ids), np.nan, dtype=np.float32)
+    valid = stop_to_feature >= 0
+    np.fmax.at(feature_departures, stop_to_feature[valid], departures[valid])
+    return respond(request, {
+        "feature_id": feature_ids,
+        "latest_departure": _nan_to_none(feature_departures),
+    })
+
+
+def create_app(timetable, geojson=None, processes=None):
+    """Creates the service on timetable, which is sent to every worker process once.
+
+    Endpoints (all GET):
+    - /stops: stop_id, name, lat and lon of every stop
+    - /latest-departure?location=&date=&time=[&earliest_departure=]: latest departure
+      (minutes since midnight) of every stop, in /stops order, with pred and trip_id
+    - /choropleth?...: the latest departure of every geojson feature (requires geojson)
+    Responses are columnar, as json or, with ?format= or the Accept header, msgpack or arrow.
+    """
+    locations = timetable.get_locations()
+    app = web.Application()
+    app[STOPS] = {
+        "stop_id": [stop_id for stop_id, _, _, _ in locations],
+        "name": [name for _, name, _, _ in locations],
+        "lat": [lat for _, _, lat, _ in locations],
+        "lon": [lon for _, _, _, lon in locations],
+    }
+    app[STOP_NAMES] = set(app[STOPS]["name"])
+    app[STOP_TO_FEATURE] = None
+    if geojson is not None:
+        from src.traversal.matrix import assign_stops_to_features
+        app[STOP_TO_FEATURE] = assign_stops_to_features(locations, geojson)
+        app[FEATURE_IDS] = [feature["id"] for feature in geojson["features"]]
+
+    async def start_pool(app):
+        # a DatabaseTimetable is sent without its connection, workers open their own to the same database
+        context = multiprocessing.get_context("spawn")
+        app[POOL] = ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker, initargs=(timetable,))
+        yield
+        app[POOL].shutdown(cancel_futures=True)
+    app.cleanup_ctx.append(start_pool)
+
+    app.router.add_get("/stops", stops)
+    app.router.add_get("/latest-departure", latest_departure)
+    app.router.add_get("/choropleth", choropleth)
+    return app
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=8080, type=int)
+@click.option("--processes", default=None, type=int, help="Number of worker processes, defaults to the number of cpus.")
+@click.option("--geojson", "geojson_file", default=GEOJSON, help="Partition served by /choropleth, skipped if the file does not exist.")
+@click.option("--database", is_flag=True, help="Query the database per request instead of loading the timetable into memory.")
+def main(host, port, processes, geojson_file, database):
+    """Serves latest-departure queries over HTTP.
+
+    The timetable is loaded from the snapshot or the database once at startup and shared with
+    a pool of worker processes, so a query costs one traversal and no process
+    or connection startup.
+    """
+    if database:
+        timetable = DatabaseTimetable()
+    else:
+        timetable = get_default_timetable()
+        if isinstance(timetable, DatabaseTimetable):
+            timetable = timetable.to_array_timetable()
+        print(f"Loaded timetable {timetable.get_version()}")
+    geojson = None
+    if os.path.exists(geojson_file):
+        with open(geojson_file, "r", encoding="utf-8") as f:
+            geojson = json.load(f)
+    web.run_app(create_app(timetable, geojson, processes), host=host, port=port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import json
+import os
+import click
+
+from src.traversal.algorithm import get_all_stop_names, get_timetable_version
+
+STOP_INDEX = "data/stop_names.json"
+
+
+def build_stop_index(path : str = STOP_INDEX):
+    """Writes the sorted stop names of the default timetable to path."""
+    index = {
+        "version": get_timetable_version(),
+        "names": sorted(set(get_all_stop_names())),
+    }
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+    return index
+
+
+def _read_index(path : str):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_stop_names(path : str = STOP_INDEX, version : str = None):
+    """Returns the stop names of the index at path, or None if it was not built.
+    If version (of the default timetable) is given and the index was built
+    from another timetable, the index is rebuilt. Without a version the
+    database is not touched."""
+    index = _read_index(path)
+    if index is None:
+        return None
+    if version is not None and index["version"] != version:
+        index = build_stop_index(path)
+    return index["names"]
+
+
+def refresh_stop_index(path : str = STOP_INDEX, version : str = None):
+    """Rebuilds the index at path if it was built from another timetable than
+    version, by default the version of the default timetable.
+    Returns True if the index was rebuilt, False if it is current or missing."""
+    index = _read_index(path)
+    if index is None or index["version"] == (version or get_timetable_version()):
+        return False
+    build_stop_index(path)
+    return True
+
+
+@click.command()
+@click.argument("path", default=STOP_INDEX)
+def main(path):
+    """Builds the stop name index the app loads on startup instead of querying the database."""
+    index = build_stop_index(path)
+    print(f"{len(index['names'])} stop names of timetable {index['version']} written to {path}")
+
+
+if __name__ == "__main__":
+    main()
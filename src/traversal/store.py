@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import time
+import click
+import numpy as np
+
+from src.traversal.algorithm import (
+    compute_map, get_service_pattern, get_timetable_version,
+    parse_date, parse_time
+)
+from src.traversal.cache import departure_seconds, restrict_to_window
+from src.traversal.result import RECORD_DTYPE, ArrayResult, StopTable
+
+
+def pattern_key(pattern):
+    """Stable name of a service pattern (set of service_ids)."""
+    return hashlib.sha1("\n".join(sorted(pattern)).encode("utf-8")).hexdigest()[:16]
+
+
+class ResultStore:
+    """On-disk store of precomputed compute_map results.
+
+    Each timetable version gets its own directory containing
+    - stops.json: [stop_id, name, lat, lon] for every array index
+    - index.json: the stored queries and the files holding their results
+    - <entry>.npy: departure and pred_arrival (seconds since midnight of the
+      service day, past 24:00 after midnight, -1 if unreachable), pred and trip index per stop
+    - <entry>.trips.json: the trip_ids referenced by <entry>.npy
+
+    The result arrays are memory-mapped on load and served as an ArrayResult,
+    so serving a stored query costs no traversal and no dict per stop.
+    Like ResultCache, a stored result also answers queries with a later
+    earliest departure. Storing a result over other stops than stops.json
+    replaces the stored results.
+    """
+
+    def __init__(self, root, version):
+        self._path = os.path.join(root, version)
+        self._stops = None
+        self._stop_table = None
+        self._index = None
+
+    def get(self, location : str, pattern, time : int, earliest_departure : int = 0):
+        """Returns the stored mapping in compute_map format or None."""
+        entries = self._get_index().get((location, pattern_key(pattern), time), {})
+        candidates = [stored for stored in entries if stored <= earliest_departure]
+        if len(candidates) == 0:
+            return None
+        stored = max(candidates)
+        mapping = self._read(entries[stored])
+        if stored < earliest_departure:
+            mapping = restrict_to_window(mapping, earliest_departure, time)
+        return mapping
+
+    def contains(self, location : str, pattern, time : int, earliest_departure : int = 0):
+        entries = self._get_index().get((location, pattern_key(pattern), time), {})
+        return earliest_departure in entries
+
+    def put(self, location : str, pattern, time : int, earliest_departure : int, mapping):
+        os.makedirs(self._path, exist_ok=True)
+        stops = self._get_stops(mapping)
+        if not StopTable(stops).matches(list(mapping.keys())):
+            # the stops changed within the timetable version (e.g. after ingesting again),
+            # the stored results refer to the old ones
+            self._clear()
+            stops = self._get_stops(mapping)
+        if isinstance(mapping, ArrayResult):
+            # the stops of mapping are those of the store in the same order, see above
+            records, trip_ids = mapping.records, mapping.trip_ids
+        else:
+            records, trip_ids = self._to_records(stops, time, mapping)
+
+        key = (location, pattern_key(pattern), time)
+        name = hashlib.sha1(json.dumps([*key, earliest_departure]).encode("utf-8")).hexdigest()[:16]
+        np.save(os.path.join(self._path, name + ".npy"), records)
+        self._write_json(name + ".trips.json", trip_ids)
+
+        index = self._get_index()
+        index.setdefault(key, {})[earliest_departure] = name
+        self._write_json("index.json", [
+            {"location": entry_location, "pattern": entry_pattern, "time": entry_time, "earliest_departure": earliest, "file": entry_name}
+            for (entry_location, entry_pattern, entry_time), entries in index.items()
+            for earliest, entry_name in entries.items()
+        ])
+
+    def _to_records(self, stops, time, mapping):
+        """Records and trip_ids of a compute_map result in dict format. Its times
+        wrap around after midnight, they are unwrapped against the arrival time time."""
+        stop_idx = {stop_id: idx for idx, (stop_id, _, _, _) in enumerate(stops)}
+        trip_ids = sorted({
+            value["trip_id"] for value in mapping.values() if value["trip_id"] is not None
+        })
+        trip_idx = {trip_id: idx for idx, trip_id in enumerate(trip_ids)}
+
+        records = np.full(len(stops), -1, dtype=RECORD_DTYPE)
+        for stop_id, value in mapping.items():
+            idx = stop_idx[stop_id]
+            if value["departure"] is not None:
+                records["departure"][idx] = departure_seconds(value["departure"], time)
+            if value["pred"] is not None:
+                records["pred"][idx] = stop_idx[value["pred"]]
+            if value["trip_id"] is not None:
+                records["trip"][idx] = trip_idx[value["trip_id"]]
+            if value["pred_arrival"] is not None:
+                records["pred_arrival"][idx] = departure_seconds(value["pred_arrival"], time)
+        return records, trip_ids
+
+    def _read(self, name):
+        records = np.load(os.path.join(self._path, name + ".npy"), mmap_mode="r")
+        with open(os.path.join(self._path, name + ".trips.json"), "r", encoding="utf-8") as f:
+            trip_ids = json.load(f)
+        return ArrayResult(self._get_stop_table(), records, trip_ids)
+
+    def _clear(self):
+        """Removes every stored result and the stops."""
+        for entries in self._get_index().values():
+            for name in entries.values():
+                for filename in (name + ".npy", name + ".trips.json"):
+                    os.remove(os.path.join(self._path, filename))
+        for filename in ("index.json", "stops.json"):
+            if os.path.exists(os.path.join(self._path, filename)):
+                os.remove(os.path.join(self._path, filename))
+        self._stops = self._stop_table = self._index = None
+
+    def _get_stop_table(self):
+        if self._stop_table is None:
+            self._stop_table = StopTable(self._get_stops())
+        return self._stop_table
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = {}
+            path = os.path.join(self._path, "index.json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for entry in json.load(f):
+                        key = (entry["location"], entry["pattern"], entry["time"])
+                        self._index.setdefault(key, {})[entry["earliest_departure"]] = entry["file"]
+        return self._index
+
+    def _get_stops(self, mapping=None):
+        """Stops in array order. Written from the first stored mapping."""
+        if self._stops is None:
+            path = os.path.join(self._path, "stops.json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    self._stops = [tuple(stop) for stop in json.load(f)]
+            elif mapping is not None:
+                self._stops = [
+                    (stop_id, value["name"], value["lat"], value["lon"])
+                    for stop_id, value in mapping.items()
+                ]
+                self._write_json("stops.json", self._stops)
+        return self._stops
+
+    def _write_json(self, filename, data):
+        path = os.path.join(self._path, filename)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+
+@click.command()
+@click.argument("config_file")
+@click.argument("store_dir")
+def main(config_file, store_dir):
+    """Precomputes compute_map for the queries listed in config_file.
+
+    config_file is a json file of the form
+    {
+        "destinations": ["Zürich HB", "Bern"],
+        "dates": ["2024-01-15", "2024-01-20", "2024-01-21"],
+        "times": ["08:00", "09:00"],
+        "earliest_departure": "05:00"
+    }
+    where "dates" holds one representative day per weekday pattern.
+    Dates with the same service pattern are computed once.
+    Queries already in the store are skipped, so an interrupted job can be restarted.
+    """
+    with open(config_file, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    store = ResultStore(store_dir, get_timetable_version())
+    earliest_departure = parse_time(config.get("earliest_departure", "00:00"))
+
+    patterns = {}
+    for datestr in config["dates"]:
+        date = parse_date(datestr)
+        patterns.setdefault(get_service_pattern(date), date)
+
+    for destination in config["destinations"]:
+        for pattern, date in patterns.items():
+            for timestr in config["times"]:
+                arrival = parse_time(timestr)
+                if store.contains(destination, pattern, arrival, earliest_departure):
+                    continue
+                start = time.time()
+                # array results keep the seconds of the traversal, also after midnight
+                mapping = compute_map(destination, date, arrival, earliest_departure, low_memory=True)
+                store.put(destination, pattern, arrival, earliest_departure, mapping)
+                print(f"Stored {destination}, {date}, {timestr} in {time.time() - start:.1f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,550 @@
+import datetime
+import json
+import os
+import numpy as np
+
+from src.helpers import instrumentation
+from src.traversal.config import get_database_uri
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# directory of the ArrayTimetable snapshot written by src.traversal.ingest
+SNAPSHOT = "data/timetable"
+CONNECTION_COLUMNS = ("from", "to", "departure", "arrival", "trip")
+DAY = 24 * 3600
+# marks the services of the previous day in service patterns
+PREVIOUS_DAY = "previous day:"
+# calendar_dates.txt exception types
+SERVICE_ADDED = 1
+SERVICE_REMOVED = 2
+
+
+def seconds_to_interval(seconds):
+    """Database represents times as intervals."""
+    return datetime.timedelta(seconds=seconds)
+
+def interval_to_seconds(interval : datetime.timedelta):
+    """We represent times as integers in seconds after midnight."""
+    return int(interval.total_seconds())
+
+
+class Timetable:
+    """Source of the stops, edges and transfers the traversal runs on.
+
+    Subclasses implement get_locations, get_edges_in_timerange, get_transfers,
+    get_service_pattern and get_version. The per-stop adjacency the traversal
+    needs is derived from these.
+    """
+
+    def get_locations(self):
+        """Returns a list of (stop_id, stop_name, stop_lat, stop_lon)."""
+        raise NotImplementedError
+
+    def get_edges_in_timerange(self, date : datetime.date, start_time : int, end_time : int):
+        """Returns a list of (from_stop_id, to_stop_id, departure, arrival, trip_id) of the
+        edges running on date and departing between start_time and end_time (seconds since midnight)."""
+        raise NotImplementedError
+
+    def get_transfers(self):
+        """Returns a list of (from_stop_id, to_stop_id, min_transfer_time)."""
+        raise NotImplementedError
+
+    def get_service_pattern(self, date : datetime.date):
+        """Returns the set of service_ids running on date.
+        Dates with the same service pattern share the same edges."""
+        raise NotImplementedError
+
+    def get_version(self):
+        """Returns a short fingerprint of the timetable.
+        Results computed on one timetable must not be served from another."""
+        raise NotImplementedError
+
+    def get_in_edges_in_timerange(self, date : datetime.date, start_time : int, end_time : int):
+        with instrumentation.stage("fetch_edges"):
+            edges = self.get_edges_in_timerange(date, start_time, end_time)
+        instrumentation.count("edges_loaded", len(edges))
+        with instrumentation.stage("build_edge_dict"):
+            # dicts keep the order of the edges, unlike sets, so traversals are reproducible
+            in_edges = {}
+            for src, dst, dep, arr, trip_id in edges:
+                if dst not in in_edges:
+                    in_edges[dst] = {}
+                in_edges[dst][(src, dep, arr, trip_id)] = None
+        return in_edges
+
+    def get_out_edges_in_timerange(self, date : datetime.date, start_time : int, end_time : int):
+        with instrumentation.stage("fetch_edges"):
+            edges = self.get_edges_in_timerange(date, start_time, end_time)
+        instrumentation.count("edges_loaded", len(edges))
+        with instrumentation.stage("build_edge_dict"):
+            out_edges = {}
+            for src, dst, dep, arr, trip_id in edges:
+                if src not in out_edges:
+                    out_edges[src] = {}
+                out_edges[src][(dst, dep, arr, trip_id)] = None
+        return out_edges
+
+    def get_edges_by_day(self, date : datetime.date, start_time : int, end_time : int):
+        """Returns the edges of get_edges_in_timerange as one list per service day
+        the runs belong to, date first. Runs of different days are different
+        trips, even though they share their trip_id."""
+        return [self.get_edges_in_timerange(date, start_time, end_time)]
+
+    def get_connections(self, date : datetime.date, start_time : int, end_time : int):
+        """Returns the edges of get_edges_in_timerange as a dict of equally long
+        integer arrays "from" and "to" (index into get_locations), "departure",
+        "arrival" and "trip" (index into the returned "trip_ids").
+        Every run of a trip gets its own index, see get_edges_by_day."""
+        stop_index = {stop_id: idx for idx, (stop_id, _, _, _) in enumerate(self.get_locations())}
+        edges = []
+        # (day, trip_id) -> trip index
+        trip_index = {}
+        for day, day_edges in enumerate(self.get_edges_by_day(date, start_time, end_time)):
+            for edge in day_edges:
+                trip_index.setdefault((day, edge[4]), len(trip_index))
+                edges.append((*edge, day))
+        return {
+            "from": np.array([stop_index[src] for src, _, _, _, _, _ in edges], dtype=np.int64),
+            "to": np.array([stop_index[dst] for _, dst, _, _, _, _ in edges], dtype=np.int64),
+            "departure": np.array([dep for _, _, dep, _, _, _ in edges], dtype=np.int64),
+            "arrival": np.array([arr for _, _, _, arr, _, _ in edges], dtype=np.int64),
+            "trip": np.array([trip_index[(day, trip_id)] for _, _, _, _, trip_id, day in edges], dtype=np.int64),
+            "trip_ids": np.array([trip_id for _, trip_id in trip_index], dtype=object),
+        }
+
+    def get_transfer_arrays(self):
+        """Returns the transfers as integer arrays (from, to, transfer_time), stops index get_locations."""
+        stop_index = {stop_id: idx for idx, (stop_id, _, _, _) in enumerate(self.get_locations())}
+        transfers = [
+            (stop_index[src], stop_index[dst], transfer_time) for src, dst, transfer_time in self.get_transfers()
+            if src in stop_index and dst in stop_index
+        ]
+        return (
+            np.array([src for src, _, _ in transfers], dtype=np.int64),
+            np.array([dst for _, dst, _ in transfers], dtype=np.int64),
+            np.array([transfer_time for _, _, transfer_time in transfers], dtype=np.int64),
+        )
+
+    def get_in_transfers(self):
+        with instrumentation.stage("fetch_transfers"):
+            transfers = self.get_transfers()
+        in_transfers = {}
+        for src, dst, transfer_time in transfers:
+            if dst not in in_transfers:
+                in_transfers[dst] = []
+            in_transfers[dst].append((src, transfer_time))
+        return in_transfers
+
+    def get_out_transfers(self):
+        with instrumentation.stage("fetch_transfers"):
+            transfers = self.get_transfers()
+        out_transfers = {}
+        for src, dst, transfer_time in transfers:
+            if src not in out_transfers:
+                out_transfers[src] = []
+            out_transfers[src].append((dst, transfer_time))
+        return out_transfers
+
+
+class DatabaseTimetable(Timetable):
+    """Timetable in the relational database created by init_db.sql.
+    SQLAlchemy is imported and the connection opened on first use."""
+
+    def __init__(self, database_uri=None):
+        self._database_uri = database_uri
+        self._conn = None
+        self._service_patterns = {}
+        self._overnight_services = None
+
+    def __getstate__(self):
+        """Pickled (e.g. for worker processes) without the connection but with the
+        database resolved, so every copy queries the same database."""
+        return {**self.__dict__, "_database_uri": self._database_uri or get_database_uri(), "_conn": None}
+
+    def _get_connection(self):
+        if self._conn is None:
+            from sqlalchemy import create_engine
+            engine = create_engine(self._database_uri or get_database_uri())
+            self._conn = engine.connect()
+        return self._conn
+
+    def _execute(self, query : str):
+        from sqlalchemy import text
+        return self._get_connection().execute(text(query))
+
+    def get_locations(self):
+        query = """
+        SELECT stop_id, stop_name, stop_lat, stop_lon
+        FROM stop;
+        """
+        stops = self._execute(query).fetchall()
+        return stops
+
+    def get_edges_in_timerange(self, date : datetime.date, start_time : int, end_time : int):
+        '''
+        assumes start_time and end_time to be seconds since midnight
+        the edges of the previous service day past midnight (e.g. 25:10) are included, shifted by a day
+        '''
+        today, previous_day = self.get_edges_by_day(date, start_time, end_time)
+        return today + previous_day
+
+    def get_edges_by_day(self, date : datetime.date, start_time : int, end_time : int):
+        previous_day = [
+            (src, dst, dep - DAY, arr - DAY, trip_id)
+            for src, dst, dep, arr, trip_id in self._query_edges(date - datetime.timedelta(days=1), start_time + DAY, end_time + DAY)
+        ]
+        return [self._query_edges(date, start_time, end_time), previous_day]
+
+    def _query_edges(self, date : datetime.date, start_time : int, end_time : int):
+        day = WEEKDAYS[date.weekday()]
+        start_time_interval = seconds_to_interval(start_time)
+        end_time_interval = seconds_to_interval(end_time)
+
+        query = """
+        SELECT from_stop_id, to_stop_id, departure, arrival, trip_id
+        FROM edges
+        WHERE departure >= INTERVAL '{}'
+        AND departure <= INTERVAL '{}'
+        AND {} = 1
+        AND start_date <= '{}'::date
+        AND end_date >= '{}'::date;
+        """.format(start_time_interval, end_time_interval, day, date, date)
+
+        edges = [
+            (src, dst, interval_to_seconds(dep), interval_to_seconds(arr), trip_id)
+            for src, dst, dep, arr, trip_id in self._execute(query).fetchall()
+        ]
+        return edges
+
+    def get_transfers(self):
+        query = """
+        SELECT from_stop_id, to_stop_id, min_transfer_time
+        FROM transfer
+        WHERE transfer_type = 2;
+        """
+        transfers = self._execute(query).fetchall()
+        return transfers
+
+    def get_service_pattern(self, date : datetime.date):
+        previous = self._get_services(date - datetime.timedelta(days=1)) & self._get_overnight_services()
+        return self._get_services(date) | frozenset(PREVIOUS_DAY + service_id for service_id in previous)
+
+    def _get_services(self, date : datetime.date):
+        if date not in self._service_patterns:
+            day = WEEKDAYS[date.weekday()]
+            query = """
+            SELECT service_id
+            FROM calendar
+            WHERE {} = 1
+            AND start_date <= '{}'::date
+            AND end_date >= '{}'::date;
+            """.format(day, date, date)
+            self._service_patterns[date] = frozenset(
+                service_id for service_id, in self._execute(query).fetchall()
+            )
+        return self._service_patterns[date]
+
+    def _get_overnight_services(self):
+        """The service_ids with edges departing after midnight."""
+        if self._overnight_services is None:
+            query = """
+            SELECT DISTINCT trip.service_id
+            FROM edges JOIN trip ON edges.trip_id = trip.trip_id
+            WHERE edges.departure >= INTERVAL '24 hours';
+            """
+            self._overnight_services = frozenset(service_id for service_id, in self._execute(query).fetchall())
+        return self._overnight_services
+
+    def get_version(self):
+        query = """
+        SELECT min(start_date), max(end_date), count(*)
+        FROM calendar;
+        """
+        start_date, end_date, num_services = self._execute(query).fetchone()
+        num_stops, = self._execute("SELECT count(*) FROM stop;").fetchone()
+        return "{}_{}_{}_{}".format(start_date, end_date, num_services, num_stops)
+
+    def to_array_timetable(self):
+        """Loads the whole timetable into memory, e.g. for a long-running service."""
+        stops = [tuple(stop) for stop in self.get_locations()]
+        stop_index = {stop_id: idx for idx, (stop_id, _, _, _) in enumerate(stops)}
+
+        query = """
+        SELECT service_id, monday, tuesday, wednesday, thursday, friday, saturday, sunday, start_date, end_date
+        FROM calendar;
+        """
+        services = [
+            (service_id, tuple(weekdays), start_date, end_date)
+            for service_id, *weekdays, start_date, end_date in self._execute(query).fetchall()
+        ]
+        service_index = {service_id: idx for idx, (service_id, _, _, _) in enumerate(services)}
+
+        trip_ids = []
+        trip_services = []
+        for trip_id, service_id in self._execute("SELECT trip_id, service_id FROM trip;").fetchall():
+            trip_ids.append(trip_id)
+            trip_services.append(service_index[service_id])
+        trip_index = {trip_id: idx for idx, trip_id in enumerate(trip_ids)}
+
+        query = """
+        SELECT from_stop_id, to_stop_id, departure, arrival, trip_id
+        FROM edges
+        ORDER BY departure;
+        """
+        edges = self._execute(query).fetchall()
+        connections = {
+            "from": np.array([stop_index[src] for src, _, _, _, _ in edges], dtype=np.int32),
+            "to": np.array([stop_index[dst] for _, dst, _, _, _ in edges], dtype=np.int32),
+            "departure": np.array([interval_to_seconds(dep) for _, _, dep, _, _ in edges], dtype=np.int32),
+            "arrival": np.array([interval_to_seconds(arr) for _, _, _, arr, _ in edges], dtype=np.int32),
+            "trip": np.array([trip_index[trip_id] for _, _, _, _, trip_id in edges], dtype=np.int32),
+        }
+        transfers = [tuple(transfer) for transfer in self.get_transfers()]
+        return ArrayTimetable(
+            stops, connections, trip_ids, np.array(trip_services, dtype=np.int32), services, transfers,
+            version=self.get_version()
+        )
+
+
+class ArrayTimetable(Timetable):
+    """Timetable held in memory as numpy arrays.
+
+    - stops: list of (stop_id, stop_name, stop_lat, stop_lon)
+    - connections: dict of equally long integer arrays sorted by "departure":
+      "from" and "to" (index into stops), "departure" and "arrival"
+      (seconds since midnight) and "trip" (index into trip_ids)
+    - trip_ids: list of trip_ids
+    - trip_services: array with the index into services of every trip
+    - services: list of (service_id, weekdays, start_date, end_date) where
+      weekdays holds seven 0/1 flags starting on monday
+    - transfers: list of (from_stop_id, to_stop_id, min_transfer_time)
+    - exceptions: dict of equally long integer arrays "service" (index into
+      services), "date" (date.toordinal()) and "type" (SERVICE_ADDED or
+      SERVICE_REMOVED) as in calendar_dates.txt, None if there are none
+
+    save and load write and read the timetable as a snapshot directory,
+    the connection arrays are memory-mapped on load.
+    """
+
+    def __init__(self, stops, connections, trip_ids, trip_services, services, transfers, version="memory", exceptions=None):
+        self._stops = stops
+        self._stop_ids = np.array([stop_id for stop_id, _, _, _ in stops], dtype=object)
+        self._connections = connections
+        self._trip_ids = np.array(trip_ids, dtype=object)
+        self._trip_services = np.asarray(trip_services)
+        self._services = services
+        self._transfers = transfers
+        self._version = version
+        self._exceptions = exceptions
+        # the transfers never change, with footpaths there are hundreds of thousands
+        self._in_transfers = None
+        self._out_transfers = None
+        self._transfer_arrays = None
+        self._two_day_trip_ids = None
+        self._overnight_services = None
+        # per service, built on first use
+        self._service_weekdays = None
+        self._service_start = None
+        self._service_end = None
+        assert np.all(np.diff(connections["departure"]) >= 0), "connections must be sorted by departure"
+
+    def get_locations(self):
+        return self._stops
+
+    def get_active_services(self, date : datetime.date):
+        """Returns a boolean array that is True for the services running on date."""
+        if self._service_weekdays is None:
+            self._service_weekdays = np.array([weekdays for _, weekdays, _, _ in self._services], dtype=bool).reshape(-1, 7)
+            self._service_start = np.array([start_date.toordinal() for _, _, start_date, _ in self._services], dtype=np.int64)
+            self._service_end = np.array([end_date.toordinal() for _, _, _, end_date in self._services], dtype=np.int64)
+        active = (
+            self._service_weekdays[:, date.weekday()]
+            & (self._service_start <= date.toordinal())
+            & (date.toordinal() <= self._service_end)
+        )
+        if self._exceptions is not None:
+            on_date = self._exceptions["date"] == date.toordinal()
+            services, types = self._exceptions["service"][on_date], self._exceptions["type"][on_date]
+            active[services[types == SERVICE_ADDED]] = True
+            active[services[types == SERVICE_REMOVED]] = False
+        return active
+
+    def _get_slice(self, date : datetime.date, start_time : int, end_time : int, shift : int = 0):
+        """Indices lo:hi of the connections departing between start_time + shift and
+        end_time + shift and the mask of those active on date. Slicing the sorted
+        arrays returns views, only the active connections are copied."""
+        departures = self._connections["departure"]
+        lo = np.searchsorted(departures, start_time + shift, side="left")
+        hi = np.searchsorted(departures, end_time + shift, side="right")
+        active = self.get_active_services(date)[self._trip_services[self._connections["trip"][lo:hi]]]
+        return lo, hi, active
+
+    def _get_days(self, date : datetime.date, start_time : int, end_time : int):
+        """(slice, shift) of the connections of date and of the previous service day
+        whose times past midnight (e.g. 25:10) fall into the range on date."""
+        yield self._get_slice(date, start_time, end_time), 0
+        lo, hi, active = self._get_slice(date - datetime.timedelta(days=1), start_time, end_time, shift=DAY)
+        if np.any(active):
+            yield (lo, hi, active), DAY
+
+    def get_edges_in_timerange(self, date : datetime.date, start_time : int, end_time : int):
+        edges = []
+        for (lo, hi, active), shift in self._get_days(date, start_time, end_time):
+            edges.extend(zip(
+                self._stop_ids[self._connections["from"][lo:hi][active]].tolist(),
+                self._stop_ids[self._connections["to"][lo:hi][active]].tolist(),
+                (self._connections["departure"][lo:hi][active] - shift).tolist(),
+                (self._connections["arrival"][lo:hi][active] - shift).tolist(),
+                self._trip_ids[self._connections["trip"][lo:hi][active]].tolist(),
+            ))
+        return edges
+
+    def get_connections(self, date : datetime.date, start_time : int, end_time : int):
+        """Trips of the previous service day get their own trip index
+        (offset by the number of trips), they are different runs."""
+        days = [
+            {
+                "from": self._connections["from"][lo:hi][active],
+                "to": self._connections["to"][lo:hi][active],
+                "departure": self._connections["departure"][lo:hi][active].astype(np.int64) - shift,
+                "arrival": self._connections["arrival"][lo:hi][active].astype(np.int64) - shift,
+                "trip": self._connections["trip"][lo:hi][active].astype(np.int64) + (len(self._trip_ids) if shift > 0 else 0),
+            }
+            for (lo, hi, active), shift in self._get_days(date, start_time, end_time)
+        ]
+        connections = {
+            column: np.concatenate([day[column] for day in days]).astype(np.int64) for column in CONNECTION_COLUMNS
+        }
+        if self._two_day_trip_ids is None:
+            self._two_day_trip_ids = np.concatenate([self._trip_ids, self._trip_ids])
+        connections["trip_ids"] = self._two_day_trip_ids
+        return connections
+
+    def get_transfers(self):
+        return self._transfers
+
+    def get_transfer_arrays(self):
+        if self._transfer_arrays is None:
+            self._transfer_arrays = super().get_transfer_arrays()
+        return self._transfer_arrays
+
+    def get_in_transfers(self):
+        if self._in_transfers is None:
+            self._in_transfers = super().get_in_transfers()
+        return self._in_transfers
+
+    def get_out_transfers(self):
+        if self._out_transfers is None:
+            self._out_transfers = super().get_out_transfers()
+        return self._out_transfers
+
+    def get_overnight_services(self):
+        """Boolean array that is True for the services with connections departing after midnight."""
+        if self._overnight_services is None:
+            lo = np.searchsorted(self._connections["departure"], DAY, side="left")
+            self._overnight_services = np.zeros(len(self._services), dtype=bool)
+            self._overnight_services[self._trip_services[np.unique(self._connections["trip"][lo:])]] = True
+        return self._overnight_services
+
+    def get_service_pattern(self, date : datetime.date):
+        active = self.get_active_services(date)
+        previous = self.get_active_services(date - datetime.timedelta(days=1)) & self.get_overnight_services()
+        return frozenset(
+            service_id for (service_id, _, _, _), is_active in zip(self._services, active) if is_active
+        ) | frozenset(
+            PREVIOUS_DAY + service_id for (service_id, _, _, _), is_active in zip(self._services, previous) if is_active
+        )
+
+    def get_version(self):
+        return self._version
+
+    def save(self, directory : str):
+        save_connections(directory, self._connections)
+        save_metadata(
+            directory, self._stops, self._trip_ids.tolist(), self._trip_services, self._services,
+            self._transfers, self._version, self._exceptions
+        )
+
+    @classmethod
+    def load(cls, directory : str, mmap : bool = True):
+        """Loads a snapshot written by save or src.traversal.ingest.
+        With mmap, the connection arrays are paged in from disk on access."""
+        mmap_mode = "r" if mmap else None
+        connections = {
+            column: np.load(os.path.join(directory, f"connections.{column}.npy"), mmap_mode=mmap_mode)
+            for column in CONNECTION_COLUMNS
+        }
+        with open(os.path.join(directory, "timetable.json"), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        stops = [tuple(stop) for stop in metadata["stops"]]
+        stop_ids = np.array([stop_id for stop_id, _, _, _ in stops], dtype=object)
+        with np.load(os.path.join(directory, "transfers.npz")) as npz:
+            transfers = list(zip(stop_ids[npz["from"]].tolist(), stop_ids[npz["to"]].tolist(), npz["time"].tolist()))
+        exceptions = None
+        if os.path.exists(os.path.join(directory, "exceptions.npz")):
+            with np.load(os.path.join(directory, "exceptions.npz")) as npz:
+                exceptions = {name: npz[name] for name in npz.files}
+        return cls(
+            stops,
+            connections,
+            metadata["trip_ids"],
+            np.load(os.path.join(directory, "trip_services.npy")),
+            [
+                (service_id, tuple(weekdays), datetime.date.fromisoformat(start_date), datetime.date.fromisoformat(end_date))
+                for service_id, weekdays, start_date, end_date in metadata["services"]
+            ],
+            transfers,
+            version=metadata["version"],
+            exceptions=exceptions,
+        )
+
+
+def save_connections(directory : str, connections):
+    os.makedirs(directory, exist_ok=True)
+    for column in CONNECTION_COLUMNS:
+        np.save(os.path.join(directory, f"connections.{column}.npy"), np.asarray(connections[column], dtype=np.int32))
+
+
+def save_metadata(directory : str, stops, trip_ids, trip_services, services, transfers, version, exceptions=None):
+    """Writes everything of a snapshot but the connection arrays.
+    timetable.json is written last, a directory without it is incomplete."""
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "trip_services.npy"), np.asarray(trip_services, dtype=np.int32))
+    if exceptions is not None:
+        np.savez(os.path.join(directory, "exceptions.npz"), **exceptions)
+    stop_index = {stop_id: idx for idx, (stop_id, _, _, _) in enumerate(stops)}
+    np.savez(
+        os.path.join(directory, "transfers.npz"),
+        **{
+            "from": np.array([stop_index[src] for src, _, _ in transfers], dtype=np.int32),
+            "to": np.array([stop_index[dst] for _, dst, _ in transfers], dtype=np.int32),
+            "time": np.array([transfer_time for _, _, transfer_time in transfers], dtype=np.int32),
+        }
+    )
+    metadata = {
+        "version": version,
+        "stops": [list(stop) for stop in stops],
+        "trip_ids": list(trip_ids),
+        "services": [
+            [service_id, list(weekdays), start_date.isoformat(), end_date.isoformat()]
+            for service_id, weekdays, start_date, end_date in services
+        ],
+    }
+    path = os.path.join(directory, "timetable.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+_default_timetable = None
+
+def get_default_timetable():
+    """The timetable snapshot in SNAPSHOT if it was built, the database timetable otherwise.
+    Created on first use."""
+    global _default_timetable
+    if _default_timetable is None:
+        if os.path.exists(os.path.join(SNAPSHOT, "timetable.json")):
+            _default_timetable = ArrayTimetable.load(SNAPSHOT)
+        else:
+            _default_timetable = DatabaseTimetable()
+    return _default_timetable
@@ -0,0 +1,190 @@
+import datetime
+import numpy as np
+
+from src.helpers import instrumentation
+from src.traversal.algorithm import NEG_INFTY, SECONDS_TO_CHANGE, TRANSFER, QueryCancelled
+from src.traversal.timetable import get_default_timetable
+
+
+def latest_per_key(keys, values):
+    """Indices of the largest value of every distinct key."""
+    order = np.lexsort((values, keys))
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = keys[order][1:] != keys[order][:-1]
+    return order[last]
+
+
+def expand(starts, counts):
+    """Concatenation of the ranges [start, start + count)."""
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(counts.sum()) - offsets
+
+
+def traverse_trips(location_dict, start_id : str, date : datetime.date, earliest_departure : int, targets=None, stats=None, timetable=None, progress=None, cancel=None):
+    """Trip-based latest-departure search towards start_id, a drop-in for traverse.
+
+    Instead of one label per stop, every trip gets a label: the last position
+    (in the order of its connections) at which alighting still reaches the
+    destination in time. Boarding the trip anywhere before that position is
+    then possible without changing, so whole trip prefixes are boarded at once
+    and staying seated never competes with a change at the same stop.
+    Every stop has two labels: the latest departure boarding a trip (alighting
+    before it requires SECONDS_TO_CHANGE) and the latest departure walking
+    away, or being at the destination (no change time needed).
+
+    Connections are loaded for the whole range once and released hour by hour,
+    latest first. Stops departing within the released hours are final, so
+    targets, progress and cancel behave as in traverse.
+    """
+    timetable = timetable or get_default_timetable()
+    stop_ids = list(location_dict.keys())
+    stop_index = {stop_id: idx for idx, stop_id in enumerate(stop_ids)}
+    num_stops = len(stop_ids)
+    time = location_dict[start_id]["departure"]
+
+    with instrumentation.stage("fetch_edges"):
+        connections = timetable.get_connections(date, earliest_departure, time)
+    with instrumentation.stage("fetch_transfers"):
+        walk_from, walk_to, walk_time = timetable.get_transfer_arrays()
+    instrumentation.count("edges_loaded", len(connections["departure"]))
+
+    with instrumentation.stage("build_trips"):
+        # connections of a trip are consecutive and in order
+        order = np.lexsort((connections["arrival"], connections["departure"], connections["trip"]))
+        c_from, c_to = connections["from"][order], connections["to"][order]
+        c_dep, c_arr = connections["departure"][order], connections["arrival"][order]
+        trip_ids = connections["trip_ids"][connections["trip"][order]]
+        _, trip_start, c_trip = np.unique(connections["trip"][order], return_index=True, return_inverse=True)
+        position = np.arange(len(c_dep)) - trip_start[c_trip]
+        # connections into every stop and footpaths into every stop
+        by_to = np.argsort(c_to, kind="stable")
+        to_start = np.searchsorted(c_to[by_to], np.arange(num_stops + 1))
+        by_walk_to = np.argsort(walk_to, kind="stable")
+        walk_start = np.searchsorted(walk_to[by_walk_to], np.arange(num_stops + 1))
+
+    board = np.full(num_stops, NEG_INFTY, dtype=np.int64)
+    walk = np.full(num_stops, NEG_INFTY, dtype=np.int64)
+    # connection alighted from after boarding, stop walked to
+    board_via = np.full(num_stops, -1, dtype=np.int64)
+    walk_via = np.full(num_stops, -1, dtype=np.int64)
+    walk_via_departure = np.full(num_stops, NEG_INFTY, dtype=np.int64)
+    # last position of every trip from which the destination is reached, -1 if none
+    reach = np.full(len(trip_start), -1, dtype=np.int64)
+    start = stop_index[start_id]
+    walk[start] = time
+    num_relaxed = num_rounds = num_windows = 0
+
+    def alight(candidates, lb):
+        """Extends the reach of the trips of the candidate connections that
+        arrive in time for the next departure at their stop, then boards
+        the connections that became reachable."""
+        nonlocal num_relaxed
+        num_relaxed += len(candidates)
+        threshold = np.maximum(board - SECONDS_TO_CHANGE, walk)
+        candidates = candidates[c_arr[candidates] <= threshold[c_to[candidates]]]
+        candidates = candidates[position[candidates] > reach[c_trip[candidates]]]
+        if len(candidates) == 0:
+            return
+        candidates = candidates[latest_per_key(c_trip[candidates], position[candidates])]
+        trips = c_trip[candidates]
+        previous = reach[trips]
+        reach[trips] = position[candidates]
+        # the prefix behind the previous reach is boarded already
+        boarded = expand(trip_start[trips] + previous + 1, position[candidates] - previous)
+        board_at(boarded[c_dep[boarded] >= lb])
+
+    def board_at(boarded):
+        boarded = boarded[c_dep[boarded] > board[c_from[boarded]]]
+        if len(boarded) == 0:
+            return
+        boarded = boarded[latest_per_key(c_from[boarded], c_dep[boarded])]
+        stops = c_from[boarded]
+        board[stops] = c_dep[boarded]
+        board_via[stops] = trip_start[c_trip[boarded]] + reach[c_trip[boarded]]
+        changed[stops] = True
+
+    def walk_into(stops):
+        nonlocal num_relaxed
+        footpaths = by_walk_to[expand(walk_start[stops], walk_start[stops + 1] - walk_start[stops])]
+        num_relaxed += len(footpaths)
+        departure = np.maximum(board, walk)[walk_to[footpaths]]
+        walks = departure - walk_time[footpaths]
+        better = (walks > walk[walk_from[footpaths]]) & (walks >= earliest_departure) & (departure >= 0)
+        footpaths, walks, departure = footpaths[better], walks[better], departure[better]
+        if len(footpaths) == 0:
+            return
+        best = latest_per_key(walk_from[footpaths], walks)
+        stops = walk_from[footpaths][best]
+        walk[stops] = walks[best]
+        walk_via[stops] = walk_to[footpaths][best]
+        walk_via_departure[stops] = departure[best]
+        changed[stops] = True
+
+    def write_labels(stops):
+        """Writes the final labels of stops to location_dict."""
+        written[stops] = True
+        for idx in stops:
+            value = location_dict[stop_ids[idx]]
+            value["departure"] = int(max(board[idx], walk[idx]))
+            if idx == start:
+                continue
+            if walk[idx] >= board[idx]:
+                value["pred"] = stop_ids[walk_via[idx]]
+                value["trip_id"] = TRANSFER
+                value["pred_arrival"] = int(walk_via_departure[idx])
+            else:
+                via = board_via[idx]
+                value["pred"] = stop_ids[c_to[via]]
+                value["trip_id"] = trip_ids[via]
+                value["pred_arrival"] = int(c_arr[via])
+
+    written = np.zeros(num_stops, dtype=bool)
+    target_idx = None
+    if targets is not None:
+        target_idx = np.array([stop_index[target] for target in targets if target in stop_index], dtype=np.int64)
+    changed = np.zeros(num_stops, dtype=bool)
+    changed[start] = True
+    # connections departing at or after lb are released
+    lb = time + 1
+    while True:
+        upper = lb
+        lb = max(min(upper, time) - 3600, earliest_departure)
+        num_windows += 1
+        with instrumentation.stage("traversal_window"):
+            released = np.flatnonzero((c_dep >= lb) & (c_dep < upper))
+            # released connections that arrive in time or lie within the reach of their trip
+            alight(released, lb)
+            board_at(released[position[released] <= reach[c_trip[released]]])
+            while np.any(changed):
+                num_rounds += 1
+                stops = np.flatnonzero(changed)
+                changed[:] = False
+                walk_into(stops)
+                incoming = by_to[expand(to_start[stops], to_start[stops + 1] - to_start[stops])]
+                alight(incoming[c_dep[incoming] >= lb], lb)
+
+        final = np.maximum(board, walk) >= lb
+        if target_idx is not None and np.all(final[target_idx]):
+            break
+        if lb <= earliest_departure:
+            break
+        if progress is not None:
+            write_labels(np.flatnonzero(final & ~written))
+            progress({stop_ids[idx] for idx in np.flatnonzero(final)})
+        if cancel is not None and cancel.is_set():
+            raise QueryCancelled()
+
+    departure = np.maximum(board, walk)
+    reached = departure >= lb if targets is not None else departure >= 0
+    write_labels(np.flatnonzero(reached & ~written))
+
+    instrumentation.count("nodes_settled", int(reached.sum()))
+    instrumentation.count("edges_relaxed", num_relaxed)
+    instrumentation.count("rounds", num_rounds)
+    instrumentation.count("window_reloads", num_windows - 1)
+    if stats is not None:
+        stats["nodes_settled"] = int(reached.sum())
+        stats["edges_relaxed"] = num_relaxed
+        stats["rounds"] = num_rounds
+        stats["windows"] = num_windows
+    return location_dict
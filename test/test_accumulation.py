@@ -0,0 +1,63 @@
+import datetime
+import time
+import numpy as np
+
+from src.choropleth.accumulation import accumulate, aggregate_stops, feature_statistics, to_minutes
+
+
+def test_to_minutes():
+    minutes = to_minutes([datetime.time(8, 30), None])
+    assert minutes[0] == 510
+    assert np.isnan(minutes[1])
+
+
+def test_accumulate_weights_queries_and_propagates_unreachable():
+    departures = np.array([
+        [480, 470, np.nan],
+        [500, np.nan, 490],
+        [np.nan, np.nan, np.nan],
+    ])
+    arrivals = [540, 540, 600]
+    commute = accumulate(departures, arrivals, [1, 2, 0])
+    assert commute[0] == 1 * 60 + 2 * 40
+    # unreachable in a counted query
+    assert np.isnan(commute[1]) and np.isnan(commute[2])
+
+
+def test_aggregate_stops_weighted_mean():
+    values = np.array([10, 20, np.nan, 40, 5])
+    stop_to_feature = np.array([0, 0, 1, 1, -1])
+    weights = np.array([3, 1, 1, 0, 1])
+    aggregated = aggregate_stops(values, stop_to_feature, 3, weights)
+    assert aggregated[0] == (3 * 10 + 20) / 4
+    # the only stop with a value has no population
+    assert np.isnan(aggregated[1]) and np.isnan(aggregated[2])
+    assert aggregate_stops(values, stop_to_feature, 3)[1] == 40
+
+
+def test_accumulate_hundreds_of_queries_quickly():
+    rnd = np.random.default_rng(0)
+    departures = rnd.uniform(300, 540, size=(500, 2500)).astype(np.float32)
+    departures[rnd.random(departures.shape) < 0.01] = np.nan
+    start = time.perf_counter()
+    commute = accumulate(departures, np.full(500, 540), rnd.integers(0, 5, 500))
+    assert time.perf_counter() - start < 0.1
+    assert commute.shape == (2500,)
+
+
+def test_feature_statistics_match_numpy():
+    rnd = np.random.default_rng(0)
+    values = rnd.uniform(300, 540, 1000)
+    values[rnd.random(1000) < 0.1] = np.nan
+    stop_to_feature = rnd.integers(-1, 50, 1000)
+    statistics = feature_statistics(values, stop_to_feature, 52)
+    for feature in range(52):
+        feature_values = values[(stop_to_feature == feature) & ~np.isnan(values)]
+        assert statistics["count"][feature] == len(feature_values)
+        if len(feature_values) == 0:
+            assert all(np.isnan(statistics[name][feature]) for name in ("max", "min", "median", "p90"))
+            continue
+        assert statistics["max"][feature] == feature_values.max()
+        assert statistics["min"][feature] == feature_values.min()
+        assert np.isclose(statistics["median"][feature], np.median(feature_values))
+        assert np.isclose(statistics["p90"][feature], np.percentile(feature_values, 90))
@@ -1,7 +1,8 @@
 import json
 import pytest
+from shapely.geometry import Point, shape
 
-from src.choropleth.distance_choropleth import create_choropleth
+from src.choropleth.distance_choropleth import assign_to_features, create_choropleth
 
 coords = {
     "Aarburg": [
@@ -192,3 +193,17 @@ def test_rothrist_region():
     check_choropleth_value(choropleth, "Strengelbach")
     check_choropleth_value(choropleth, "Zofingen")
 
+
+
+def test_assign_to_features():
+    points = [(lon, lat) for place in coords for _, lat, lon, _ in coords[place]]
+    # far outside of every feature
+    points.append((0.0, 0.0))
+    assignment = assign_to_features(points, geojson)
+    polygons = [shape(feature["geometry"]) for feature in geojson["features"]]
+    expected = [
+        next((idx for idx, polygon in enumerate(polygons) if polygon.contains(Point(point))), -1)
+        for point in points
+    ]
+    assert assignment.tolist() == expected
+    assert expected[-1] == -1
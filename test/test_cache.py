@@ -0,0 +1,119 @@
+import datetime
+import pytest
+
+from src.traversal.algorithm import DIJKSTRA
+from src.traversal.cache import ResultCache, restrict_to_window
+
+
+def fake_mapping(earliest_departure):
+    departures = {"A": datetime.time(9, 0), "B": datetime.time(8, 10), "C": datetime.time(7, 30), "D": None}
+    mapping = {}
+    for stop_id, departure in departures.items():
+        if departure is not None and departure.hour * 3600 + departure.minute * 60 < earliest_departure:
+            departure = None
+        mapping[stop_id] = {
+            "name": stop_id,
+            "departure": departure,
+            "pred": "A" if departure is not None and stop_id != "A" else None,
+            "trip_id": "t1" if departure is not None else None,
+            "pred_arrival": datetime.time(9, 0) if departure is not None and stop_id != "A" else None,
+        }
+    return mapping
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def cache(calls):
+    def compute(location, date, time, earliest_departure):
+        calls.append((location, date, time, earliest_departure))
+        return fake_mapping(earliest_departure)
+
+    # every weekday shares one service pattern
+    return ResultCache(compute, lambda date: date.weekday(), maxsize=2)
+
+
+def test_exact_hit(cache, calls):
+    date = datetime.date(2024, 1, 15)
+    first = cache.get("A", date, 9 * 3600, 7 * 3600)
+    second = cache.get("A", date, 9 * 3600, 7 * 3600)
+    assert first is second
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_same_service_pattern_is_shared(cache, calls):
+    cache.get("A", datetime.date(2024, 1, 15), 9 * 3600, 0)
+    cache.get("A", datetime.date(2024, 1, 22), 9 * 3600, 0)
+    assert len(calls) == 1
+
+
+def test_narrower_window_is_filtered(cache, calls):
+    date = datetime.date(2024, 1, 15)
+    cache.get("A", date, 9 * 3600, 7 * 3600)
+    narrow = cache.get("A", date, 9 * 3600, 8 * 3600)
+    assert len(calls) == 1
+    assert narrow == fake_mapping(8 * 3600)
+    assert cache.stats()["window_hits"] == 1
+
+    # a later arrival time is not answered by filtering
+    cache.get("A", date, 10 * 3600, 8 * 3600)
+    assert len(calls) == 2
+
+
+def test_lru_eviction(cache, calls):
+    date = datetime.date(2024, 1, 15)
+    cache.get("A", date, 9 * 3600, 0)
+    cache.get("B", date, 9 * 3600, 0)
+    cache.get("A", date, 9 * 3600, 0)
+    cache.get("C", date, 9 * 3600, 0)
+    assert cache.stats()["evictions"] == 1
+    cache.get("A", date, 9 * 3600, 0)
+    assert len(calls) == 3
+    cache.get("B", date, 9 * 3600, 0)
+    assert len(calls) == 4
+
+
+def test_restrict_to_window_clears_predecessors():
+    restricted = restrict_to_window(fake_mapping(0), 8 * 3600)
+    assert restricted["C"]["departure"] is None
+    assert restricted["C"]["pred"] is None
+    assert restricted["B"]["departure"] == datetime.time(8, 10)
+
+
+def test_result_options_are_part_of_the_key(calls):
+    def compute(location, date, time, earliest_departure, engine="trip", progress=None):
+        calls.append(engine)
+        return fake_mapping(earliest_departure)
+
+    cache = ResultCache(compute, lambda date: date.weekday(), maxsize=4)
+    date = datetime.date(2024, 1, 15)
+    trip = cache.get("A", date, 9 * 3600, 0, engine="trip")
+    dijkstra = cache.get("A", date, 9 * 3600, 0, engine="dijkstra")
+    assert calls == ["trip", "dijkstra"] and trip is not dijkstra
+    # progress does not change the result
+    assert cache.get("A", date, 9 * 3600, 0, engine="trip", progress=print) is trip
+    cache.get("A", date, 9 * 3600, 7 * 3600, engine="dijkstra")
+    assert calls == ["trip", "dijkstra"]
+
+
+def test_default_result_options_share_an_entry(cache, calls):
+    date = datetime.date(2024, 1, 15)
+    default = cache.get("A", date, 9 * 3600, 0)
+    assert cache.get("A", date, 9 * 3600, 0, engine=DIJKSTRA) is default
+    assert cache.get("A", date, 9 * 3600, 0, engine=DIJKSTRA, low_memory=False) is default
+    assert len(calls) == 1
+
+
+def test_restrict_after_midnight():
+    # arrival at 25:00, result times wrap around: 00:30 is 24:30 and 23:50 the day before
+    mapping = {
+        "A": {"departure": datetime.time(0, 30), "pred": None, "trip_id": None, "pred_arrival": None},
+        "B": {"departure": datetime.time(23, 50), "pred": "A", "trip_id": "t1", "pred_arrival": datetime.time(0, 30)},
+    }
+    restricted = restrict_to_window(mapping, 24 * 3600, 25 * 3600)
+    assert restricted["A"]["departure"] == datetime.time(0, 30)
+    assert restricted["B"]["departure"] is None
@@ -0,0 +1,66 @@
+import copy
+import datetime
+import threading
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal.algorithm import QueryCancelled, get_location_dict, traverse
+from src.traversal.compiled import first_of_identical, traverse_compiled
+
+# a monday and a saturday
+DATES = [datetime.date(2024, 1, 15), datetime.date(2024, 1, 20)]
+TIME = 12 * 3600
+EARLIEST_DEPARTURE = 6 * 3600
+
+
+@pytest.fixture(scope="module")
+def timetable():
+    return generate_timetable(num_stops=200, num_lines=20)
+
+
+@pytest.mark.parametrize("date", DATES)
+@pytest.mark.parametrize("location", ["Stop 0", "Stop 123"])
+def test_identical_to_traverse(timetable, location, date):
+    expected_stats = {}
+    location_dict, start_id = get_location_dict(timetable, location, "departure", TIME, edge_key="pred_arrival")
+    compiled = copy.deepcopy(location_dict)
+    compiled_stats = {}
+    traverse(location_dict, start_id, date, EARLIEST_DEPARTURE, stats=expected_stats, timetable=timetable)
+    traverse_compiled(compiled, start_id, date, EARLIEST_DEPARTURE, stats=compiled_stats, timetable=timetable)
+    assert compiled == location_dict
+    assert compiled_stats == expected_stats
+
+
+def test_identical_with_targets(timetable):
+    location_dict, start_id = get_location_dict(timetable, "Stop 17", "departure", TIME, edge_key="pred_arrival")
+    targets = list(location_dict)[::40]
+    compiled = copy.deepcopy(location_dict)
+    traverse(location_dict, start_id, DATES[0], EARLIEST_DEPARTURE, targets=targets, timetable=timetable)
+    traverse_compiled(compiled, start_id, DATES[0], EARLIEST_DEPARTURE, targets=targets, timetable=timetable)
+    assert compiled == location_dict
+
+
+def test_progress_and_cancel(timetable):
+    location_dict, start_id = get_location_dict(timetable, "Stop 0", "departure", TIME, edge_key="pred_arrival")
+    cancel = threading.Event()
+    settled = []
+
+    def progress(stops):
+        settled.append({stop_id: location_dict[stop_id]["departure"] for stop_id in stops})
+        cancel.set()
+
+    with pytest.raises(QueryCancelled):
+        traverse_compiled(location_dict, start_id, DATES[0], EARLIEST_DEPARTURE, timetable=timetable, progress=progress, cancel=cancel)
+    # the labels of the settled stops are written before progress
+    assert len(settled) == 1
+    assert len(settled[0]) > 1 and all(departure >= 0 for departure in settled[0].values())
+
+
+def test_first_of_identical():
+    rnd = np.random.default_rng(0)
+    # wide ranges need several keys, previous-day times are negative
+    columns = [rnd.integers(0, 3, 1000), rnd.integers(-2 ** 40, -2 ** 40 + 3, 1000), rnd.integers(0, 2 ** 30, 1000) % 3 * 2 ** 29]
+    _, first = np.unique(np.stack(columns), axis=1, return_index=True)
+    assert first_of_identical(columns).tolist() == sorted(first.tolist())
+    assert len(first_of_identical([np.array([], dtype=np.int64)])) == 0
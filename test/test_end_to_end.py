@@ -0,0 +1,105 @@
+import datetime
+import os
+import pytest
+
+from src.traversal.algorithm import COMPILED, DIJKSTRA, TRANSFER, TRIP_BASED, compute_map
+from src.traversal.cache import restrict_to_window
+from src.traversal.ingest import SnapshotWriter, ingest
+from src.traversal.result import ArrayResult
+from src.traversal.timetable import ArrayTimetable
+
+# a small GTFS feed, see the comments of the tests for its trips
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "gtfs")
+ENGINES = [TRIP_BASED, DIJKSTRA, COMPILED]
+MONDAY = datetime.date(2024, 1, 15)
+SATURDAY = datetime.date(2024, 1, 20)
+# new year's day, a monday that runs the weekend service
+HOLIDAY = datetime.date(2024, 1, 1)
+TIME = 8 * 3600 + 45 * 60
+EARLIEST_DEPARTURE = 5 * 3600
+
+
+@pytest.fixture(scope="module")
+def timetable(tmp_path_factory):
+    """The fixture feed built like the production snapshot, with its transfers as the only footpaths."""
+    directory = str(tmp_path_factory.mktemp("snapshot"))
+    ingest(FIXTURE, SnapshotWriter(directory), footpath_radius=0)
+    return ArrayTimetable.load(directory)
+
+
+def departures(timetable, date, engine, time=TIME, earliest_departure=EARLIEST_DEPARTURE, **kwargs):
+    mapping = compute_map("Destination", date, time, earliest_departure, timetable=timetable, engine=engine, **kwargs)
+    return {value["name"]: None if value["departure"] is None else value["departure"].strftime("%H:%M") for value in mapping.values()}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_weekday(timetable, engine):
+    assert departures(timetable, MONDAY, engine) == {
+        "Destination": "08:45",
+        # ab: Alpha 08:00, Bravo 08:20, Destination 08:40, staying seated at Bravo
+        "Alpha": "08:00",
+        "Bravo": "08:20",
+        # cb arrives at Bravo 08:17, 3 minutes to change to ab
+        "Charlie": "08:00",
+        # eb arrives at Bravo 08:19, 1 minute is too short to change
+        "Echo": None,
+        # 5 minutes walk to Bravo, fw arrives at Whiskey 08:10
+        "Whiskey": "08:15",
+        "Foxtrot": "07:50",
+        # gd leaves Golf 05:30, three windows before the arrival, hg arrives at Golf 05:20
+        "Golf": "05:30",
+        "Hotel": "05:00",
+        "November": None,
+    }
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_journeys(timetable, engine):
+    mapping = compute_map("Destination", MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=engine)
+    assert (mapping["C"]["pred"], mapping["C"]["trip_id"], mapping["C"]["pred_arrival"]) == ("B", "cb", datetime.time(8, 17))
+    assert (mapping["W"]["pred"], mapping["W"]["trip_id"], mapping["W"]["pred_arrival"]) == ("B", TRANSFER, datetime.time(8, 20))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_earliest_departure_and_travel_time(timetable, engine):
+    result = departures(timetable, MONDAY, engine, earliest_departure=5 * 3600 + 10 * 60)
+    assert (result["Golf"], result["Hotel"]) == ("05:30", None)
+    result = departures(timetable, MONDAY, engine, max_travel_time=3600)
+    assert (result["Foxtrot"], result["Golf"]) == ("07:50", None)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_bbox_ends_early(timetable, engine):
+    full_stats, bbox_stats = {}, {}
+    full = compute_map("Destination", MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=engine, stats=full_stats)
+    # Alpha, Bravo, Charlie and Whiskey, all reached within the first window
+    bbox = (7.99, 47.04, 8.16, 47.11)
+    bounded = compute_map("Destination", MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=engine, bbox=bbox, stats=bbox_stats)
+    for stop_id in ("A", "B", "C", "W"):
+        assert bounded[stop_id] == full[stop_id]
+    # Golf leaves three windows before the arrival, the bounded search stops before
+    assert full["G"]["departure"] is not None and bounded["G"]["departure"] is None
+    assert bbox_stats["windows"] < full_stats["windows"]
+    assert bbox_stats["nodes_settled"] < full_stats["nodes_settled"]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("date", [SATURDAY, HOLIDAY])
+def test_calendar(timetable, engine, date):
+    # only ad runs, Alpha 08:10 to Destination 08:35
+    reached = {name: departure for name, departure in departures(timetable, date, engine).items() if departure is not None}
+    assert reached == {"Destination": "08:45", "Alpha": "08:10"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_low_memory(timetable, engine):
+    mapping = compute_map("Destination", MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=engine, low_memory=True)
+    assert isinstance(mapping, ArrayResult)
+    # only the representation changes, the search is the one of engine
+    expected = compute_map("Destination", MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=engine)
+    assert dict(mapping) == dict(mapping.items()) == expected
+    assert list(mapping.values()) == list(expected.values())
+    assert dict(restrict_to_window(mapping, 8 * 3600)) == restrict_to_window(expected, 8 * 3600)
+    # results of the same timetable share their stops
+    other = compute_map("Destination", SATURDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=engine, low_memory=True)
+    assert other._stop_table is mapping._stop_table
@@ -0,0 +1,63 @@
+import datetime
+import threading
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal.algorithm import QueryCancelled, compute_isochrone, compute_map
+from src.traversal.executor import QueryExecutor
+
+# a monday
+DATE = datetime.date(2024, 1, 15)
+
+
+@pytest.fixture(scope="module")
+def timetable():
+    return generate_timetable(num_stops=200, num_lines=20)
+
+
+def test_progress_reports_final_stops(timetable):
+    partials = []
+    mapping = compute_map("Stop 0", DATE, 12 * 3600, 6 * 3600, timetable=timetable, progress=partials.append)
+    assert len(partials) > 1
+    assert [len(partial) for partial in partials] == sorted(len(partial) for partial in partials)
+    for stop_id, value in partials[-1].items():
+        assert value["departure"] == mapping[stop_id]["departure"]
+
+
+def test_cancel_stops_at_window_boundary(timetable):
+    cancel = threading.Event()
+    partials = []
+    def progress(partial):
+        partials.append(partial)
+        cancel.set()
+    with pytest.raises(QueryCancelled):
+        compute_map("Stop 0", DATE, 12 * 3600, 0, timetable=timetable, progress=progress, cancel=cancel)
+    assert len(partials) == 1
+
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(QueryCancelled):
+        compute_isochrone("Stop 0", DATE, 8 * 3600, 3 * 3600, timetable=timetable, cancel=cancel)
+
+
+def test_executor_cancels_superseded_query():
+    started = threading.Event()
+    def slow(progress, cancel):
+        progress("partial")
+        started.set()
+        cancel.wait()
+        raise QueryCancelled()
+    def fast(progress, cancel):
+        return "result"
+
+    executor = QueryExecutor(max_workers=1)
+    first = executor.submit("session", slow)
+    started.wait(1)
+    second = executor.submit("session", fast)
+    assert second.wait(1)
+    assert second.result() == "result"
+    assert first.cancelled()
+    with pytest.raises(QueryCancelled):
+        first.result()
+    assert first.progress == "partial"
+    executor.shutdown()
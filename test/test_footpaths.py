@@ -0,0 +1,33 @@
+import numpy as np
+
+from src.traversal.footpaths import build_footpaths, pairs_within
+
+# degrees of latitude per metre
+DEGREES_PER_METRE = 1 / 111_195
+
+
+def test_pairs_within_matches_brute_force():
+    rnd = np.random.default_rng(0)
+    x, y = rnd.uniform(0, 5000, 500), rnd.uniform(0, 5000, 500)
+    i, j, distance = pairs_within(x, y, 300)
+    distances = np.hypot(x[:, np.newaxis] - x, y[:, np.newaxis] - y)
+    expected_i, expected_j = np.nonzero((distances <= 300) & ~np.eye(len(x), dtype=bool))
+    assert sorted(zip(i.tolist(), j.tolist())) == sorted(zip(expected_i.tolist(), expected_j.tolist()))
+    assert np.allclose(distance, distances[i, j])
+
+
+def test_footpaths_are_closed_and_keep_given_transfers():
+    # A, B, C and D on a line, 290 metres apart
+    stops = [(name, name, 47.0 + idx * 290 * DEGREES_PER_METRE, 8.0) for idx, name in enumerate("ABCD")]
+    walks = {(src, dst): time for src, dst, time in build_footpaths(stops, [("B", "A", 60)], radius=400, walking_speed=1.0, max_walking_time=800)}
+    # 290 metres take 5 minutes, rounded up
+    assert walks[("A", "B")] == 300
+    assert walks[("B", "A")] == 60
+    # C and D are too far from A to walk directly
+    assert walks[("A", "C")] == 600
+    assert walks[("C", "A")] == 360
+    assert ("A", "D") not in walks
+    assert walks[("D", "A")] == 660
+
+    walks = build_footpaths(stops, radius=400, walking_speed=1.0, max_walking_time=0)
+    assert len(walks) == 6
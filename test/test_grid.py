@@ -0,0 +1,67 @@
+import numpy as np
+from shapely.geometry import Point, shape
+
+from src.choropleth.geojson import with_properties
+from src.choropleth.grid import Grid, load_population_raster, project
+
+
+def test_cells_contain_their_stops():
+    rnd = np.random.default_rng(0)
+    lats, lons = rnd.uniform(45.8, 47.8, 2000), rnd.uniform(5.9, 10.5, 2000)
+    grid = Grid(1000, lats, lons)
+    stop_to_feature = grid.get_stop_to_feature()
+    features = grid.get_geojson()["features"]
+    for idx in range(0, 2000, 50):
+        assert shape(features[stop_to_feature[idx]]["geometry"]).contains(Point(lons[idx], lats[idx]))
+    # squares of 1000 metres
+    (west, south), _, (east, north), _, _ = features[0]["geometry"]["coordinates"][0]
+    x, y = project([south, north], [west, east])
+    assert np.allclose(np.diff(x), 1000) and np.allclose(np.diff(y), 1000)
+    assert np.array_equal(grid.assign(lats, lons), stop_to_feature)
+    assert grid.assign([0.0], [0.0])[0] == -1
+    assert grid.get_feature_covering_lat_lon(0.0, 0.0) is None
+
+
+def test_cells_west_of_the_origin():
+    # negative longitudes have negative columns
+    lats, lons = [51.48, 51.5, -33.9], [-0.1, 0.1, -70.6]
+    grid = Grid(1000, lats, lons)
+    features = grid.get_geojson()["features"]
+    for stop, feature in enumerate(grid.get_stop_to_feature()):
+        assert shape(features[feature]["geometry"]).contains(Point(lons[stop], lats[stop]))
+
+
+def test_results_do_not_share_properties():
+    grid = Grid(1000, [46.0, 47.0], [7.0, 8.0])
+    first = with_properties(grid.get_geojson(), [{"departure": "08:00"}, {"departure": "09:00"}])
+    second = with_properties(grid.get_geojson(), [{"departure": "10:00"}, {"departure": None}])
+    assert [feature["properties"] for feature in first["features"]] == [{"departure": "08:00"}, {"departure": "09:00"}]
+    assert [feature["properties"]["departure"] for feature in second["features"]] == ["10:00", None]
+    assert all(feature["properties"] == {} for feature in grid.get_geojson()["features"])
+    assert [feature["id"] for feature in first["features"]] == [feature["id"] for feature in grid.get_geojson()["features"]]
+
+
+def test_coarser_grid_merges_cells():
+    rnd = np.random.default_rng(1)
+    lats, lons = rnd.uniform(46.0, 47.0, 500), rnd.uniform(7.0, 8.0, 500)
+    fine, coarse = Grid(500, lats, lons), Grid(5000, lats, lons)
+    assert len(coarse.get_geojson()["features"]) < len(fine.get_geojson()["features"])
+    # stops sharing a fine cell share the coarse cell
+    fine_cells, coarse_cells = fine.get_stop_to_feature(), coarse.get_stop_to_feature()
+    for cell in np.unique(fine_cells):
+        assert len(np.unique(coarse_cells[fine_cells == cell])) == 1
+
+
+def test_population_raster(tmp_path):
+    # 2 x 2 pixels of 0.01 degrees
+    np.savez(tmp_path / "population.npz", population=np.array([[10, 0], [20, 30]]), west=7.0, south=46.0, east=7.02, north=46.02)
+    raster = load_population_raster(tmp_path / "population.npz")
+    lats, lons, population = raster
+    assert np.allclose(lats, [46.015, 46.005, 46.005])
+    assert np.allclose(lons, [7.005, 7.005, 7.015])
+    assert population.tolist() == [10, 20, 30]
+
+    # two stops in the cell of the north western pixel, one in the south eastern
+    grid = Grid(500, [46.015, 46.0151, 46.005], [7.005, 7.0051, 7.015])
+    assert grid.get_population(raster).sum() == 40
+    assert grid.get_stop_population(raster).tolist() == [5, 5, 30]
@@ -0,0 +1,131 @@
+import datetime
+import zipfile
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal.algorithm import compute_map
+from src.traversal.ingest import SnapshotWriter, ingest, parse_times
+from src.traversal.timetable import ArrayTimetable
+
+FEED = {
+    "stops.txt": """stop_id,stop_name,stop_lat,stop_lon,location_type,parent_station
+A,Alpha,47.0,8.0,,
+B,Beta,47.1,8.1,,
+C,Gamma,47.2,8.2,,
+""",
+    "calendar.txt": """service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date
+weekdays,1,1,1,1,1,0,0,20240101,20241231
+""",
+    "calendar_dates.txt": """service_id,date,exception_type
+weekdays,20240101,2
+special,20240106,1
+""",
+    "trips.txt": """route_id,service_id,trip_id
+r1,weekdays,t1
+r1,weekdays,t2
+r1,special,t3
+""",
+    # t1 is listed out of stop_sequence order and t2 has a stop without times
+    "stop_times.txt": """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+t1,08:10:00,08:11:00,B,2
+t1,08:00:00,08:00:00,A,1
+t1,08:20:00,08:20:00,C,3
+t2,23:50:00,23:50:00,C,1
+t2,,,B,2
+t2,24:10:00,24:10:00,A,3
+t3,9:00:00,9:00:00,A,1
+t3,09:30:00,09:30:00,C,2
+""",
+    "transfers.txt": """from_stop_id,to_stop_id,transfer_type,min_transfer_time
+A,B,2,300
+B,C,1,
+""",
+}
+
+
+def write_feed(path, files):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return str(path)
+
+
+@pytest.fixture(params=[1, 1000])
+def snapshot(tmp_path, request):
+    gtfs = write_feed(tmp_path / "feed.zip", FEED)
+    num_edges = ingest(gtfs, SnapshotWriter(str(tmp_path / "snapshot")), chunksize=request.param)
+    assert num_edges == 4
+    return ArrayTimetable.load(str(tmp_path / "snapshot"))
+
+
+def test_parse_times():
+    import pandas as pd
+    assert parse_times(pd.Series(["08:00:00", "9:05:30", " 25:10:00"])).tolist() == [28800, 32730, 90600]
+    with pytest.raises(ValueError):
+        parse_times(pd.Series(["8:00"]))
+
+
+def test_snapshot_edges(snapshot):
+    # a tuesday
+    edges = snapshot.get_edges_in_timerange(datetime.date(2024, 1, 2), 0, 30 * 3600)
+    assert edges == [
+        ("A", "B", 28800, 29400, "t1"),
+        ("B", "C", 29460, 30000, "t1"),
+        ("C", "A", 85800, 87000, "t2"),
+    ]
+    assert snapshot.get_transfers() == [("A", "B", 300)]
+    assert snapshot.get_locations()[0] == ("A", "Alpha", 47.0, 8.0)
+    assert snapshot.get_version() == "2024-01-01_2024-12-31_2_3"
+
+
+def test_snapshot_calendar_dates(snapshot):
+    # removed on new year's day, a monday
+    assert snapshot.get_service_pattern(datetime.date(2024, 1, 1)) == frozenset()
+    # added on a saturday
+    assert snapshot.get_service_pattern(datetime.date(2024, 1, 6)) == frozenset({"special"})
+    assert snapshot.get_edges_in_timerange(datetime.date(2024, 1, 6), 0, 30 * 3600) == [("A", "C", 32400, 34200, "t3")]
+
+
+def test_trips_must_be_contiguous(tmp_path):
+    files = dict(FEED)
+    files["stop_times.txt"] = """trip_id,arrival_time,departure_time,stop_id,stop_sequence
+t1,08:00:00,08:00:00,A,1
+t2,23:50:00,23:50:00,C,1
+t1,08:10:00,08:11:00,B,2
+"""
+    gtfs = write_feed(tmp_path / "feed.zip", files)
+    with pytest.raises(ValueError):
+        ingest(gtfs, SnapshotWriter(str(tmp_path / "snapshot")), chunksize=1)
+
+
+def test_save_load_roundtrip(tmp_path):
+    timetable = generate_timetable(num_stops=50, num_lines=5)
+    timetable.save(str(tmp_path))
+    loaded = ArrayTimetable.load(str(tmp_path))
+    date = datetime.date(2024, 1, 15)
+    assert loaded.get_edges_in_timerange(date, 8 * 3600, 9 * 3600) == timetable.get_edges_in_timerange(date, 8 * 3600, 9 * 3600)
+    assert loaded.get_transfers() == timetable.get_transfers()
+    assert loaded.get_service_pattern(date) == timetable.get_service_pattern(date)
+    assert isinstance(loaded._connections["departure"], np.memmap)
+
+
+def test_previous_day_after_midnight(tmp_path):
+    files = dict(FEED)
+    # t4 leaves the friday service day at 01:10 on saturday
+    files["trips.txt"] = FEED["trips.txt"] + "r1,weekdays,t4\n"
+    files["stop_times.txt"] = FEED["stop_times.txt"] + """t4,25:10:00,25:10:00,A,1
+t4,25:40:00,25:40:00,C,2
+"""
+    gtfs = write_feed(tmp_path / "feed.zip", files)
+    ingest(gtfs, SnapshotWriter(str(tmp_path / "snapshot")))
+    timetable = ArrayTimetable.load(str(tmp_path / "snapshot"))
+    saturday = datetime.date(2024, 1, 6)
+    assert timetable.get_edges_in_timerange(saturday, 0, 2 * 3600) == [("A", "C", 4200, 6000, "t4")]
+    assert timetable.get_service_pattern(saturday) == frozenset({"special", "previous day:weekdays"})
+    # nothing runs on sunday and monday the first is removed
+    assert timetable.get_edges_in_timerange(datetime.date(2024, 1, 2), 0, 2 * 3600) == []
+
+    mapping = compute_map("Gamma", saturday, 2 * 3600, 0, timetable=timetable)
+    assert mapping["A"]["departure"] == datetime.time(1, 10)
+    assert mapping["A"]["trip_id"] == "t4"
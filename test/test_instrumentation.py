@@ -0,0 +1,61 @@
+import time
+
+from src.helpers import instrumentation
+
+
+def test_stages_are_exclusive():
+    with instrumentation.report("query") as query_report:
+        with instrumentation.stage("outer"):
+            time.sleep(0.02)
+            with instrumentation.stage("inner"):
+                time.sleep(0.02)
+    assert query_report.stages["inner"] >= 0.02
+    assert 0.02 <= query_report.stages["outer"] < 0.04
+    assert sum(query_report.stages.values()) <= query_report.total()
+
+
+def test_counters_accumulate():
+    with instrumentation.report("query") as query_report:
+        instrumentation.count("edges_loaded", 10)
+        instrumentation.count("edges_loaded", 5)
+        instrumentation.count("window_reloads")
+    assert query_report.counters == {"edges_loaded": 15, "window_reloads": 1}
+
+
+def test_nested_reports_record_into_outermost():
+    with instrumentation.report("outer") as outer:
+        with instrumentation.report("inner") as inner:
+            instrumentation.count("nodes_settled")
+    assert inner is outer
+    assert outer.counters["nodes_settled"] == 1
+
+
+def test_no_report_is_a_noop():
+    assert instrumentation.get_current_report() is None
+    with instrumentation.stage("traversal"):
+        instrumentation.count("nodes_settled")
+
+
+def test_memory_peaks():
+    with instrumentation.report("query", trace_memory=True) as query_report:
+        with instrumentation.stage("outer"):
+            outer = bytearray(4 * 2 ** 20)
+            with instrumentation.stage("inner"):
+                inner = bytearray(2 * 2 ** 20)
+                del inner
+            del outer
+        with instrumentation.stage("after"):
+            pass
+    assert 2 * 2 ** 20 <= query_report.memory["inner"] < 3 * 2 ** 20
+    # nested stages count towards the peak of the enclosing stage
+    assert 6 * 2 ** 20 <= query_report.memory["outer"] < 7 * 2 ** 20
+    assert query_report.memory["after"] < 2 ** 20
+    assert query_report.peak_memory >= query_report.memory["outer"]
+    assert "peak_memory" in str(query_report)
+
+
+def test_memory_is_not_traced_by_default():
+    with instrumentation.report("query") as query_report:
+        with instrumentation.stage("outer"):
+            pass
+    assert query_report.memory == {} and query_report.peak_memory is None
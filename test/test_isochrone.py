@@ -0,0 +1,110 @@
+import datetime
+import os
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal.algorithm import SECONDS_TO_CHANGE, TRANSFER, compute_isochrone
+from src.traversal.ingest import SnapshotWriter, ingest
+from src.traversal.timetable import ArrayTimetable
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "gtfs")
+# a monday
+DATE = datetime.date(2024, 1, 15)
+
+
+@pytest.fixture(scope="module")
+def fixture_timetable(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("snapshot"))
+    ingest(FIXTURE, SnapshotWriter(directory), footpath_radius=0)
+    return ArrayTimetable.load(directory)
+
+
+@pytest.fixture(scope="module")
+def timetable():
+    return generate_timetable(num_stops=200, num_lines=20)
+
+
+def arrivals(timetable, location, time, max_duration):
+    mapping = compute_isochrone(location, DATE, time, max_duration, timetable=timetable)
+    return {value["name"]: None if value["arrival"] is None else value["arrival"].strftime("%H:%M") for value in mapping.values() if value["arrival"] is not None}
+
+
+def test_fixture_arrivals(fixture_timetable):
+    # cb arrives at Bravo 08:17, 3 minutes to change to ab, which arrives at Destination 08:40
+    assert arrivals(fixture_timetable, "Charlie", 7 * 3600 + 55 * 60, 3600) == {
+        "Charlie": "07:55", "Bravo": "08:17", "Destination": "08:40",
+    }
+    # eb arrives at Bravo 08:19, 1 minute is too short to change to ab, bd arrives 08:50
+    assert arrivals(fixture_timetable, "Echo", 8 * 3600, 3600)["Destination"] == "08:50"
+    # staying seated on ab at Bravo needs no change time
+    assert arrivals(fixture_timetable, "Alpha", 7 * 3600 + 55 * 60, 3600)["Destination"] == "08:40"
+
+
+def test_fixture_budget(fixture_timetable):
+    # Destination at 08:40 is outside of a 40 minute budget
+    assert arrivals(fixture_timetable, "Charlie", 7 * 3600 + 55 * 60, 40 * 60) == {"Charlie": "07:55", "Bravo": "08:17"}
+
+
+def earliest_arrivals(timetable, origin, date, time, latest_arrival):
+    """Exact earliest arrivals by a forward connection scan with one flag per trip."""
+    stop_ids = [stop_id for stop_id, _, _, _ in timetable.get_locations()]
+    INFTY = float("inf")
+    # arrival by vehicle needs the change time before another trip, arrival on foot does not
+    ride = dict.fromkeys(stop_ids, INFTY)
+    walk = dict.fromkeys(stop_ids, INFTY)
+    walk[origin] = time
+    out_transfers = timetable.get_out_transfers()
+
+    def walk_from(stop_id):
+        stack = [stop_id]
+        while stack:
+            src = stack.pop()
+            arrival = min(ride[src], walk[src])
+            for dst, transfer_time in out_transfers.get(src, []):
+                if arrival + transfer_time <= latest_arrival and arrival + transfer_time < walk[dst]:
+                    walk[dst] = arrival + transfer_time
+                    stack.append(dst)
+
+    walk_from(origin)
+    boarded = set()
+    edges = timetable.get_edges_in_timerange(date, time, latest_arrival)
+    for src, dst, dep, arr, trip_id in sorted(edges, key=lambda edge: (edge[2], edge[3])):
+        if trip_id in boarded or dep >= min(ride[src] + SECONDS_TO_CHANGE, walk[src]):
+            boarded.add(trip_id)
+            if arr <= latest_arrival and arr < ride[dst]:
+                ride[dst] = arr
+                walk_from(dst)
+    return {stop_id: min(ride[stop_id], walk[stop_id]) for stop_id in stop_ids}
+
+
+def seconds(value):
+    return float("inf") if value is None else value.hour * 3600 + value.minute * 60
+
+
+def minutes(value):
+    """compute_isochrone reports minutes."""
+    return value if value == float("inf") else value - value % 60
+
+
+@pytest.mark.parametrize("location", ["Stop 0", "Stop 17", "Stop 123"])
+def test_never_beats_exact_scan(timetable, location):
+    time, max_duration = 8 * 3600, 2 * 3600
+    mapping = compute_isochrone(location, DATE, time, max_duration, timetable=timetable)
+    origin = next(stop_id for stop_id, value in mapping.items() if value["name"] == location)
+    expected = earliest_arrivals(timetable, origin, DATE, time, time + max_duration)
+    # one label per stop never does better, and stays within the budget
+    assert all(seconds(value["arrival"]) >= minutes(expected[stop_id]) for stop_id, value in mapping.items())
+    assert all(seconds(value["arrival"]) <= time + max_duration for value in mapping.values() if value["arrival"] is not None)
+    reached = [stop_id for stop_id, value in mapping.items() if value["arrival"] is not None]
+    assert len(reached) > 1
+    assert set(reached) == {stop_id for stop_id, arrival in expected.items() if arrival <= time + max_duration}
+
+    # every leg departs after the arrival at its predecessor
+    for stop_id in reached:
+        value = mapping[stop_id]
+        if value["pred"] is None:
+            continue
+        pred = mapping[value["pred"]]
+        assert seconds(pred["arrival"]) <= seconds(value["arrival"])
+        if value["trip_id"] != TRANSFER:
+            assert value["pred"] != stop_id
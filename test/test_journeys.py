@@ -0,0 +1,78 @@
+import datetime
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal.algorithm import TRANSFER, compute_map
+from src.traversal.journeys import JourneyIndex
+from src.traversal.result import ArrayResult, StopTable
+
+# a monday
+DATE = datetime.date(2024, 1, 15)
+
+
+@pytest.fixture(scope="module")
+def mapping():
+    timetable = generate_timetable(num_stops=200, num_lines=20)
+    return compute_map("Stop 0", DATE, 12 * 3600, 6 * 3600, timetable=timetable, low_memory=True)
+
+
+def walk(mapping, stop_id):
+    """The hops from stop_id to the destination, following pred one stop at a time."""
+    hops = []
+    while mapping[stop_id]["pred"] is not None:
+        hops.append((stop_id, mapping[stop_id]["pred"]))
+        stop_id = mapping[stop_id]["pred"]
+    return hops
+
+
+def test_legs_follow_pred_chain(mapping):
+    index = mapping.journey_index()
+    # a view of the records, times in seconds
+    assert np.shares_memory(index.departure, mapping.records)
+    position = {stop_id: idx for idx, stop_id in enumerate(mapping)}
+    stop_ids = [stop_id for stop_id, value in mapping.items() if value["departure"] is not None]
+    legs = index.legs(stop_ids)
+    assert len(legs["journey"]) > 0
+
+    for journey, stop_id in enumerate(stop_ids):
+        rows = [idx for idx in range(len(legs["journey"])) if legs["journey"][idx] == journey]
+        hops = walk(mapping, stop_id)
+        assert sum(legs["stops"][idx] for idx in rows) == len(hops)
+        assert [legs["leg"][idx] for idx in rows] == list(range(len(rows)))
+        if len(rows) == 0:
+            continue
+        assert legs["from"][rows[0]] == stop_id
+        assert legs["departure"][rows[0]] == mapping.records["departure"][position[stop_id]]
+        assert legs["to"][rows[-1]] == hops[-1][1]
+        for previous, current in zip(rows, rows[1:]):
+            assert legs["to"][previous] == legs["from"][current]
+            assert legs["arrival"][previous] <= legs["departure"][current]
+        for idx in rows:
+            if legs["trip_id"][idx] == TRANSFER:
+                assert legs["stops"][idx] == 1
+
+
+def test_unreachable_and_cyclic_journeys_have_no_legs():
+    names = ["A", "B", "C", "D", "E"]
+    # B -> A is a valid journey, C <-> D is a cycle and E is unreachable
+    index = JourneyIndex(names, names, [-1, 0, 3, 2, -1], [-1, 0, 0, 0, -1], [36000, 32400, 30000, 30000, -1], [-1, 35000, 31000, 31000, -1], ["t1"])
+    legs = index.legs(["B", "C", "E"])
+    assert legs["journey"].tolist() == [0]
+    assert legs["from"] == ["B"]
+    assert legs["to"] == ["A"]
+    assert legs["arrival"].tolist() == [35000]
+
+
+def test_times_after_midnight():
+    # A 00:20 (24:20) <- B 23:50 on t1, C walks to B
+    stop_table = StopTable([("A", "A", 0.0, 0.0), ("B", "B", 0.0, 0.0), ("C", "C", 0.0, 0.0)])
+    mapping = ArrayResult.from_labels(stop_table, {
+        "A": {"departure": 87600, "pred": None, "trip_id": None, "pred_arrival": -1},
+        "B": {"departure": 85800, "pred": "A", "trip_id": "t1", "pred_arrival": 87300},
+        "C": {"departure": 85500, "pred": "B", "trip_id": TRANSFER, "pred_arrival": 85700},
+    })
+    legs = mapping.journey_index().legs(["C"])
+    assert legs["trip_id"] == [TRANSFER, "t1"]
+    assert legs["departure"].tolist() == [85500, 85800]
+    assert legs["arrival"].tolist() == [85700, 87300]
@@ -1,7 +1,12 @@
-from src.traversal.algorithm import compute_map, parse_date, parse_time, print_time
-
+import os
 import pytest
 
+from src.traversal.algorithm import compute_map, parse_date, parse_time, print_time, seconds_to_time
+from src.traversal.timetable import DatabaseTimetable
+
+# these tests need the database loaded with the 2023 timetable, see test_end_to_end for offline tests
+pytestmark = pytest.mark.skipif("DBHOST" not in os.environ, reason="needs the database with the 2023 timetable")
+
 
 TESTS = {
     "ZUE_1": {
@@ -31,7 +36,8 @@ def zue_1_result():
         testcase["destination"], 
         parse_date(testcase["date"]), 
         parse_time(testcase["time"]),
-        earliest_departure=parse_time(testcase["time_lb"])
+        earliest_departure=parse_time(testcase["time_lb"]),
+        timetable=DatabaseTimetable()
     )
     return mapping
 
@@ -41,7 +47,7 @@ def test_zue_1(location, zue_1_result):
     for startpoint in zue_1_result.values():
         name = startpoint["name"]
         if name == location:
-            expected_departure = parse_time(TESTS["ZUE_1"]["expected_results"][location])
+            expected_departure = seconds_to_time(parse_time(TESTS["ZUE_1"]["expected_results"][location]))
             departure = startpoint["departure"]
             assert departure == expected_departure, f"{print_time(departure)} = {print_time(expected_departure)}"
 
@@ -0,0 +1,45 @@
+import datetime
+import os
+import numpy as np
+import pytest
+
+from src.traversal.algorithm import compute_map
+from src.traversal.ingest import SnapshotWriter, ingest
+from src.traversal.matrix import compute_matrix
+from src.traversal.timetable import ArrayTimetable
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "gtfs")
+MONDAY = datetime.date(2024, 1, 15)
+TIME = 8 * 3600 + 45 * 60
+EARLIEST_DEPARTURE = 5 * 3600
+
+
+@pytest.fixture(scope="module")
+def timetable(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("snapshot"))
+    ingest(FIXTURE, SnapshotWriter(directory), footpath_radius=0)
+    return ArrayTimetable.load(directory)
+
+
+def test_matches_compute_map(timetable):
+    locations = timetable.get_locations()
+    # one row per stop, the last row collects two stops
+    stop_to_row = np.arange(len(locations), dtype=np.int32)
+    stop_to_row[-1] = len(locations) - 2
+    destinations = ["Destination", None, "Bravo"]
+    computed = []
+    matrix = compute_matrix(
+        destinations, MONDAY, TIME, EARLIEST_DEPARTURE, stop_to_row, len(locations) - 1,
+        timetable=timetable, progress=lambda column, partial: computed.append(column)
+    )
+    assert computed == [0, 2]
+    assert np.all(np.isnan(matrix[:, 1]))
+    for column in (0, 2):
+        mapping = compute_map(destinations[column], MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable)
+        expected = np.full(len(locations) - 1, np.nan, dtype=np.float32)
+        for row, (stop_id, _, _, _) in zip(stop_to_row, locations):
+            departure = mapping[stop_id]["departure"]
+            if departure is not None:
+                expected[row] = np.fmax(expected[row], departure.hour * 60 + departure.minute)
+        assert np.array_equal(matrix[:, column], expected, equal_nan=True)
+    assert np.sum(~np.isnan(matrix[:, 0])) > 1
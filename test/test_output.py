@@ -0,0 +1,36 @@
+import json
+import pytest
+from click.testing import CliRunner
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal import timetable
+from src.traversal.algorithm import main
+
+
+@pytest.fixture
+def synthetic_timetable(monkeypatch):
+    monkeypatch.setattr(timetable, "_default_timetable", generate_timetable(num_stops=200, num_lines=20))
+
+
+QUERIES = "\n".join(json.dumps(query) for query in [
+    {"location": "Stop 0", "date": "2024-01-15", "time": "12:00"},
+    {"location": "Nowhere", "date": "2024-01-15", "time": "12:00"},
+    {"location": "Stop 1", "date": "2024-01-15", "time": "10:00", "earliest_departure": "08:00"},
+])
+
+
+def test_ndjson_streams_reachable_stops_per_query(synthetic_timetable):
+    result = CliRunner().invoke(main, ["--queries", "-", "--format", "ndjson"], input=QUERIES)
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.stdout.splitlines() if line.startswith("{")]
+    assert {record["query"] for record in records} == {0, 2}
+    assert all(record["departure"] >= "08:00" for record in records if record["query"] == 2)
+    assert {"query": 0, "stop_id": "0", "name": "Stop 0", "departure": "12:00", "pred": None, "trip_id": "transfer"} in records
+
+
+def test_arrow_writes_one_batch_per_query(synthetic_timetable):
+    pyarrow = pytest.importorskip("pyarrow")
+    result = CliRunner().invoke(main, ["--queries", "-", "--format", "arrow"], input=QUERIES)
+    assert result.exit_code == 0
+    reader = pyarrow.ipc.open_stream(result.stdout_bytes)
+    assert [batch.column("query")[0].as_py() for batch in reader] == [0, 2]
@@ -0,0 +1,34 @@
+import os
+
+from src.helpers.profiling import profile_query
+
+
+def busy_loop():
+    total = 0
+    for i in range(2_000_000):
+        total += i * i
+    return total
+
+
+def test_sampling_profile_is_written(tmp_path):
+    params = {"location": "Bern, Wankdorf", "time": "09:15"}
+    with profile_query("compute_map", params, enabled=True, output_dir=str(tmp_path)) as query_profile:
+        busy_loop()
+    suffixes = sorted(os.path.splitext(path)[1] for path in query_profile.paths)
+    assert suffixes == [".collapsed", ".json", ".svg"]
+    assert all("Bern-Wankdorf" in os.path.basename(path) for path in query_profile.paths)
+    with open(next(path for path in query_profile.paths if path.endswith(".collapsed")), encoding="utf-8") as f:
+        assert "busy_loop" in f.read()
+
+
+def test_fast_queries_below_threshold_are_dropped(tmp_path):
+    with profile_query("compute_map", {}, threshold=60, output_dir=str(tmp_path)) as query_profile:
+        busy_loop()
+    assert query_profile.paths == []
+    assert query_profile.duration is not None
+
+
+def test_cprofile_method(tmp_path):
+    with profile_query("compute_map", {"a": 1}, enabled=True, method="cprofile", output_dir=str(tmp_path)) as query_profile:
+        busy_loop()
+    assert sorted(os.path.splitext(path)[1] for path in query_profile.paths) == [".json", ".prof", ".txt"]
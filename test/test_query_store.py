@@ -0,0 +1,36 @@
+import os
+import numpy as np
+
+from src.helpers.query_store import QueryStore
+
+
+def arrays(value, size=1000):
+    return {"features": np.full(size, value, dtype=np.float32), "stops": np.full(2 * size, value, dtype=np.float32)}
+
+
+def test_offloads_least_recently_used_entries(tmp_path):
+    # room for two entries of 12 kB
+    store = QueryStore(max_bytes=25000, directory=str(tmp_path))
+    for value in range(4):
+        store.put(("query", value), arrays(value))
+    assert store.keys() == [("query", value) for value in range(4)]
+    stats = store.stats()
+    assert (stats["in_memory"], stats["on_disk"]) == (2, 2)
+    assert stats["bytes_in_memory"] <= 25000
+    assert len(os.listdir(tmp_path)) == 2
+
+    # loading an offloaded entry offloads another one
+    assert np.all(store.get(("query", 0))["stops"] == 0)
+    assert store.stats()["on_disk"] == 2
+    assert ("query", 1) in store
+    for value in range(4):
+        assert np.all(store.get(("query", value))["features"] == value)
+
+
+def test_put_replaces_entry():
+    store = QueryStore(max_bytes=25000)
+    store.put("a", arrays(1))
+    store.put("a", arrays(2))
+    assert store.keys() == ["a"]
+    assert store.stats()["bytes_in_memory"] == 12000
+    assert np.all(store.get("a")["features"] == 2)
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import pickle
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.synthetic import generate_partition, generate_timetable
+from src.traversal.service import create_app
+from src.traversal.timetable import DatabaseTimetable
+
+
+@pytest.fixture(scope="module")
+def timetable():
+    return generate_timetable(num_stops=200, num_lines=20)
+
+
+@pytest.fixture
+def app(timetable):
+    # an application runs on one event loop only
+    return create_app(timetable, generate_partition(4, 2), processes=2)
+
+
+def fetch(app, *requests):
+    """Answers the (path, params) requests concurrently, returns [(status, content_type, body)]."""
+    async def run():
+        async with TestClient(TestServer(app)) as client:
+            async def get(path, params):
+                response = await client.get(path, params=params)
+                return response.status, response.content_type, await response.read()
+            return await asyncio.gather(*(get(path, params) for path, params in requests))
+    return asyncio.run(run())
+
+
+QUERY = {"location": "Stop 0", "date": "2024-01-15", "time": "12:00", "earliest_departure": "06:00"}
+
+
+def test_latest_departure_and_choropleth(app):
+    (stops_status, _, stops_body), (status, content_type, body), (_, _, choropleth_body) = fetch(
+        app, ("/stops", {}), ("/latest-departure", QUERY), ("/choropleth", QUERY)
+    )
+    assert stops_status == 200 and status == 200
+    assert content_type == "application/json"
+    stops = json.loads(stops_body)
+    result = json.loads(body)
+    assert result["stop_id"] == stops["stop_id"]
+    assert result["latest_departure"][stops["name"].index("Stop 0")] == 12 * 60
+    reachable = [departure for departure in result["latest_departure"] if departure is not None]
+    assert len(reachable) > 1 and min(reachable) >= 6 * 60
+
+    choropleth = json.loads(choropleth_body)
+    assert len(choropleth["feature_id"]) == 8
+    assert max(value for value in choropleth["latest_departure"] if value is not None) == 12 * 60
+
+
+def test_bad_requests(app):
+    responses = fetch(
+        app,
+        ("/latest-departure", {**QUERY, "location": "Nowhere"}),
+        ("/latest-departure", {"location": "Stop 0"}),
+        ("/latest-departure", {**QUERY, "format": "xml"}),
+    )
+    assert [status for status, _, _ in responses] == [404, 400, 400]
+
+
+def test_binary_formats():
+    msgpack = pytest.importorskip("msgpack")
+    pyarrow = pytest.importorskip("pyarrow")
+    from src.traversal.service import ARROW, MSGPACK, encode
+    columns = {"stop_id": ["1", "2"], "latest_departure": [540.0, None]}
+    assert msgpack.unpackb(encode(columns, MSGPACK)) == columns
+    assert pyarrow.ipc.open_stream(encode(columns, ARROW)).read_all().to_pydict() == columns
+
+
+def test_database_timetable_is_sent_without_connection(tmp_path):
+    # workers get the database of the service, not whatever their default timetable is
+    timetable = DatabaseTimetable(f"sqlite:///{tmp_path / 'timetable.db'}")
+    timetable._execute("SELECT 1")
+    copy = pickle.loads(pickle.dumps(timetable))
+    assert copy._conn is None and timetable._conn is not None
+    assert copy._database_uri == timetable._database_uri
+    assert copy._execute("SELECT 1").fetchone() == (1,)
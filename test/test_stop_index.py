@@ -0,0 +1,52 @@
+import datetime
+import json
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal import stop_index
+from src.traversal.algorithm import UnknownLocation, compute_map
+from src.traversal.stop_index import build_stop_index, load_stop_names, refresh_stop_index
+
+
+@pytest.fixture
+def timetable(monkeypatch):
+    timetable = generate_timetable(num_stops=20, num_lines=2)
+    monkeypatch.setattr(stop_index, "get_timetable_version", timetable.get_version)
+    monkeypatch.setattr(stop_index, "get_all_stop_names", lambda: [name for _, name, _, _ in timetable.get_locations()])
+    return timetable
+
+
+def test_round_trip(tmp_path, timetable):
+    path = str(tmp_path / "stop_names.json")
+    assert load_stop_names(path) is None
+    index = build_stop_index(path)
+    assert index["version"] == timetable.get_version()
+    assert load_stop_names(path, timetable.get_version()) == sorted({name for _, name, _, _ in timetable.get_locations()})
+
+
+def test_stale_index_is_rebuilt(tmp_path, timetable):
+    path = str(tmp_path / "stop_names.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": "old", "names": ["Gone"]}, f)
+    # without a version the index is taken as is
+    assert load_stop_names(path) == ["Gone"]
+    names = load_stop_names(path, timetable.get_version())
+    assert "Gone" not in names and "Stop 0" in names
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f)["version"] == timetable.get_version()
+
+
+def test_refresh(tmp_path, timetable):
+    path = str(tmp_path / "stop_names.json")
+    assert not refresh_stop_index(path)
+    build_stop_index(path)
+    assert not refresh_stop_index(path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": "old", "names": ["Gone"]}, f)
+    assert refresh_stop_index(path)
+    assert "Gone" not in load_stop_names(path)
+
+
+def test_unknown_location_raises(timetable):
+    with pytest.raises(UnknownLocation):
+        compute_map("Gone", datetime.date(2024, 1, 15), 12 * 3600, timetable=timetable)
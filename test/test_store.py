@@ -0,0 +1,86 @@
+import datetime
+import os
+import numpy as np
+import pytest
+
+from src.traversal.algorithm import compute_map
+from src.traversal.cache import restrict_to_window
+from src.traversal.ingest import SnapshotWriter, ingest
+from src.traversal.store import ResultStore
+from src.traversal.timetable import ArrayTimetable
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "gtfs")
+MONDAY = datetime.date(2024, 1, 15)
+TIME = 8 * 3600 + 45 * 60
+EARLIEST_DEPARTURE = 5 * 3600
+
+
+@pytest.fixture(scope="module")
+def timetable(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("snapshot"))
+    ingest(FIXTURE, SnapshotWriter(directory), footpath_radius=0)
+    return ArrayTimetable.load(directory)
+
+
+@pytest.fixture(scope="module")
+def mapping(timetable):
+    return compute_map("Destination", MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable)
+
+
+def test_round_trip(tmp_path, timetable, mapping):
+    pattern = timetable.get_service_pattern(MONDAY)
+    ResultStore(tmp_path, "v1").put("Destination", pattern, TIME, EARLIEST_DEPARTURE, mapping)
+    assert os.path.exists(tmp_path / "v1" / "index.json")
+
+    # a new store reads the files
+    store = ResultStore(tmp_path, "v1")
+    assert store.contains("Destination", pattern, TIME, EARLIEST_DEPARTURE)
+    assert dict(store.get("Destination", pattern, TIME, EARLIEST_DEPARTURE)) == mapping
+    # a later earliest departure is answered by filtering, an earlier one is not
+    later = store.get("Destination", pattern, TIME, 8 * 3600)
+    assert dict(later) == restrict_to_window(mapping, 8 * 3600, TIME)
+    assert store.get("Destination", pattern, TIME, 0) is None
+    assert store.get("Destination", pattern, TIME + 60, EARLIEST_DEPARTURE) is None
+    assert store.get("Destination", timetable.get_service_pattern(datetime.date(2024, 1, 20)), TIME, EARLIEST_DEPARTURE) is None
+    # every timetable version has its own results
+    assert ResultStore(tmp_path, "v2").get("Destination", pattern, TIME, EARLIEST_DEPARTURE) is None
+
+
+def test_results_after_midnight(tmp_path, timetable, mapping):
+    pattern = timetable.get_service_pattern(MONDAY)
+    # arrival at 25:00, 00:10 is 24:10 and 23:50 the day before
+    first, second = list(mapping)[:2]
+    after_midnight = {
+        **{stop_id: {**value, "departure": None, "pred": None, "trip_id": None, "pred_arrival": None} for stop_id, value in mapping.items()},
+        first: {**mapping[first], "departure": datetime.time(0, 10), "pred": None, "trip_id": None, "pred_arrival": None},
+        second: {**mapping[second], "departure": datetime.time(23, 50), "pred": first, "trip_id": "t1", "pred_arrival": datetime.time(0, 5)},
+    }
+    store = ResultStore(tmp_path, "v1")
+    store.put("Destination", pattern, 25 * 3600, 0, after_midnight)
+    stored = store.get("Destination", pattern, 25 * 3600, 0)
+    departures = stored.records["departure"]
+    assert departures[0] == 24 * 3600 + 600 and departures[1] == 24 * 3600 - 600
+    assert stored.records["pred_arrival"][1] == 24 * 3600 + 300
+    assert dict(stored) == after_midnight
+    later = store.get("Destination", pattern, 25 * 3600, 24 * 3600)
+    assert later[first]["departure"] == datetime.time(0, 10)
+    assert later[second]["departure"] is None
+
+    # array results are stored with the seconds of the traversal
+    array = compute_map("Destination", MONDAY, TIME, EARLIEST_DEPARTURE, timetable=timetable, low_memory=True)
+    store.put("Destination", pattern, TIME, EARLIEST_DEPARTURE, array)
+    assert np.array_equal(ResultStore(tmp_path, "v1").get("Destination", pattern, TIME, EARLIEST_DEPARTURE).records, array.records)
+
+
+def test_changed_stops_replace_the_results(tmp_path, timetable, mapping):
+    pattern = timetable.get_service_pattern(MONDAY)
+    store = ResultStore(tmp_path, "v1")
+    store.put("Destination", pattern, TIME, EARLIEST_DEPARTURE, mapping)
+    # the same version ingested again with one more stop
+    more_stops = {**mapping, "X": {"name": "X-ray", "lat": 0.0, "lon": 0.0, "departure": None, "pred": None, "trip_id": None, "pred_arrival": None}}
+    store.put("Destination", pattern, TIME, 0, more_stops)
+
+    store = ResultStore(tmp_path, "v1")
+    assert not store.contains("Destination", pattern, TIME, EARLIEST_DEPARTURE)
+    assert dict(store.get("Destination", pattern, TIME, 0)) == more_stops
+    assert len(list((tmp_path / "v1").glob("*.npy"))) == 1
@@ -0,0 +1,48 @@
+import datetime
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.helpers import instrumentation
+from src.traversal.algorithm import compute_map, compute_map_sweep, date_range, sweep_departures
+
+# monday to sunday of the following week
+START = datetime.date(2024, 1, 15)
+END = datetime.date(2024, 1, 28)
+
+
+@pytest.fixture(scope="module")
+def timetable():
+    return generate_timetable(num_stops=200, num_lines=20)
+
+
+def test_date_range_weekdays():
+    assert len(date_range(START, END)) == 14
+    assert date_range(START, END, weekdays={5, 6}) == [
+        datetime.date(2024, 1, 20), datetime.date(2024, 1, 21), datetime.date(2024, 1, 27), datetime.date(2024, 1, 28)
+    ]
+
+
+def test_sweep_computes_every_service_pattern_once(timetable):
+    with instrumentation.report("sweep") as query_report:
+        results = compute_map_sweep("Stop 0", START, END, 12 * 3600, 6 * 3600, timetable=timetable)
+    assert list(results) == date_range(START, END)
+    # trips run past midnight, so mondays (after a sunday), tuesdays to fridays, saturdays and sundays differ
+    assert query_report.counters["service_patterns"] == 4
+    assert len({id(mapping) for mapping in results.values()}) == 4
+    assert results[START + datetime.timedelta(days=1)] is results[START + datetime.timedelta(days=4)]
+    for date in (START, datetime.date(2024, 1, 27), END):
+        assert results[date] == compute_map("Stop 0", date, 12 * 3600, 6 * 3600, timetable=timetable)
+
+
+def test_sweep_departures(timetable):
+    results = compute_map_sweep("Stop 0", START, END, 12 * 3600, 6 * 3600, weekdays={0, 6}, timetable=timetable)
+    dates, stop_ids, minutes = sweep_departures(results)
+    assert dates == [START, datetime.date(2024, 1, 21), datetime.date(2024, 1, 22), END]
+    assert minutes.shape == (4, len(stop_ids))
+    assert np.array_equal(minutes[0], minutes[2], equal_nan=True)
+    departure = results[END][stop_ids[0]]["departure"]
+    if departure is None:
+        assert np.isnan(minutes[3, 0])
+    else:
+        assert minutes[3, 0] == departure.hour * 60 + departure.minute
@@ -0,0 +1,112 @@
+import datetime
+import pytest
+
+from benchmarks.synthetic import generate_timetable
+from src.traversal.algorithm import DIJKSTRA, SECONDS_TO_CHANGE, TRANSFER, TRIP_BASED, compute_map
+from src.traversal.timetable import DAY, DatabaseTimetable
+
+# a monday
+DATE = datetime.date(2024, 1, 15)
+TIME = 12 * 3600
+EARLIEST_DEPARTURE = 6 * 3600
+
+
+@pytest.fixture(scope="module")
+def timetable():
+    return generate_timetable(num_stops=200, num_lines=20)
+
+
+def latest_departures(timetable, destination, date, time, earliest_departure):
+    """Exact latest departures by a reverse connection scan with one flag per trip."""
+    stop_ids = [stop_id for stop_id, _, _, _ in timetable.get_locations()]
+    board = dict.fromkeys(stop_ids, -1)
+    walk = dict.fromkeys(stop_ids, -1)
+    walk[destination] = time
+    in_transfers = timetable.get_in_transfers()
+
+    def walk_from(stop_id):
+        stack = [stop_id]
+        while stack:
+            dst = stack.pop()
+            departure = max(board[dst], walk[dst])
+            for src, transfer_time in in_transfers.get(dst, []):
+                if departure - transfer_time >= earliest_departure and departure - transfer_time > walk[src]:
+                    walk[src] = departure - transfer_time
+                    stack.append(src)
+
+    walk_from(destination)
+    reached_trips = set()
+    edges = timetable.get_edges_in_timerange(date, earliest_departure, time)
+    for src, dst, dep, arr, trip_id in sorted(edges, key=lambda edge: (-edge[2], -edge[3])):
+        if trip_id in reached_trips or arr <= max(board[dst] - SECONDS_TO_CHANGE, walk[dst]):
+            reached_trips.add(trip_id)
+            if dep > board[src]:
+                board[src] = dep
+                walk_from(src)
+    departures = {stop_id: max(board[stop_id], walk[stop_id]) for stop_id in stop_ids}
+    # compute_map reports minutes
+    return {stop_id: departure - departure % 60 if departure >= 0 else -1 for stop_id, departure in departures.items()}
+
+
+def seconds(value):
+    return -1 if value is None else value.hour * 3600 + value.minute * 60
+
+
+@pytest.mark.parametrize("location", ["Stop 0", "Stop 17", "Stop 123"])
+def test_matches_exact_scan(timetable, location):
+    mapping = compute_map(location, DATE, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=TRIP_BASED)
+    destination = next(stop_id for stop_id, value in mapping.items() if value["name"] == location)
+    expected = latest_departures(timetable, destination, DATE, TIME, EARLIEST_DEPARTURE)
+    assert {stop_id: seconds(value["departure"]) for stop_id, value in mapping.items()} == expected
+
+    # one label per stop never does better
+    dijkstra = compute_map(location, DATE, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=DIJKSTRA)
+    assert all(seconds(dijkstra[stop_id]["departure"]) <= expected[stop_id] for stop_id in mapping)
+
+
+def test_journeys_are_feasible(timetable):
+    mapping = compute_map("Stop 0", DATE, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=TRIP_BASED)
+    for stop_id, value in mapping.items():
+        if value["pred"] is None:
+            continue
+        assert seconds(value["departure"]) <= seconds(value["pred_arrival"])
+        pred = mapping[value["pred"]]
+        if value["trip_id"] != TRANSFER and pred["trip_id"] not in (TRANSFER, value["trip_id"]):
+            assert seconds(value["pred_arrival"]) + SECONDS_TO_CHANGE <= seconds(pred["departure"])
+
+
+def test_targets_are_final(timetable):
+    full = compute_map("Stop 0", DATE, TIME, EARLIEST_DEPARTURE, timetable=timetable, engine=TRIP_BASED)
+    targets = [stop_id for stop_id, value in full.items() if value["departure"] is not None][:5]
+    bounded = compute_map("Stop 0", DATE, TIME, EARLIEST_DEPARTURE, targets=targets, timetable=timetable, engine=TRIP_BASED)
+    for stop_id in targets:
+        assert bounded[stop_id]["departure"] == full[stop_id]["departure"]
+
+
+class OvernightTimetable(DatabaseTimetable):
+    """Answers the edge queries of DatabaseTimetable from a list of daily edges.
+    Trip X runs every day, D to E at 24:10 (00:10 of the next day) and A to B at 23:00."""
+
+    EDGES = [("A", "B", 23 * 3600, 23 * 3600 + 30 * 60, "X"), ("D", "E", DAY + 10 * 60, DAY + 20 * 60, "X")]
+
+    def get_locations(self):
+        return [(stop_id, stop_id, 47.0, 8.0) for stop_id in "ABDE"]
+
+    def get_transfers(self):
+        return []
+
+    def _query_edges(self, date, start_time, end_time):
+        return [edge for edge in self.EDGES if start_time <= edge[2] <= end_time]
+
+
+@pytest.mark.parametrize("engine", [TRIP_BASED, DIJKSTRA])
+def test_runs_of_the_previous_day_are_other_trips(engine):
+    timetable = OvernightTimetable()
+    connections = timetable.get_connections(DATE, 0, 23 * 3600 + 59 * 60)
+    assert len(set(connections["trip"].tolist())) == 2
+    assert connections["trip_ids"][connections["trip"]].tolist() == ["X", "X"]
+
+    mapping = compute_map("B", DATE, 23 * 3600 + 59 * 60, 0, timetable=timetable, engine=engine)
+    assert mapping["A"]["departure"] == datetime.time(23, 0)
+    # yesterday's run at 00:10 does not continue into today's run to B
+    assert mapping["D"]["departure"] is None